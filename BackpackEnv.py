@@ -3,7 +3,7 @@ import numpy as np
 from gymnasium import spaces
 from typing import List, Dict, Tuple, Optional
 
-from engine import Item, CalculationEngine, GridType
+from engine import CalculationEngine, GridType, Layout, Placement, layout_occupancy, placement_fits
 
 class BackpackEnv(gym.Env):
     """
@@ -12,7 +12,7 @@ class BackpackEnv(gym.Env):
     the agent to preserve future options.
     """
 
-    def __init__(self, items: List[Item], backpack_cols: int, backpack_rows: int):
+    def __init__(self, items: List[Placement], backpack_cols: int, backpack_rows: int):
         super(BackpackEnv, self).__init__()
 
         self.backpack_cols = backpack_cols
@@ -29,9 +29,15 @@ class BackpackEnv(gym.Env):
             dtype=np.float32
         )
 
-        self.items_to_place: List[Item] = []
+        self.items_to_place: List[Placement] = []
         self.current_item_index = 0
-        self.placed_items: Dict[Tuple[int, int], Item] = {}
+        self.placed_items: Dict[Tuple[int, int], Placement] = Layout(backpack_cols, backpack_rows)
+        self.scoring = self.engine.start_session(None, backpack_cols, backpack_rows)
+        # 每个形状在所有 (x, y) 锚点上的本体位掩码，用于一次算出整块动作掩码；63 格的背包放得进 uint64
+        self._mask_dtype = np.uint64 if backpack_cols * backpack_rows <= 64 else object
+        self._anchor_tables: Dict[object, Tuple[np.ndarray, np.ndarray]] = {}
+        # 本步的动作掩码缓存：(物品序号, 占用位棋盘) -> 掩码；布局一变就清空
+        self._mask_cache: Dict[Tuple[int, int], np.ndarray] = {}
 
     def _action_to_coords(self, action: int) -> Tuple[int, int, int]:
         rot_size = self.backpack_rows * self.backpack_cols
@@ -42,44 +48,43 @@ class BackpackEnv(gym.Env):
 
     def reset(self, seed: Optional[int] = None, options: Optional[dict] = None) -> Tuple[np.ndarray, dict]:
         super().reset(seed=seed)
-        self.items_to_place = [item.clone() for item in self.all_items]
-        np.random.shuffle(self.items_to_place)
+        self.items_to_place = list(self.all_items)
+        self.np_random.shuffle(self.items_to_place)  # seeded by reset(seed=...)
         self.current_item_index = 0
-        self.placed_items = {}
+        self.placed_items = Layout(self.backpack_cols, self.backpack_rows)
+        self.scoring = self.engine.start_session(None, self.backpack_cols, self.backpack_rows)
+        self._mask_cache.clear()
         observation = self._get_obs()
         info = {"action_mask": self.action_masks()}
         return observation, info
 
     def step(self, action: int) -> Tuple[np.ndarray, float, bool, bool, dict]:
-        score_before, _ = self._calculate_score(self.placed_items)
+        # The scoring session already holds the evaluated layout, so only the new item is scored
+        score_before = self.scoring.total_score
         
         # --- Possibility Reduction: Calculate options for the *next* item ---
         valid_moves_before = 0
         if self.current_item_index + 1 < len(self.items_to_place):
-            next_item = self.items_to_place[self.current_item_index + 1]
-            valid_moves_before = self._count_valid_placements(next_item)
+            valid_moves_before = self._count_valid_placements(self.current_item_index + 1)
 
         # Place the current item
         x, y, rotation_idx = self._action_to_coords(action)
-        current_item = self.items_to_place[self.current_item_index].clone()
-        for _ in range(rotation_idx):
-            current_item.rotate()
-        current_item.gx, current_item.gy = x, y
+        current_item = self.items_to_place[self.current_item_index].rotated(rotation_idx).at(x, y)
         offset_c, offset_r = current_item.get_body_offset()
         key = (x + offset_c, y + offset_r)
         self.placed_items[key] = current_item
         self.current_item_index += 1
 
         # Calculate Synergy Delta reward
-        score_after, _ = self._calculate_score(self.placed_items)
+        score_after = self.scoring.add(key, current_item)
         synergy_delta = (score_after - score_before) - current_item.base_score
         reward = synergy_delta
 
         # --- Possibility Reduction: Calculate penalty ---
         valid_moves_after = 0
         if self.current_item_index < len(self.items_to_place):
-            next_item = self.items_to_place[self.current_item_index]
-            valid_moves_after = self._count_valid_placements(next_item)
+            # 与下一步的 info["action_mask"] 是同一个掩码，只算一次
+            valid_moves_after = self._count_valid_placements(self.current_item_index)
 
             if valid_moves_before > 0:
                 if valid_moves_after == 0:
@@ -105,29 +110,55 @@ class BackpackEnv(gym.Env):
         if self.current_item_index >= len(self.items_to_place):
             return np.zeros(self.num_actions, dtype=bool)
 
-        mask = np.zeros(self.num_actions, dtype=bool)
-        current_item = self.items_to_place[self.current_item_index]
-        return self._calculate_mask_for_item(current_item)
-
-    def _count_valid_placements(self, item: Item) -> int:
-        """Counts the total number of valid placements for a given item."""
-        mask = self._calculate_mask_for_item(item)
-        return np.sum(mask)
+        return self._mask_for_index(self.current_item_index)
+
+    def _mask_for_index(self, index: int) -> np.ndarray:
+        """
+        Action mask of items_to_place[index] on the current layout, computed once per
+        (item index, occupancy) and shared by the counts and info["action_mask"];
+        treat it as read-only.
+        """
+        occupancy = layout_occupancy(self.placed_items, self.backpack_cols, self.backpack_rows)
+        key = (index, occupancy)
+        mask = self._mask_cache.get(key)
+        if mask is None:
+            if any(cached_occupancy != occupancy for _, cached_occupancy in self._mask_cache):
+                self._mask_cache.clear()
+            mask = self._mask_cache[key] = self._calculate_mask_for_item(self.items_to_place[index])
+        return mask
 
-    def _calculate_mask_for_item(self, item: Item) -> np.ndarray:
-        """Helper function to generate an action mask for a specific item."""
-        mask = np.zeros(self.num_actions, dtype=bool)
+    def _count_valid_placements(self, index: int) -> int:
+        """Counts the total number of valid placements for items_to_place[index]."""
+        return int(np.count_nonzero(self._mask_for_index(index)))
+
+    def _calculate_mask_for_item(self, item: Placement) -> np.ndarray:
+        """
+        Helper function to generate an action mask for a specific item: one array
+        operation per distinct rotation, testing every (x, y) anchor at once.
+        """
+        occupancy = layout_occupancy(self.placed_items, self.backpack_cols, self.backpack_rows)
+        occupancy = self._mask_dtype(occupancy) if self._mask_dtype is not object else occupancy
+        blocks, block_of_shape = [], {}
         for rot in range(4):
-            item_rotated = item.clone()
-            for _ in range(rot):
-                item_rotated.rotate()
-            
-            for y in range(self.backpack_rows):
-                for x in range(self.backpack_cols):
-                    if self._is_placement_valid(item_rotated, x, y):
-                        action_index = (rot * self.backpack_rows * self.backpack_cols) + (y * self.backpack_cols) + x
-                        mask[action_index] = True
-        return mask
+            item_rotated = item.rotated(rot)
+            shape_rot = item_rotated.variant.rotation
+            if shape_rot not in block_of_shape:
+                # Symmetric shapes: identical rotations share one block
+                bodies, inside = self._anchor_table(item_rotated)
+                block_of_shape[shape_rot] = inside & ((bodies & occupancy) == 0)
+            blocks.append(block_of_shape[shape_rot])
+        return np.concatenate(blocks)
+
+    def _anchor_table(self, item: Placement) -> Tuple[np.ndarray, np.ndarray]:
+        """Body bitboards and inside flags of one rotation at every action anchor (row-major y, x)."""
+        shape_masks = item.get_masks(self.backpack_cols, self.backpack_rows)
+        table = self._anchor_tables.get(shape_masks)
+        if table is None:
+            anchored = [shape_masks.at(x, y) for y in range(self.backpack_rows) for x in range(self.backpack_cols)]
+            bodies = np.array([masks.body for masks in anchored], dtype=self._mask_dtype)
+            inside = np.array([masks.inside for masks in anchored], dtype=bool)
+            table = self._anchor_tables[shape_masks] = (bodies, inside)
+        return table
 
     def _get_obs(self) -> np.ndarray:
         occupancy_grid = np.zeros((self.backpack_rows, self.backpack_cols), dtype=np.float32)
@@ -154,27 +185,8 @@ class BackpackEnv(gym.Env):
                             item_grid[start_row + r][start_col + c] = 1.0
         return np.stack([occupancy_grid, item_grid, hotspot_grid])
 
-    def _is_placement_valid(self, item_to_place: Item, gx: int, gy: int) -> bool:
-        for r, row in enumerate(item_to_place.shape_matrix):
-            for c, cell in enumerate(row):
-                if cell == GridType.OCCUPIED:
-                    ax, ay = gx + c, gy + r
-                    if not (0 <= ax < self.backpack_cols and 0 <= ay < self.backpack_rows):
-                        return False
-                    for p_item in self.placed_items.values():
-                        for pr, p_row in enumerate(p_item.shape_matrix):
-                            for pc, p_cell in enumerate(p_row):
-                                if p_cell == GridType.OCCUPIED and (p_item.gx + pc, p_item.gy + pr) == (ax, ay):
-                                    return False
-        return True
-
-    def _calculate_score(self, layout: Dict) -> Tuple[float, List]:
-        if not layout: return 0.0, []
-        calc_layout = {key: item.clone() for key, item in layout.items()}
-        self.engine.run(calc_layout, self.backpack_cols, self.backpack_rows)
-        item_scores = sum(item.final_score for item in calc_layout.values())
-        total_score = item_scores + self.engine.neutral_pool_total
-        return total_score, self.engine.interaction_map
+    def _is_placement_valid(self, item_to_place: Placement, gx: int, gy: int) -> bool:
+        return placement_fits(item_to_place, gx, gy, self.placed_items, self.backpack_cols, self.backpack_rows)
 
     def render(self, mode='human'):
         grid = [["." for _ in range(self.backpack_cols)] for _ in range(self.backpack_rows)]
@@ -0,0 +1,224 @@
+"""
+Solver benchmark: runs every solver on a fixed corpus of item sets with fixed seeds
+and writes best score, time-to-target, evaluations/sec and peak memory as JSON.
+
+    python benchmark.py --runs 5 --output bench_2025-01-01.json
+    python benchmark.py --solvers Genetic,GeneticV2 --param generations=60 --time-budget 20
+    python benchmark.py --corpus bench_2025-01-01.json   # reuse the item sets of an earlier report
+
+The default items file is items_old.json, the item database that carries base
+scores and effects; a file without any scoring data is refused, since every
+solver would score 0 on it. Every run gets a default wall-clock budget of
+DEFAULT_TIME_BUDGET_S (--time-budget 0 removes it), so the exact solvers
+cannot run unbounded on the large set.
+
+The corpus is drawn from the items file with its own seed (--corpus-seed), so the
+same items file always gives the same item sets; it is stored in the report.
+Peak memory comes from tracemalloc, which slows the engine down; pass --no-memory
+for clean timings.
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from engine import ItemDef
+from solve_cli import BACKPACK_COLS, BACKPACK_ROWS, _parse_param, items_from_names, load_item_defs
+from solvers import discover_solvers
+from solvers.base_observers import SolverObserver
+
+# name -> (number of items, only star items)
+CORPUS_SPEC = {"small": (5, False), "medium": (10, False), "large": (22, False), "star_heavy": (10, True)}
+# 物品身体格子总数不超过背包的这个比例，保证每组物品都放得下
+MAX_FILL = 0.8
+TARGET_FRACTION = 0.95
+BENCHMARK_ITEMS_FILE = 'items_old.json'
+DEFAULT_TIME_BUDGET_S = 60.0
+
+
+def build_corpus(item_defs: Dict[str, ItemDef], corpus_seed: int = 0) -> Dict[str, List[str]]:
+    """
+    Draws the benchmark item sets; only depends on the items file and corpus_seed.
+    A set holds at most the CORPUS_SPEC size: items that would push it past MAX_FILL
+    of the backpack are skipped, so with large items a set can come out smaller
+    (see the sizes stored in the report).
+    """
+    rng = random.Random(corpus_seed)
+    defs = sorted({item_def.name: item_def for item_def in item_defs.values()}.values(), key=lambda d: d.name)
+    capacity = int(BACKPACK_COLS * BACKPACK_ROWS * MAX_FILL)
+    corpus = {}
+    for set_name, (size, star_only) in CORPUS_SPEC.items():
+        pool = [d for d in defs if d.rotations[0].star_cells] if star_only else list(defs)
+        rng.shuffle(pool)
+        chosen, cells = [], 0
+        for item_def in pool:
+            body = len(item_def.rotations[0].body_cells)
+            if body == 0 or cells + body > capacity: continue
+            chosen.append(item_def.name)
+            cells += body
+            if len(chosen) == size: break
+        corpus[set_name] = chosen
+    return corpus
+
+
+class ImprovementRecorder(SolverObserver):
+    """Keeps the (seconds, score) trace of every improvement for time-to-target."""
+    def __init__(self):
+        self.trace: List[Tuple[float, float]] = []
+
+    def on_improvement(self, solver, progress):
+        self.trace.append((progress.elapsed_s, progress.best_score))
+
+
+def run_once(SolverClass, items, params: Dict, seed: int, measure_memory: bool) -> Dict:
+    solver = SolverClass(items, BACKPACK_COLS, BACKPACK_ROWS, seed=seed, **params)
+    recorder = solver.add_observer(ImprovementRecorder())
+    if measure_memory:
+        tracemalloc.start()
+    start_time = time.perf_counter()
+    try:
+        _, best_score = solver.solve()
+        elapsed = time.perf_counter() - start_time
+        peak = tracemalloc.get_traced_memory()[1] if measure_memory else None
+    finally:
+        if measure_memory:
+            tracemalloc.stop()
+    stats = solver.last_stats
+    return {"seed": seed, "best_score": best_score, "elapsed_s": elapsed,
+            "evaluations": stats.evaluations if stats else None,
+            "evaluations_per_s": stats.evaluations_per_s if stats else None,
+            "steps": stats.steps if stats else None, "stop_reason": stats.stop_reason if stats else None,
+            "peak_mem_mb": round(peak / 2 ** 20, 3) if peak is not None else None,
+            "bound": solver.bound, "status": getattr(solver, "status", None), "trace": recorder.trace}
+
+
+def has_scoring_data(item_defs: Dict[str, ItemDef]) -> bool:
+    """False when no item has a base score or an effect (every layout would score 0)."""
+    return any(d.base_score or d.star_effects or d.passive_effects for d in item_defs.values())
+
+
+def time_to_target(trace: List[Tuple[float, float]], target: float) -> Optional[float]:
+    return next((seconds for seconds, score in trace if score >= target), None)
+
+
+def _mean(values: List) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    return statistics.mean(values) if values else None
+
+
+def summarize(results: List[Dict], target_fraction: float) -> Dict:
+    """
+    The target of an item set is target_fraction of the best score any solver reached
+    on it, so time-to-target compares solvers on the same bar. When an exact solver
+    proved an upper bound for a set (e.g. Exact), every solver's gap to it is reported.
+    """
+    best_per_set: Dict[str, float] = {}
+    bound_per_set: Dict[str, float] = {}
+    for run in results:
+        best_per_set[run["item_set"]] = max(best_per_set.get(run["item_set"], float('-inf')), run["best_score"])
+        if run.get("bound") is not None:
+            bound_per_set[run["item_set"]] = min(bound_per_set.get(run["item_set"], float('inf')), run["bound"])
+    summary: Dict[str, Dict[str, Dict]] = {}
+    for run in results:
+        target = best_per_set[run["item_set"]] * target_fraction
+        run["target"] = target
+        run["time_to_target_s"] = time_to_target(run["trace"], target)
+    for solver_name in dict.fromkeys(run["solver"] for run in results):
+        summary[solver_name] = {}
+        for set_name in best_per_set:
+            runs = [r for r in results if r["solver"] == solver_name and r["item_set"] == set_name]
+            if not runs: continue
+            reached = [r["time_to_target_s"] for r in runs if r["time_to_target_s"] is not None]
+            summary[solver_name][set_name] = {
+                "runs": len(runs), "best_score": max(r["best_score"] for r in runs),
+                "mean_score": _mean([r["best_score"] for r in runs]),
+                "stdev_score": statistics.stdev([r["best_score"] for r in runs]) if len(runs) > 1 else 0.0,
+                "mean_elapsed_s": _mean([r["elapsed_s"] for r in runs]),
+                "target_hit_rate": len(reached) / len(runs), "mean_time_to_target_s": _mean(reached),
+                "mean_evaluations_per_s": _mean([r["evaluations_per_s"] for r in runs]),
+                "peak_mem_mb": max((r["peak_mem_mb"] for r in runs if r["peak_mem_mb"] is not None), default=None),
+            }
+            bound = bound_per_set.get(set_name)
+            if bound is not None:
+                best = summary[solver_name][set_name]["best_score"]
+                summary[solver_name][set_name]["gap_to_bound"] = (bound - best) / abs(bound) if bound else 0.0
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the layout solvers on a fixed corpus of item sets.")
+    parser.add_argument('--items-file', default=BENCHMARK_ITEMS_FILE)
+    parser.add_argument('--corpus', help="Take the item sets from an earlier benchmark report instead of drawing them")
+    parser.add_argument('--corpus-seed', type=int, default=0)
+    parser.add_argument('--sets', help="Comma-separated item sets to run (default: all)")
+    parser.add_argument('--solvers', help="Comma-separated solver names (default: all discovered)")
+    parser.add_argument('--runs', type=int, default=3, help="Runs per solver and item set; run i uses seed --seed + i")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--param', action='append', type=_parse_param, default=[], metavar='KEY=VALUE',
+                        help="Constructor argument passed to every solver (repeatable)")
+    parser.add_argument('--time-budget', type=float, default=DEFAULT_TIME_BUDGET_S,
+                        help=f"Wall-clock budget per run in seconds (default: {DEFAULT_TIME_BUDGET_S:g}, 0 for none)")
+    parser.add_argument('--target-fraction', type=float, default=TARGET_FRACTION)
+    parser.add_argument('--no-memory', action='store_true', help="Skip tracemalloc (faster, no peak memory)")
+    parser.add_argument('--output', help="Report file (default: benchmark_<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    item_defs = load_item_defs(args.items_file)
+    if not has_scoring_data(item_defs):
+        parser.error(f"'{args.items_file}' has no base scores or effects; every solver would score 0")
+    if args.corpus:
+        with open(args.corpus, 'r', encoding='utf-8') as f:
+            corpus = json.load(f)["corpus"]
+    else:
+        corpus = build_corpus(item_defs, args.corpus_seed)
+    if args.sets:
+        corpus = {name: corpus[name] for name in args.sets.split(',')}
+    for set_name, names in corpus.items():
+        if set_name in CORPUS_SPEC and len(names) < CORPUS_SPEC[set_name][0]:
+            print(f"Note: item set '{set_name}' has {len(names)} of {CORPUS_SPEC[set_name][0]} items"
+                  f" (the rest would not fit in {MAX_FILL:.0%} of the backpack)")
+
+    available = discover_solvers()
+    solver_names = args.solvers.split(',') if args.solvers else list(available)
+    unknown = [name for name in solver_names if name not in available]
+    if unknown:
+        parser.error(f"Unknown solver(s) {', '.join(unknown)} (available: {', '.join(available)})")
+    params = dict(args.param)
+    if args.time_budget:
+        params['time_budget_s'] = args.time_budget
+
+    results = []
+    for set_name, names in corpus.items():
+        items = items_from_names(item_defs, names)
+        for solver_name in solver_names:
+            for run_index in range(args.runs):
+                run = run_once(available[solver_name], items, params, args.seed + run_index, not args.no_memory)
+                run.update(solver=solver_name, item_set=set_name)
+                results.append(run)
+                print(f"[{set_name}] {solver_name} seed {run['seed']}: score {run['best_score']:.2f}"
+                      f" in {run['elapsed_s']:.2f}s ({run['evaluations_per_s'] or 0:.0f} evals/s)")
+
+    report = {
+        "meta": {"timestamp": datetime.now().isoformat(timespec='seconds'), "python": sys.version.split()[0],
+                 "platform": platform.platform(), "items_file": args.items_file, "runs": args.runs,
+                 "seed": args.seed, "corpus_seed": args.corpus_seed, "params": params,
+                 "target_fraction": args.target_fraction, "memory_traced": not args.no_memory},
+        "corpus": corpus,
+        "summary": summarize(results, args.target_fraction),
+        "results": results,
+    }
+    output = args.output or f"benchmark_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Benchmark report written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+from typing import Dict, List, Tuple
+
+from definitions import GridType
+
+# 背包格子 (x, y) 对应整数位 y * cols + x；9x7 的背包只需要 63 位。
+STAR_TYPES = (GridType.STAR_A, GridType.STAR_B, GridType.STAR_C)
+
+
+def popcount(mask: int) -> int:
+    return bin(mask).count("1")
+
+
+def iter_bits(mask: int):
+    """Yields the indices of the set bits of mask in ascending (row-major) order."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class AnchoredMasks:
+    """Bitboards of one shape anchored at a fixed (gx, gy). Cells outside the backpack are clipped."""
+    __slots__ = ("inside", "body", "body_indices", "stars", "star_union")
+
+    def __init__(self, inside: bool, body: int, body_indices: Tuple[int, ...], stars: Dict[GridType, int]):
+        self.inside = inside  # 本体是否完全在背包内
+        self.body = body
+        self.body_indices = body_indices
+        self.stars = stars
+        self.star_union = stars[GridType.STAR_A] | stars[GridType.STAR_B] | stars[GridType.STAR_C]
+
+
+class ShapeMasks:
+    """
+    Bitboard tables of a single shape matrix on a backpack of a given size.
+    Masks for each anchor (gx, gy) are built on first use and then reused.
+    """
+    __slots__ = ("cols", "rows", "body_cells", "star_cells", "_anchored")
+
+    def __init__(self, shape_matrix: List[List[GridType]], cols: int, rows: int):
+        self.cols, self.rows = cols, rows
+        self.body_cells = [(c, r) for r, row in enumerate(shape_matrix) for c, cell in enumerate(row)
+                           if cell == GridType.OCCUPIED]
+        self.star_cells = [(c, r, cell) for r, row in enumerate(shape_matrix) for c, cell in enumerate(row)
+                           if cell in STAR_TYPES]
+        self._anchored: Dict[Tuple[int, int], AnchoredMasks] = {}
+
+    def at(self, gx: int, gy: int) -> AnchoredMasks:
+        masks = self._anchored.get((gx, gy))
+        if masks is None:
+            masks = self._anchored[(gx, gy)] = self._build(gx, gy)
+        return masks
+
+    def _build(self, gx: int, gy: int) -> AnchoredMasks:
+        cols, rows = self.cols, self.rows
+        inside, body, indices = True, 0, []
+        for c, r in self.body_cells:
+            x, y = gx + c, gy + r
+            if 0 <= x < cols and 0 <= y < rows:
+                index = y * cols + x
+                body |= 1 << index
+                indices.append(index)
+            else:
+                inside = False
+        stars = {star_type: 0 for star_type in STAR_TYPES}
+        for c, r, star_type in self.star_cells:
+            x, y = gx + c, gy + r
+            if 0 <= x < cols and 0 <= y < rows:
+                stars[star_type] |= 1 << (y * cols + x)
+        return AnchoredMasks(inside, body, tuple(sorted(indices)), stars)
+
+
+_SHAPE_MASKS_CACHE: Dict[tuple, ShapeMasks] = {}
+
+
+def get_shape_masks(shape_matrix: List[List[GridType]], cols: int, rows: int) -> ShapeMasks:
+    """Returns the shared ShapeMasks for a shape; identical shapes (and rotations) reuse one table."""
+    key = (tuple(tuple(row) for row in shape_matrix), cols, rows)
+    masks = _SHAPE_MASKS_CACHE.get(key)
+    if masks is None:
+        masks = _SHAPE_MASKS_CACHE[key] = ShapeMasks(shape_matrix, cols, rows)
+    return masks
@@ -1,37 +1,235 @@
 import pygame
-from typing import List, Optional, Dict, Tuple, Any
+from typing import List, Optional, Dict, Tuple, Any, Iterable, NamedTuple, Sequence
 import math
-import copy
 import os  # <-- 新增
+import time
+from collections import defaultdict
 from definitions import GridType, Rarity, ItemClass, Element, ItemType
+from bitboard import STAR_TYPES, ShapeMasks, get_shape_masks, iter_bits
 
 # --- 新增：定义图片文件夹 ---
 WIKI_IMAGES_FOLDER = "wiki_images"
 
 
+def rotate_shape(shape_matrix) -> Tuple[Tuple[GridType, ...], ...]:
+    """Rotates a shape matrix 90 degrees clockwise."""
+    return tuple(tuple(row)[::-1] for row in zip(*shape_matrix))
+
+
+class RotationVariant:
+    """
+    Shape data of one distinct rotation of an item, computed once when the
+    ItemDef is built. Rotations that produce the same shape share one variant.
+    """
+    __slots__ = ("rotation", "shape", "grid_width", "grid_height", "body_cells", "star_cells",
+                 "body_bounds", "body_offset", "_masks")
+
+    def __init__(self, rotation: int, shape: Tuple[Tuple[GridType, ...], ...]):
+        self.rotation = rotation  # 产生该形状的最小旋转次数
+        self.shape = shape
+        self.grid_height = len(shape)
+        self.grid_width = len(shape[0]) if shape else 0
+        self.body_cells = tuple((c, r) for r, row in enumerate(shape) for c, cell in enumerate(row)
+                                if cell == GridType.OCCUPIED)
+        self.star_cells = tuple((c, r, cell) for r, row in enumerate(shape) for c, cell in enumerate(row)
+                                if cell in STAR_TYPES)
+        self.body_bounds = None
+        if self.body_cells:
+            self.body_bounds = (min(r for _, r in self.body_cells), min(c for c, _ in self.body_cells),
+                                max(r for _, r in self.body_cells), max(c for c, _ in self.body_cells))
+        # body_cells 按行优先排列，第一个就是布局键使用的锚点格
+        self.body_offset = self.body_cells[0] if self.body_cells else (0, 0)
+        self._masks: Dict[Tuple[int, int], ShapeMasks] = {}
+
+    def get_masks(self, backpack_cols: int, backpack_rows: int) -> ShapeMasks:
+        """Bitboard tables of this rotation for a backpack of the given size."""
+        masks = self._masks.get((backpack_cols, backpack_rows))
+        if masks is None:
+            masks = self._masks[(backpack_cols, backpack_rows)] = get_shape_masks(self.shape, backpack_cols,
+                                                                                  backpack_rows)
+        return masks
+
+
+class ItemDef:
+    """
+    Immutable definition data of one item (name, rarity, shape, effects).
+    A single ItemDef is shared by reference by every sprite and placement of
+    that item. Its four rotations are precomputed as RotationVariants
+    (`rotations[r]`); `distinct_rotations` lists one rotation per distinct shape,
+    so symmetric items (1x1, 2x2, ...) are only tried once per distinct shape.
+    """
+    __slots__ = ("name", "rarity", "item_class", "elements", "types", "shape_matrix", "base_score", "star_effects",
+                 "has_cooldown", "is_start_of_battle", "passive_effects", "image_file",
+                 "rotations", "distinct_rotations", "_plan")
+
+    def __init__(self, name: str, rarity: Rarity, item_class: ItemClass, elements: List[Element],
+                 types: List[ItemType], shape_matrix: List[List[GridType]], base_score: int, star_effects: dict,
+                 has_cooldown: bool = False, is_start_of_battle: bool = False,
+                 passive_effects: List[dict] = None, image_file: Optional[str] = None):
+        shape = tuple(tuple(row) for row in shape_matrix)
+        rotations: List[RotationVariant] = []
+        for rotation in range(4):
+            variant = next((v for v in rotations if v.shape == shape), None)
+            rotations.append(variant or RotationVariant(rotation, shape))
+            shape = rotate_shape(shape)
+        fields = dict(
+            name=name, rarity=rarity, item_class=item_class, elements=tuple(elements), types=tuple(types),
+            shape_matrix=rotations[0].shape, base_score=base_score, star_effects=star_effects,
+            has_cooldown=has_cooldown, is_start_of_battle=is_start_of_battle,
+            passive_effects=passive_effects if passive_effects is not None else [], image_file=image_file,
+            rotations=tuple(rotations), distinct_rotations=tuple(sorted({v.rotation for v in rotations})),
+            _plan=None,
+        )
+        for field, value in fields.items():
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"ItemDef is immutable (tried to set '{name}')")
+
+    def __reduce__(self):
+        return ItemDef, (self.name, self.rarity, self.item_class, self.elements, self.types, self.shape_matrix,
+                         self.base_score, self.star_effects, self.has_cooldown, self.is_start_of_battle,
+                         self.passive_effects, self.image_file)
+
+    def __repr__(self):
+        return f"ItemDef({self.name!r})"
+
+    def shape(self, rotation: int) -> Tuple[Tuple[GridType, ...], ...]:
+        """Shape matrix after `rotation` clockwise quarter turns."""
+        return self.rotations[rotation % 4].shape
+
+    def body_bounds(self, rotation: int) -> Optional[Tuple[int, int, int, int]]:
+        """(min_r, min_c, max_r, max_c) of the body cells, or None if the shape has no body."""
+        return self.rotations[rotation % 4].body_bounds
+
+    def body_offset(self, rotation: int) -> Tuple[int, int]:
+        """(c, r) of the first body cell in row-major order; layouts are keyed by this cell."""
+        return self.rotations[rotation % 4].body_offset
+
+    def get_masks(self, rotation: int, backpack_cols: int, backpack_rows: int) -> ShapeMasks:
+        """Bitboard tables of one rotation for a backpack of the given size."""
+        return self.rotations[rotation % 4].get_masks(backpack_cols, backpack_rows)
+
+    def get_plan(self) -> "ItemPlan":
+        """Returns the compiled effect plan, compiling it on first use."""
+        if self._plan is None:
+            object.__setattr__(self, "_plan", compile_item_plan(self))
+        return self._plan
+
+
+def _definition_field(name: str) -> property:
+    return property(lambda self: getattr(self.item_def, name), doc=f"ItemDef.{name} of the shared definition.")
+
+
+class Placement(NamedTuple):
+    """
+    An item definition placed in the backpack: (item_def, rotation, gx, gy).
+    Placements are small immutable tuples, so layouts of them are cheap to copy,
+    hash and pickle; rotated() / at() return new placements.
+    """
+    item_def: ItemDef
+    rotation: int = 0
+    gx: int = -1
+    gy: int = -1
+
+    name = _definition_field("name")
+    rarity = _definition_field("rarity")
+    item_class = _definition_field("item_class")
+    elements = _definition_field("elements")
+    types = _definition_field("types")
+    base_score = _definition_field("base_score")
+    star_effects = _definition_field("star_effects")
+    has_cooldown = _definition_field("has_cooldown")
+    is_start_of_battle = _definition_field("is_start_of_battle")
+    passive_effects = _definition_field("passive_effects")
+
+    @property
+    def variant(self) -> RotationVariant:
+        return self.item_def.rotations[self.rotation]
+
+    @property
+    def shape_matrix(self) -> Tuple[Tuple[GridType, ...], ...]:
+        return self.item_def.rotations[self.rotation].shape
+
+    @property
+    def grid_width(self) -> int:
+        return self.item_def.rotations[self.rotation].grid_width
+
+    @property
+    def grid_height(self) -> int:
+        return self.item_def.rotations[self.rotation].grid_height
+
+    def rotated(self, turns: int = 1) -> "Placement":
+        return self._replace(rotation=(self.rotation + turns) % 4)
+
+    def variants(self) -> List["Placement"]:
+        """
+        This placement turned one, two, three and four quarter turns clockwise
+        (in that order), skipping rotations whose shape was already produced.
+        """
+        rotations, seen, result = self.item_def.rotations, set(), []
+        for turns in range(1, 5):
+            rotation = (self.rotation + turns) % 4
+            if rotations[rotation].rotation in seen: continue
+            seen.add(rotations[rotation].rotation)
+            result.append(self._replace(rotation=rotation))
+        return result
+
+    def at(self, gx: int, gy: int) -> "Placement":
+        return self._replace(gx=gx, gy=gy)
+
+    def get_plan(self) -> "ItemPlan":
+        return self.item_def.get_plan()
+
+    def get_masks(self, backpack_cols: int, backpack_rows: int) -> ShapeMasks:
+        return self.item_def.rotations[self.rotation].get_masks(backpack_cols, backpack_rows)
+
+    def get_body_bounds(self) -> Optional[Tuple[int, int, int, int]]:
+        return self.item_def.rotations[self.rotation].body_bounds
+
+    def get_body_offset(self) -> Tuple[int, int]:
+        return self.item_def.rotations[self.rotation].body_offset
+
+
+def as_placement(item) -> Placement:
+    """Returns the Placement of a sprite Item (placements are returned unchanged)."""
+    return item if isinstance(item, Placement) else item.placement
+
+
 class Item(pygame.sprite.Sprite):
+    """
+    Visual wrapper around a shared ItemDef, used by the pygame UI (main.py).
+    The sprite only owns its rotation, grid position, image and drag state;
+    solvers, the environment and the engine work with Placement tuples.
+    """
     def __init__(self, x: int, y: int, name: str, rarity: Rarity,
                  item_class: ItemClass, elements: List[Element], types: List[ItemType],
                  shape_matrix: List[List[GridType]], base_score: int, star_effects: dict,
                  has_cooldown: bool = False, is_start_of_battle: bool = False,
                  passive_effects: List[dict] = None, visuals: bool = True,
                  image_file: Optional[str] = None):  # <-- V3 新增 image_file 参数
-        super().__init__()
-        self.name = name
-        self.rarity = rarity
-        self.item_class = item_class
-        self.elements = elements
-        self.types = types
-        self.shape_matrix = shape_matrix
-        self.base_score = base_score
-        self.star_effects = star_effects
-        self.has_cooldown = has_cooldown
-        self.is_start_of_battle = is_start_of_battle
-        self.passive_effects = passive_effects if passive_effects is not None else []
-        self.image_file = image_file  # <-- V3 新增
+        item_def = ItemDef(name, rarity, item_class, elements, types, shape_matrix, base_score, star_effects,
+                           has_cooldown, is_start_of_battle, passive_effects, image_file)
+        self._setup(item_def, x, y, 0, visuals)
+
+    @classmethod
+    def from_def(cls, item_def: ItemDef, x: int = 0, y: int = 0, rotation: int = 0, visuals: bool = True) -> "Item":
+        """Creates a sprite that shares an existing definition."""
+        item = cls.__new__(cls)
+        item._setup(item_def, x, y, rotation, visuals)
+        return item
 
-        self.grid_width = len(shape_matrix[0]) if shape_matrix else 0
-        self.grid_height = len(shape_matrix)
+    @classmethod
+    def from_placement(cls, placement: Placement, visuals: bool = True) -> "Item":
+        """Creates a sprite for a placement, e.g. to show a solver result."""
+        item = cls.from_def(placement.item_def, 0, 0, placement.rotation, visuals)
+        item.gx, item.gy = placement.gx, placement.gy
+        return item
+
+    def _setup(self, item_def: ItemDef, x: int, y: int, rotation: int, visuals: bool):
+        super().__init__()
+        self.item_def = item_def
+        self.rotation = 0
 
         self.body_image = None
         self.rect = None
@@ -67,51 +265,62 @@ class Item(pygame.sprite.Sprite):
         self.gx = -1
         self.gy = -1
 
-        self.final_score = 0
-        self.score_modifiers = []
-        self.activated_stars = {GridType.STAR_A: 0, GridType.STAR_B: 0, GridType.STAR_C: 0}
-        self.occupying_stars = []
-        self.temporary_elements = []
+        for _ in range(rotation % 4):
+            self.rotate()
+        if self.rect:
+            self.rect.topleft = (x, y)
+
+    name = _definition_field("name")
+    rarity = _definition_field("rarity")
+    item_class = _definition_field("item_class")
+    elements = _definition_field("elements")
+    types = _definition_field("types")
+    base_score = _definition_field("base_score")
+    star_effects = _definition_field("star_effects")
+    has_cooldown = _definition_field("has_cooldown")
+    is_start_of_battle = _definition_field("is_start_of_battle")
+    passive_effects = _definition_field("passive_effects")
+    image_file = _definition_field("image_file")
+
+    @property
+    def shape_matrix(self) -> Tuple[Tuple[GridType, ...], ...]:
+        return self.item_def.rotations[self.rotation].shape
+
+    @property
+    def grid_width(self) -> int:
+        return self.item_def.rotations[self.rotation].grid_width
+
+    @property
+    def grid_height(self) -> int:
+        return self.item_def.rotations[self.rotation].grid_height
 
-        self._body_bounds = None
+    @property
+    def placement(self) -> Placement:
+        return Placement(self.item_def, self.rotation, self.gx, self.gy)
 
     def clone(self, visuals: Optional[bool] = None):
         has_visuals = self.body_image is not None
         if visuals is not None:
             has_visuals = visuals
 
-        new_item = Item(
-            x=self.rect.x if self.rect else 0, y=self.rect.y if self.rect else 0,
-            name=self.name, rarity=self.rarity, item_class=self.item_class,
-            elements=list(self.elements), types=list(self.types), shape_matrix=copy.deepcopy(self.shape_matrix),
-            base_score=self.base_score, star_effects=copy.deepcopy(self.star_effects), has_cooldown=self.has_cooldown,
-            is_start_of_battle=self.is_start_of_battle, passive_effects=copy.deepcopy(self.passive_effects),
-            visuals=has_visuals,
-            image_file=self.image_file  # <-- V3 新增：确保 clone 时传递 image_file
-        )
+        new_item = Item.from_def(self.item_def, x=self.rect.x if self.rect else 0, y=self.rect.y if self.rect else 0,
+                                 rotation=self.rotation, visuals=has_visuals)
         new_item.gx, new_item.gy = self.gx, self.gy
         return new_item
 
+    def get_plan(self) -> "ItemPlan":
+        """Returns the compiled effect plan of the shared definition."""
+        return self.item_def.get_plan()
+
+    def get_masks(self, backpack_cols: int, backpack_rows: int) -> ShapeMasks:
+        """Returns the bitboard tables of the current rotation for a backpack of the given size."""
+        return self.item_def.get_masks(self.rotation, backpack_cols, backpack_rows)
+
     def get_body_bounds(self) -> Optional[Tuple[int, int, int, int]]:
-        # ... (此函数保持不变) ...
-        if self._body_bounds: return self._body_bounds
-        min_r, max_r, min_c, max_c = self.grid_height, -1, self.grid_width, -1
-        found_body = False
-        for r, row in enumerate(self.shape_matrix):
-            for c, cell in enumerate(row):
-                if cell == GridType.OCCUPIED:
-                    found_body = True
-                    min_r, max_r, min_c, max_c = min(min_r, r), max(max_r, r), min(min_c, c), max(max_c, c)
-        if found_body: self._body_bounds = (min_r, min_c, max_r, max_c); return self._body_bounds
-        return None
+        return self.item_def.body_bounds(self.rotation)
 
     def get_body_offset(self) -> Tuple[int, int]:
-        # ... (此函数保持不变) ...
-        for r, row in enumerate(self.shape_matrix):
-            for c, cell in enumerate(row):
-                if cell == GridType.OCCUPIED:
-                    return (c, r)
-        return (0, 0)
+        return self.item_def.body_offset(self.rotation)
 
     def create_body_surface(self, grid_size, rarity_colors, font_color):
         # ... (此函数保持不变, 作为备用方案) ...
@@ -167,9 +376,8 @@ class Item(pygame.sprite.Sprite):
         return False
 
     def rotate(self):
-        # ... (此函数保持不变, 旋转只影响 shape_matrix, 图片的旋转在 main.py 中处理) ...
-        self.shape_matrix = [list(row)[::-1] for row in zip(*self.shape_matrix)]
-        self.grid_height, self.grid_width = len(self.shape_matrix), len(self.shape_matrix[0])
+        # 旋转只改变 rotation，形状取自共享的 ItemDef；图片的旋转在这里同步处理
+        self.rotation = (self.rotation + 1) % 4
 
         # --- V3 更新：如果用的是真实图片，我们也需要旋转它 ---
         if self.body_image and self.image_file:  # 只旋转真实图片，不旋转灰色方块
@@ -180,221 +388,661 @@ class Item(pygame.sprite.Sprite):
             self.body_image = self.create_body_surface(GRID_SIZE, RARITY_BORDER_COLORS, FONT_COLOR)
             self.rect = self.body_image.get_rect()
         # ---------------------------------------------
-        self._body_bounds = None
 
 
-# --- CalculationEngine 类 (完全保持不变) ---
-class CalculationEngine:
-    def __init__(self):
-        # ... (此类中的所有代码保持不变) ...
-        self.neutral_pool_modifiers = []
-        self.neutral_pool_total = 0.0
-        self.interaction_map = []
-
-    def _check_condition(self, condition_data: dict, source_item: Item, target_item: Optional[Item],
-                         condition_logic: str = "AND") -> bool:
-        if not condition_data: return True
-        check_results = []
-        if "requires_empty" in condition_data:
-            if condition_data["requires_empty"]: check_results.append(target_item is None)
-        if target_item is not None:
-            if "requires_element" in condition_data:
-                reqs = condition_data["requires_element"]
-                if not isinstance(reqs, list): reqs = [reqs]
-                target_elems = set(target_item.elements + target_item.temporary_elements)
-                check_results.append(any(Element[req.upper()] in target_elems for req in reqs))
-            if "requires_type" in condition_data:
-                reqs = condition_data["requires_type"]
-                if not isinstance(reqs, list): reqs = [reqs]
-                check_results.append(any(ItemType[req.upper()] in target_item.types for req in reqs))
-            if "requires_name" in condition_data:
-                reqs = condition_data["requires_name"]
-                if not isinstance(reqs, list): reqs = [reqs]
-                check_results.append(target_item.name in reqs)
-            if "must_be_different" in condition_data:
-                if condition_data["must_be_different"]: check_results.append(source_item.name != target_item.name)
-            if "requires_cooldown" in condition_data:
-                if condition_data["requires_cooldown"]: check_results.append(
-                    getattr(target_item, 'has_cooldown', False))
-            if "requires_start_of_battle" in condition_data:
-                if condition_data["requires_start_of_battle"]: check_results.append(
-                    getattr(target_item, 'is_start_of_battle', False))
+# --- 位棋盘布局：放置字典 + 占用位掩码 ---
+class Layout(dict):
+    """
+    A dict of placed items (keyed like every other layout in the project) that
+    also carries `occupancy`, the bitboard of all occupied backpack cells.
+    Values are Placements or Item sprites; sprites must not be moved or rotated
+    while they are stored in a Layout.
+    """
+
+    def __init__(self, backpack_cols: int, backpack_rows: int, items: Optional[Dict] = None):
+        super().__init__()
+        self.backpack_cols = backpack_cols
+        self.backpack_rows = backpack_rows
+        self.occupancy = 0
+        if items:
+            self.update(items)
+
+    def _body_mask(self, item: Item) -> int:
+        return item.get_masks(self.backpack_cols, self.backpack_rows).at(item.gx, item.gy).body
+
+    def _recompute(self):
+        self.occupancy = 0
+        for item in self.values():
+            self.occupancy |= self._body_mask(item)
+
+    def __setitem__(self, key, item: Item):
+        replacing = key in self
+        super().__setitem__(key, item)
+        if replacing:
+            self._recompute()
         else:
-            for key in condition_data:
-                if key != "requires_empty": check_results.append(False)
-        if not check_results: return True
-        return any(check_results) if condition_logic == "OR" else all(check_results)
+            self.occupancy |= self._body_mask(item)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._recompute()
+
+    def pop(self, key, *default):
+        item = super().pop(key, *default)
+        self._recompute()
+        return item
+
+    def popitem(self):
+        pair = super().popitem()
+        self._recompute()
+        return pair
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, other=(), **kwargs):
+        for key, item in dict(other, **kwargs).items():
+            self[key] = item
+
+    def clear(self):
+        super().clear()
+        self.occupancy = 0
+
+    def copy(self) -> "Layout":
+        new_layout = Layout(self.backpack_cols, self.backpack_rows)
+        dict.update(new_layout, self)
+        new_layout.occupancy = self.occupancy
+        return new_layout
+
+    def __reduce__(self):
+        return Layout, (self.backpack_cols, self.backpack_rows, dict(self))
+
+
+def layout_occupancy(placed_items: Dict, backpack_cols: int, backpack_rows: int) -> int:
+    """Occupancy bitboard of any placed-items dict; a Layout of the same size answers in O(1)."""
+    if (isinstance(placed_items, Layout) and placed_items.backpack_cols == backpack_cols
+            and placed_items.backpack_rows == backpack_rows):
+        return placed_items.occupancy
+    occupancy = 0
+    for item in placed_items.values():
+        occupancy |= item.get_masks(backpack_cols, backpack_rows).at(item.gx, item.gy).body
+    return occupancy
 
-    def _get_effect_value(self, effect_data: dict, source_item: Item) -> Any:
+
+def placement_fits(item: Placement, gx: int, gy: int, placed_items: Dict, backpack_cols: int, backpack_rows: int) -> bool:
+    """True if the item's body lies inside the backpack at (gx, gy) and overlaps no placed item."""
+    masks = item.get_masks(backpack_cols, backpack_rows).at(gx, gy)
+    return masks.inside and not (masks.body & layout_occupancy(placed_items, backpack_cols, backpack_rows))
+
+
+# --- 效果编译：把 star_effects / passive_effects 预处理成执行计划 ---
+STAR_REASONS = {star_type: f"Star {star_type.name.split('_')[1]}" for star_type in STAR_TYPES}
+SCORING_EFFECTS = ("ADD_TO_NEUTRAL_POOL", "ADD_SCORE_TO_SELF", "ADD_SCORE_TO_TARGET",
+                   "MULTIPLY_SCORE_OF_SELF", "MULTIPLY_SCORE_OF_TARGET")
+
+
+def _as_list(value) -> list:
+    return value if isinstance(value, list) else [value]
+
+
+def _to_number(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+class CompiledEffect:
+    """
+    A single star or passive effect with its condition and value resolved once.
+    Enum names are looked up at compile time, so evaluating the condition only
+    compares enums and names against the target.
+    """
+    __slots__ = ("effect", "has_effect", "scoring", "element", "number", "base", "per_star", "per_star_add",
+                 "when_empty", "_require_not_empty", "_elements", "_types", "_names", "_source_name",
+                 "_must_be_different", "_requires_cooldown", "_requires_start_of_battle", "_match_any", "_no_checks")
+
+    def __init__(self, effect_data: dict, source_name: str):
+        self.effect = effect_data.get("effect")
+        self.has_effect = "effect" in effect_data
+        self.scoring = self.effect in SCORING_EFFECTS
+
+        # --- 数值 ---
         value_data = effect_data.get("value", 0)
-        if not isinstance(value_data, dict): return value_data
-        final_value = value_data.get("base", 0.0)
-        if "dynamic_bonus" in value_data:
-            bonus_data = value_data["dynamic_bonus"]
-            per_star_type = GridType[bonus_data["per_activated_star"]]
-            num_activated = source_item.activated_stars.get(per_star_type, 0)
-            final_value += num_activated * bonus_data.get("add", 0)
-        return final_value
-
-    def run(self, placed_items: Dict[Any, Item], backpack_cols: int, backpack_rows: int):
-        # ... (此函数中的所有代码保持不变) ...
-        self.neutral_pool_modifiers.clear()
+        self.element = None
+        self.base, self.per_star, self.per_star_add = None, None, 0
+        if isinstance(value_data, dict):
+            self.base = value_data.get("base", 0.0)
+            if "dynamic_bonus" in value_data:
+                bonus_data = value_data["dynamic_bonus"]
+                self.per_star = GridType[bonus_data["per_activated_star"]]
+                self.per_star_add = bonus_data.get("add", 0)
+            self.number = _to_number(self.base) if self.per_star is None else None
+        else:
+            self.number = _to_number(value_data)
+        if self.effect == "ADD_ELEMENT_TO_TARGET":
+            try:
+                self.element = Element[value_data.upper()]
+            except (KeyError, AttributeError):
+                print(f"Warning: Invalid element '{value_data}' for ADD_ELEMENT_TO_TARGET in {source_name}")
+
+        # --- 条件 ---
+        condition_data = effect_data.get("condition", {}) or {}
+        self._match_any = effect_data.get("condition_logic", "AND") == "OR"
+        self._require_not_empty = bool(condition_data.get("requires_empty"))
+        other_keys = sum(1 for key in condition_data if key != "requires_empty")
+        if not condition_data:
+            self.when_empty = True
+        elif self._match_any:
+            self.when_empty = self._require_not_empty or other_keys == 0
+        else:
+            self.when_empty = other_keys == 0
+
+        self._elements = self._types = self._names = None
+        if "requires_element" in condition_data:
+            self._elements = frozenset(Element[req.upper()] for req in _as_list(condition_data["requires_element"]))
+        if "requires_type" in condition_data:
+            self._types = frozenset(ItemType[req.upper()] for req in _as_list(condition_data["requires_type"]))
+        if "requires_name" in condition_data:
+            self._names = frozenset(_as_list(condition_data["requires_name"]))
+        self._source_name = source_name
+        self._must_be_different = bool(condition_data.get("must_be_different"))
+        self._requires_cooldown = bool(condition_data.get("requires_cooldown"))
+        self._requires_start_of_battle = bool(condition_data.get("requires_start_of_battle"))
+        self._no_checks = (self._elements is None and self._types is None and self._names is None
+                           and not self._must_be_different and not self._requires_cooldown
+                           and not self._requires_start_of_battle)
+
+    def matches(self, target, temporary_elements) -> bool:
+        """Evaluates the condition against a target item (or None for an empty cell)."""
+        if target is None:
+            return self.when_empty
+        if self._no_checks:
+            return not self._require_not_empty
+        if self._require_not_empty and not self._match_any:
+            return False
+        checks = []
+        if self._elements is not None:
+            checks.append(not self._elements.isdisjoint(target.elements)
+                          or not self._elements.isdisjoint(temporary_elements))
+        if self._types is not None:
+            checks.append(not self._types.isdisjoint(target.types))
+        if self._names is not None:
+            checks.append(target.name in self._names)
+        if self._must_be_different:
+            checks.append(self._source_name != target.name)
+        if self._requires_cooldown:
+            checks.append(bool(getattr(target, 'has_cooldown', False)))
+        if self._requires_start_of_battle:
+            checks.append(bool(getattr(target, 'is_start_of_battle', False)))
+        return any(checks) if self._match_any else all(checks)
+
+    def value_for(self, activated_stars: Dict[GridType, int]) -> Optional[float]:
+        """Returns the numeric effect value, or None if the value is not a number."""
+        if self.per_star is None:
+            return self.number
+        return _to_number(self.base + activated_stars.get(self.per_star, 0) * self.per_star_add)
+
+
+class ItemPlan:
+    """
+    Precomputed effect plan of one item definition.
+    - element_groups: per star type, ADD_ELEMENT_TO_TARGET effects grouped by star key (element pass)
+    - star_groups: per star type, all effects grouped by star key (star-activation pass)
+    - star_effects: per star type, all effects flattened in star key order (effect collection pass)
+    - passives: compiled passive effects
+    - empty_types: star types with at least one effect that can fire on an empty cell
+    """
+    __slots__ = ("element_groups", "star_groups", "star_effects", "passives", "empty_types")
+
+    def __init__(self, element_groups, star_groups, star_effects, passives):
+        self.element_groups = element_groups
+        self.star_groups = star_groups
+        self.star_effects = star_effects
+        self.passives = passives
+        self.empty_types = tuple(star_type for star_type, effects in star_effects.items()
+                                 if any(effect.when_empty for effect in effects))
+
+
+def compile_item_plan(item) -> ItemPlan:
+    """Turns an item's star_effects / passive_effects into an ItemPlan."""
+    element_groups, star_groups, star_effects = {}, {}, {}
+    for star_type in STAR_TYPES:
+        groups = []
+        for star_key, effects in item.star_effects.items():
+            if star_key.startswith(star_type.name):
+                groups.append(tuple(CompiledEffect(effect_data, item.name) for effect_data in _as_list(effects)))
+        if not groups:
+            continue
+        star_groups[star_type] = tuple(groups)
+        star_effects[star_type] = tuple(effect for group in groups for effect in group)
+        element_only = tuple(tuple(e for e in group if e.effect == "ADD_ELEMENT_TO_TARGET") for group in groups)
+        element_only = tuple(group for group in element_only if group)
+        if element_only:
+            element_groups[star_type] = element_only
+    passives = tuple(CompiledEffect(effect_data, item.name) for effect_data in item.passive_effects)
+    return ItemPlan(element_groups, star_groups, star_effects, passives)
+
+
+def _star_type_at(stars: Dict[GridType, int], bit: int) -> GridType:
+    if bit & stars[GridType.STAR_A]: return GridType.STAR_A
+    if bit & stars[GridType.STAR_B]: return GridType.STAR_B
+    return GridType.STAR_C
+
+
+class EvaluationResult:
+    """
+    Output of one engine evaluation. Per-item values are dicts keyed by the
+    layout keys, so evaluating a layout never writes to (or requires copies of)
+    the items themselves.
+    """
+    __slots__ = ("final_scores", "activated_stars", "occupying_stars", "temporary_elements", "score_modifiers",
+                 "neutral_pool_total", "neutral_pool_modifiers", "interaction_map", "total_score")
+
+    def __init__(self):
+        self.final_scores: Dict[Any, float] = {}
+        self.activated_stars: Dict[Any, Dict[GridType, int]] = {}
+        self.occupying_stars: Dict[Any, List[Tuple[GridType, str]]] = {}
+        self.temporary_elements: Dict[Any, List[Element]] = {}
+        self.score_modifiers: Dict[Any, List[str]] = {}
         self.neutral_pool_total = 0.0
-        self.interaction_map = []
-
-        occupancy_grid: List[List[Optional[Item]]] = [[None for _ in range(backpack_cols)] for _ in
-                                                      range(backpack_rows)]
-        for item in placed_items.values():
-            item.final_score = item.base_score
-            item.score_modifiers, item.occupying_stars, item.temporary_elements = [], [], []
-            item.activated_stars = {GridType.STAR_A: 0, GridType.STAR_B: 0, GridType.STAR_C: 0}
-
-        for item in placed_items.values():
-            gx, gy = item.gx, item.gy
-            for r, row in enumerate(item.shape_matrix):
-                for c, cell in enumerate(row):
-                    if cell == GridType.OCCUPIED and 0 <= gy + r < backpack_rows and 0 <= gx + c < backpack_cols:
-                        occupancy_grid[gy + r][gx + c] = item
-
-        for source_item in placed_items.values():
-            gx, gy = source_item.gx, source_item.gy
-            for r, row in enumerate(source_item.shape_matrix):
-                for c, cell_type in enumerate(row):
-                    if cell_type.name.startswith("STAR"):
-                        base_star_name = cell_type.name
-                        for star_key in source_item.star_effects:
-                            if star_key.startswith(base_star_name):
-                                effects, logic = (source_item.star_effects.get(star_key, []), "AND")
-                                if not isinstance(effects, list): effects = [effects]
-                                abs_x, abs_y = gx + c, gy + r
-                                target_item = occupancy_grid[abs_y][
-                                    abs_x] if 0 <= abs_y < backpack_rows and 0 <= abs_x < backpack_cols else None
-                                for effect_data in effects:
-                                    logic = effect_data.get("condition_logic", "AND")
-                                    if effect_data.get("effect") == "ADD_ELEMENT_TO_TARGET" and self._check_condition(
-                                            effect_data.get("condition", {}), source_item, target_item, logic):
-                                        if target_item:
-                                            try:
-                                                element_to_add = Element[effect_data["value"].upper()]
-                                                if element_to_add not in target_item.temporary_elements: target_item.temporary_elements.append(
-                                                    element_to_add)
-                                            except (KeyError, AttributeError):
-                                                print(
-                                                    f"Warning: Invalid element '{effect_data['value']}' for ADD_ELEMENT_TO_TARGET in {source_item.name}")
-                                        break
-        for source_item in placed_items.values():
-            gx, gy = source_item.gx, source_item.gy
+        self.neutral_pool_modifiers: List[str] = []
+        self.interaction_map: List[Tuple[str, str]] = []
+        self.total_score = 0.0
+
+
+class _SourceState:
+    """Per-item evaluation state (scratch values included) cached by a ScoringSession."""
+    __slots__ = ("key", "placed", "item_def", "plan", "masks", "reach", "element_reach", "temporary_elements",
+                 "activated_stars", "hits", "emitted", "final_score", "score_modifiers", "occupying_stars")
+
+    def __init__(self, key, placed, masks):
+        self.key = key
+        self.placed = placed  # 放入会话的 Placement（或 Item 精灵）
+        self.item_def: ItemDef = placed.item_def
+        plan = self.plan = self.item_def.get_plan()
+        self.masks = masks
+        # reach: 有效果的星星格；element_reach: 其中带 ADD_ELEMENT_TO_TARGET 效果的星星格
+        self.reach = 0
+        for star_type in plan.star_groups:
+            self.reach |= masks.stars[star_type]
+        self.element_reach = 0
+        for star_type in plan.element_groups:
+            self.element_reach |= masks.stars[star_type]
+        self.temporary_elements: List[Element] = []
+        self.activated_stars = {GridType.STAR_A: 0, GridType.STAR_B: 0, GridType.STAR_C: 0}
+        self.hits: List[Tuple["_SourceState", GridType]] = []  # 激活星星的 (目标, 星星类型)
+        self.emitted: List[Tuple[str, Optional["_SourceState"], float, str]] = []  # (效果类型, 目标, 数值, 原因)
+        self.final_score = 0.0
+        self.score_modifiers: List[str] = []
+        self.occupying_stars: List[Tuple[GridType, str]] = []
+
+
+class ScoringSession:
+    """
+    Keeps one layout evaluated and re-scores it incrementally when an item is
+    added, removed or moved. Only items whose star cells cover a changed cell
+    (or an item whose temporary elements changed), the moved item itself and
+    items with passive effects are re-evaluated; the element pass, neutral pool
+    and add / multiply phases are then replayed from the cached per-item effects.
+
+    Items are evaluated in insertion order, the same order CalculationEngine.run
+    uses for a dict, so a session and a full run of the same layout agree exactly.
+    Items may be Placements or Item sprites (anything with item_def, rotation,
+    gx and gy) and are never modified; `result` holds the latest EvaluationResult.
+    With explain=False the human-readable modifier strings are not built.
+    """
+
+    def __init__(self, backpack_cols: int, backpack_rows: int, placed_items: Optional[Dict[Any, Placement]] = None,
+                 explain: bool = True):
+        self.backpack_cols = backpack_cols
+        self.backpack_rows = backpack_rows
+        self.explain = explain
+        self.occupancy = 0
+        self.result = EvaluationResult()
+        self._states: Dict[Any, _SourceState] = {}
+        self._owners: List[Optional[_SourceState]] = [None] * (backpack_cols * backpack_rows)
+        for key, item in (placed_items or {}).items():
+            self._attach(key, item)
+        self._refresh(None)
+
+    @property
+    def total_score(self) -> float:
+        return self.result.total_score
+
+    def add(self, key, item: Placement) -> float:
+        """Places an item (positioned via gx / gy) under key and returns the new total score."""
+        changed = self._detach(key) if key in self._states else 0
+        state = self._attach(key, item)
+        return self._refresh(changed | state.masks.body, (state,))
+
+    def remove(self, key) -> float:
+        """Removes the item stored under key and returns the new total score."""
+        return self._refresh(self._detach(key))
+
+    def move(self, key, new_key, item: Placement) -> float:
+        """Re-places an item whose position or rotation changed; it is stored under new_key."""
+        changed = self._detach(key)
+        if new_key in self._states:
+            changed |= self._detach(new_key)
+        state = self._attach(new_key, item)
+        return self._refresh(changed | state.masks.body, (state,))
+
+    def apply(self, removed: Iterable = (), added: Optional[Dict[Any, Placement]] = None) -> float:
+        """
+        Removes the items under `removed`, then places `added` (key -> item), with a
+        single re-evaluation; e.g. a swap of two items. Returns the new total score.
+        """
+        changed = 0
+        for key in removed:
+            changed |= self._detach(key)
+        states = []
+        for key, item in (added or {}).items():
+            if key in self._states:
+                changed |= self._detach(key)
+            state = self._attach(key, item)
+            changed |= state.masks.body
+            states.append(state)
+        return self._refresh(changed, states)
+
+    def placed_items(self) -> Dict[Any, Placement]:
+        return {key: state.placed for key, state in self._states.items()}
+
+    # --- 布局维护 ---
+    def _attach(self, key, item: Placement) -> _SourceState:
+        masks = item.get_masks(self.backpack_cols, self.backpack_rows).at(item.gx, item.gy)
+        state = _SourceState(key, item, masks)
+        self._states[key] = state
+        for index in masks.body_indices:
+            self._owners[index] = state
+        self.occupancy |= masks.body
+        return state
+
+    def _detach(self, key) -> int:
+        state = self._states.pop(key)
+        body = state.masks.body
+        owners = self._owners
+        for index in state.masks.body_indices:
+            owners[index] = None
+        self.occupancy = 0
+        for other in self._states.values():
+            self.occupancy |= other.masks.body
+            if other.masks.body & body:  # 重叠的布局：按插入顺序恢复格子的占用者
+                for index in other.masks.body_indices:
+                    if (body >> index) & 1:
+                        owners[index] = other
+        return body
+
+    # --- 评估 ---
+    def _refresh(self, changed: Optional[int], added: Sequence[_SourceState] = ()) -> float:
+        """Re-evaluates after the given cells changed; changed=None re-evaluates every item."""
+        states = list(self._states.values())
+        element_changes = self._apply_elements(states)
+        for state in states:
+            if (changed is None or state in added or state.plan.passives
+                    or state.reach & (changed | element_changes)):
+                self._activate(state)
+                self._collect(state, states)
+        return self._aggregate(states)
+
+    def _apply_elements(self, states: List[_SourceState]) -> int:
+        """Reruns the ADD_ELEMENT_TO_TARGET pass; returns the body cells of items whose elements changed."""
+        previous = [state.temporary_elements for state in states]
+        for state in states:
+            state.temporary_elements = []
+        owners, occupancy = self._owners, self.occupancy
+        for state in states:
+            if not state.element_reach: continue
+            element_groups, stars = state.plan.element_groups, state.masks.stars
+            for index in iter_bits(state.element_reach & occupancy):
+                target = owners[index]
+                for group in element_groups[_star_type_at(stars, 1 << index)]:
+                    for effect in group:
+                        if effect.matches(target.item_def, target.temporary_elements):
+                            if effect.element is not None and effect.element not in target.temporary_elements:
+                                target.temporary_elements.append(effect.element)
+                            break
+        changed = 0
+        for state, old_elements in zip(states, previous):
+            if state.temporary_elements != old_elements:
+                changed |= state.masks.body
+        return changed
+
+    def _star_cells(self, state: _SourceState) -> int:
+        """Star cells to visit: occupied ones, plus all cells of star types that can fire on an empty cell."""
+        cells = state.reach & self.occupancy
+        for star_type in state.plan.empty_types:
+            cells |= state.masks.stars[star_type]
+        return cells
+
+    def _activate(self, state: _SourceState):
+        """Star-activation pass for one source item."""
+        plan, stars = state.plan, state.masks.stars
+        activated = {GridType.STAR_A: 0, GridType.STAR_B: 0, GridType.STAR_C: 0}
+        hits = []
+        cells = self._star_cells(state)
+        if cells:
+            owners = self._owners
             triggered_by = {GridType.STAR_A: set(), GridType.STAR_B: set(), GridType.STAR_C: set()}
-            for r, row in enumerate(source_item.shape_matrix):
-                for c, cell_type in enumerate(row):
-                    if cell_type in triggered_by:
-                        abs_x, abs_y = gx + c, gy + r
-                        if not (0 <= abs_x < backpack_cols and 0 <= abs_y < backpack_rows): continue
-                        base_star_name = cell_type.name
-                        for star_key in source_item.star_effects:
-                            if star_key.startswith(base_star_name):
-                                effects = source_item.star_effects.get(star_key, [])
-                                if not isinstance(effects, list): effects = [effects]
-                                target_item = occupancy_grid[abs_y][abs_x]
-                                for effect_data in effects:
-                                    logic = effect_data.get("condition_logic", "AND")
-                                    if self._check_condition(effect_data.get("condition", {}), source_item, target_item,
-                                                             logic):
-                                        if target_item is None or target_item not in triggered_by.get(cell_type, set()):
-                                            source_item.activated_stars[cell_type] += 1
-                                            if target_item:
-                                                if cell_type not in triggered_by: triggered_by[cell_type] = set()
-                                                target_item.occupying_stars.append((cell_type, source_item.name))
-                                                triggered_by[cell_type].add(target_item)
-                                        break
-
-        all_effects = []
-        for source_item in placed_items.values():
-            for effect_data in source_item.passive_effects:
-                logic = effect_data.get("condition_logic", "AND")
-                for target_item in placed_items.values():
-                    if self._check_condition(effect_data.get("condition", {}), source_item, target_item, logic):
-                        value = self._get_effect_value(effect_data, source_item)
-                        reason = f"Passive from {target_item.name}"
-                        all_effects.append(
-                            {"source": source_item, "target": target_item, "effect": effect_data["effect"],
-                             "value": value, "reason": reason})
+            for index in iter_bits(cells):
+                cell_type = _star_type_at(stars, 1 << index)
+                target = owners[index]
+                if target is None:
+                    target_item, temporary_elements = None, None
+                else:
+                    target_item, temporary_elements = target.item_def, target.temporary_elements
+                triggered = triggered_by[cell_type]
+                for group in plan.star_groups[cell_type]:
+                    for effect in group:
+                        if effect.matches(target_item, temporary_elements):
+                            if target is None or target not in triggered:
+                                activated[cell_type] += 1
+                                if target is not None:
+                                    hits.append((target, cell_type))
+                                    triggered.add(target)
+                            break
+        state.activated_stars = activated
+        state.hits = hits
+
+    def _collect(self, state: _SourceState, targets: List[_SourceState]):
+        """Effect-collection pass for one source item: passive effects first, then star effects."""
+        plan, activated_stars = state.plan, state.activated_stars
+        emitted = []
+        for effect in plan.passives:
+            if not effect.scoring: continue
+            for target in targets:
+                if effect.matches(target.item_def, target.temporary_elements):
+                    value = effect.value_for(activated_stars)
+                    if value is not None:
+                        emitted.append((effect.effect, target, value, f"Passive from {target.item_def.name}"))
 
+        cells = self._star_cells(state)
+        if cells:
+            owners, stars = self._owners, state.masks.stars
             triggered_targets = {GridType.STAR_A: set(), GridType.STAR_B: set(), GridType.STAR_C: set()}
-            gx, gy = source_item.gx, source_item.gy
-            for r, row in enumerate(source_item.shape_matrix):
-                for c, cell_type in enumerate(row):
-                    if cell_type in triggered_targets:
-                        abs_x, abs_y = gx + c, gy + r
-                        if not (0 <= abs_x < backpack_cols and 0 <= abs_y < backpack_rows): continue
-                        target_item = occupancy_grid[abs_y][abs_x]
-                        is_duplicate = False
-                        if target_item is not None:
-                            if target_item in triggered_targets[cell_type]: is_duplicate = True
-                        if is_duplicate: continue
-                        base_star_name = cell_type.name
-                        effect_applied_for_this_cell = False
-                        for star_key in source_item.star_effects:
-                            if star_key.startswith(base_star_name):
-                                effects = source_item.star_effects[star_key]
-                                if not isinstance(effects, list): effects = [effects]
-                                for effect_data in effects:
-                                    logic = effect_data.get("condition_logic", "AND")
-                                    if self._check_condition(effect_data.get("condition", {}), source_item, target_item,
-                                                             logic):
-                                        if "effect" in effect_data:
-                                            value = self._get_effect_value(effect_data, source_item)
-                                            reason = f"Star {cell_type.name.split('_')[1]}"
-                                            all_effects.append({"source": source_item, "target": target_item,
-                                                                "effect": effect_data["effect"], "value": value,
-                                                                "reason": reason})
-                                        if target_item is not None:
-                                            triggered_targets[cell_type].add(target_item)
-                                        effect_applied_for_this_cell = True
-                                        break
-                                if effect_applied_for_this_cell: break
-
-        for eff in all_effects:
-            if eff["effect"] == "ADD_TO_NEUTRAL_POOL":
-                try:
-                    numeric_value = float(eff["value"])
-                    reason_text = f"from {eff['source'].name}'s {eff['reason']}"
-                    self.neutral_pool_total += numeric_value
-                    self.neutral_pool_modifiers.append(f"+{numeric_value:.1f} ({reason_text})")
-                    self.interaction_map.append((eff["source"].name, eff["source"].name))
-                except (ValueError, TypeError):
+            for index in iter_bits(cells):
+                cell_type = _star_type_at(stars, 1 << index)
+                target = owners[index]
+                triggered = triggered_targets[cell_type]
+                if target is None:
+                    target_item, temporary_elements = None, None
+                elif target in triggered:
                     continue
+                else:
+                    target_item, temporary_elements = target.item_def, target.temporary_elements
+                for effect in plan.star_effects[cell_type]:
+                    if effect.matches(target_item, temporary_elements):
+                        if effect.scoring:
+                            value = effect.value_for(activated_stars)
+                            if value is not None:
+                                emitted.append((effect.effect, target, value, STAR_REASONS[cell_type]))
+                        if target is not None:
+                            triggered.add(target)
+                        break
+        state.emitted = emitted
+
+    def _aggregate(self, states: List[_SourceState]) -> float:
+        """Neutral pool, add phase and multiply phase over the cached effects; builds a fresh result."""
+        for state in states:
+            state.final_score = state.item_def.base_score
+            state.score_modifiers, state.occupying_stars = [], []
+        collected = {effect_type: [] for effect_type in SCORING_EFFECTS}
+        for state in states:
+            source_name = state.item_def.name
+            for target, cell_type in state.hits:
+                target.occupying_stars.append((cell_type, source_name))
+            for effect_type, target, value, reason in state.emitted:
+                collected[effect_type].append((state, target, value, reason))
+
+        result = EvaluationResult()
+        self._add_phase(collected, result)
+        self._multiply_phase(collected, result)
+
+        for state in states:
+            key = state.key
+            result.final_scores[key] = state.final_score
+            result.activated_stars[key] = state.activated_stars
+            result.occupying_stars[key] = state.occupying_stars
+            result.temporary_elements[key] = state.temporary_elements
+            result.score_modifiers[key] = state.score_modifiers
+        result.total_score = sum(state.final_score for state in states) + result.neutral_pool_total
+        self.result = result
+        return result.total_score
+
+    def _add_phase(self, collected: Dict[str, list], result: EvaluationResult):
+        """Neutral pool and additive effects."""
+        explain, interaction_map = self.explain, result.interaction_map
+        # --- 中立池 ---
+        for source, _, value, reason in collected["ADD_TO_NEUTRAL_POOL"]:
+            result.neutral_pool_total += value
+            if explain: result.neutral_pool_modifiers.append(f"+{value:.1f} (from {source.item_def.name}'s {reason})")
+            interaction_map.append((source.item_def.name, source.item_def.name))
+
+        # --- 加法阶段 ---
+        for source, _, value, reason in collected["ADD_SCORE_TO_SELF"]:
+            source.final_score += value
+            if explain: source.score_modifiers.append(f"+{value:.1f} ({reason})")
+            interaction_map.append((source.item_def.name, source.item_def.name))
+        for source, target, value, _ in collected["ADD_SCORE_TO_TARGET"]:
+            if target is None: continue
+            target.final_score += value
+            if explain: target.score_modifiers.append(f"+{value:.1f} from {source.item_def.name}")
+            interaction_map.append((source.item_def.name, target.item_def.name))
+
+    def _multiply_phase(self, collected: Dict[str, list], result: EvaluationResult):
+        """Multiplicative effects, applied after every additive one."""
+        explain, interaction_map = self.explain, result.interaction_map
+        # --- 乘法阶段 ---
+        for source, _, value, reason in collected["MULTIPLY_SCORE_OF_SELF"]:
+            source.final_score *= value
+            if explain: source.score_modifiers.append(f"x{value:.2f} ({reason})")
+            interaction_map.append((source.item_def.name, source.item_def.name))
+        for source, target, value, _ in collected["MULTIPLY_SCORE_OF_TARGET"]:
+            if target is None: continue
+            target.final_score *= value
+            if explain: target.score_modifiers.append(f"x{value:.2f} from {source.item_def.name}")
+            interaction_map.append((source.item_def.name, target.item_def.name))
+
+
+# --- 性能剖析：记录各阶段耗时与调用次数，不开启时没有任何额外开销 ---
+class EngineProfiler:
+    """
+    Wall time and call counts per phase. CalculationEngine(profiler=...) records
+    the scoring phases; wrap() times any other function (e.g. placement validators).
+    Only the process that owns the profiler is measured, not solver worker pools.
+    """
+    ENGINE_PHASES = ("occupancy_build", "element_pass", "star_activation", "effect_collection",
+                     "add_phase", "multiply_phase")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.totals: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+
+    def record(self, phase: str, seconds: float):
+        self.totals[phase] += seconds
+        self.calls[phase] += 1
+
+    def wrap(self, phase: str, func):
+        """Returns func timed under phase."""
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(phase, time.perf_counter() - start)
+        return timed
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """{phase: {calls, total_s, mean_us, share}}; share is relative to the time inside CalculationEngine.run."""
+        run_total = self.totals.get("run", 0.0)
+        report = {}
+        for phase, total in self.totals.items():
+            calls = self.calls[phase]
+            report[phase] = {"calls": calls, "total_s": total, "mean_us": total / calls * 1e6 if calls else 0.0,
+                             "share": total / run_total if run_total and phase in self.ENGINE_PHASES + ("run",) else None}
+        if run_total:
+            # run 中未归入任何阶段的时间：建会话、收集效果列表、组装结果
+            other = run_total - sum(self.totals.get(phase, 0.0) for phase in self.ENGINE_PHASES)
+            report["run_other"] = {"calls": self.calls["run"], "total_s": other,
+                                   "mean_us": other / self.calls["run"] * 1e6, "share": other / run_total}
+        return report
+
+    def format_report(self) -> str:
+        lines = [f"{'phase':<20}{'calls':>10}{'total s':>12}{'mean us':>12}{'share':>8}"]
+        for phase, row in sorted(self.report().items(), key=lambda entry: -entry[1]["total_s"]):
+            share = f"{row['share']:.1%}" if row["share"] is not None else ""
+            lines.append(f"{phase:<20}{row['calls']:>10}{row['total_s']:>12.4f}{row['mean_us']:>12.1f}{share:>8}")
+        return "\n".join(lines)
+
+
+def _profiled(phase: str, method):
+    def timed(self, *args):
+        start = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            self.profiler.record(phase, time.perf_counter() - start)
+    return timed
+
+
+class _ProfiledScoringSession(ScoringSession):
+    """ScoringSession that reports its phases to an EngineProfiler."""
+    _attach = _profiled("occupancy_build", ScoringSession._attach)
+    _detach = _profiled("occupancy_build", ScoringSession._detach)
+    _apply_elements = _profiled("element_pass", ScoringSession._apply_elements)
+    _activate = _profiled("star_activation", ScoringSession._activate)
+    _collect = _profiled("effect_collection", ScoringSession._collect)
+    _add_phase = _profiled("add_phase", ScoringSession._add_phase)
+    _multiply_phase = _profiled("multiply_phase", ScoringSession._multiply_phase)
+
+    def __init__(self, profiler: EngineProfiler, *args, **kwargs):
+        self.profiler = profiler
+        super().__init__(*args, **kwargs)
+
+
+class CalculationEngine:
+    """Scores layouts. Every evaluation returns a new EvaluationResult and leaves the items untouched."""
+
+    def __init__(self, profiler: Optional[EngineProfiler] = None):
+        self.profiler = profiler
+
+    def run(self, placed_items: Dict[Any, Placement], backpack_cols: int, backpack_rows: int,
+            explain: bool = True) -> EvaluationResult:
+        if self.profiler is None:
+            return ScoringSession(backpack_cols, backpack_rows, placed_items, explain).result
+        start = time.perf_counter()
+        result = _ProfiledScoringSession(self.profiler, backpack_cols, backpack_rows, placed_items, explain).result
+        self.profiler.record("run", time.perf_counter() - start)
+        return result
 
-        for effect_type in ["ADD_SCORE_TO_SELF", "ADD_SCORE_TO_TARGET"]:
-            for eff in all_effects:
-                if eff["effect"] == effect_type:
-                    try:
-                        numeric_value = float(eff["value"])
-                        if eff["effect"] == "ADD_SCORE_TO_SELF":
-                            reason_text = eff.get("reason", "self")
-                            eff["source"].final_score += numeric_value
-                            eff["source"].score_modifiers.append(f"+{numeric_value:.1f} ({reason_text})")
-                            self.interaction_map.append((eff["source"].name, eff["source"].name))
-                        elif eff["target"]:
-                            eff["target"].final_score += numeric_value
-                            eff["target"].score_modifiers.append(f"+{numeric_value:.1f} from {eff['source'].name}")
-                            self.interaction_map.append((eff["source"].name, eff["target"].name))
-                    except (ValueError, TypeError):
-                        continue
-
-        for effect_type in ["MULTIPLY_SCORE_OF_SELF", "MULTIPLY_SCORE_OF_TARGET"]:
-            for eff in all_effects:
-                if eff["effect"] == effect_type:
-                    try:
-                        numeric_value = float(eff["value"])
-                        if eff["effect"] == "MULTIPLY_SCORE_OF_SELF":
-                            reason_text = eff.get("reason", "self")
-                            eff["source"].final_score *= numeric_value
-                            eff["source"].score_modifiers.append(f"x{numeric_value:.2f} ({reason_text})")
-                            self.interaction_map.append((eff["source"].name, eff["source"].name))
-                        elif eff["target"]:
-                            eff["target"].final_score *= numeric_value
-                            eff["target"].score_modifiers.append(f"x{numeric_value:.2f} from {eff['source'].name}")
-                            self.interaction_map.append((eff["source"].name, eff["target"].name))
-                    except (ValueError, TypeError):
-                        continue
\ No newline at end of file
+    def start_session(self, placed_items: Optional[Dict[Any, Placement]], backpack_cols: int,
+                      backpack_rows: int, explain: bool = True) -> ScoringSession:
+        """Evaluates a layout once and returns a session for incremental add / remove / move updates."""
+        if self.profiler is not None:
+            return _ProfiledScoringSession(self.profiler, backpack_cols, backpack_rows, placed_items, explain)
+        return ScoringSession(backpack_cols, backpack_rows, placed_items, explain)
@@ -0,0 +1,80 @@
+"""
+Exports the trained MaskablePPO policy for lightweight inference: the CustomCNN
+features and the action logits, without the value head, optimizer or SB3 itself.
+
+    python export_policy.py                       # writes ppo_maskable_backpack_solver.onnx
+    python export_policy.py --format torchscript  # writes ppo_maskable_backpack_solver.pt
+
+RLSolver picks the exported file up automatically (ONNX needs onnxruntime,
+TorchScript needs torch) and applies the action mask to the logits itself.
+"""
+import argparse
+import os
+import sys
+from typing import List, Optional
+
+import numpy as np
+import torch
+import torch.nn as nn
+from sb3_contrib import MaskablePPO
+
+import train  # CustomCNN 必须可导入，模型才能反序列化
+
+DEFAULT_MODEL = train.MODEL_SAVE_PATH + ".zip"
+EXTENSIONS = {"onnx": ".onnx", "torchscript": ".pt"}
+
+
+class PolicyLogits(nn.Module):
+    """Observation batch -> action logits of a MaskablePPO policy (mask not applied)."""
+    def __init__(self, policy):
+        super().__init__()
+        self.policy = policy
+
+    def forward(self, obs: torch.Tensor) -> torch.Tensor:
+        features = self.policy.extract_features(obs)
+        if isinstance(features, tuple):  # 策略和价值网络不共享特征提取器时
+            features = features[0]
+        return self.policy.action_net(self.policy.mlp_extractor.forward_actor(features))
+
+
+def export(model_path: str, output: str, export_format: str) -> float:
+    """Writes the policy to `output`; returns the largest logit difference to the original on sample observations."""
+    model = MaskablePPO.load(model_path, device="cpu")
+    module = PolicyLogits(model.policy).eval()
+    shape = model.observation_space.shape
+    sample = torch.as_tensor(np.stack([model.observation_space.sample() for _ in range(8)]), dtype=torch.float32)
+    with torch.no_grad():
+        expected = module(sample).numpy()
+
+    if export_format == "onnx":
+        torch.onnx.export(module, torch.zeros((1,) + shape), output, input_names=["obs"], output_names=["logits"],
+                          dynamic_axes={"obs": {0: "batch"}, "logits": {0: "batch"}}, opset_version=17)
+        import onnxruntime
+        session = onnxruntime.InferenceSession(output, providers=["CPUExecutionProvider"])
+        actual = session.run(None, {"obs": sample.numpy()})[0]
+    else:
+        with torch.no_grad():
+            traced = torch.jit.trace(module, torch.zeros((1,) + shape))
+        traced.save(output)
+        with torch.no_grad():
+            actual = torch.jit.load(output)(sample).numpy()
+    return float(np.abs(actual - expected).max())
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export the RL policy to ONNX or TorchScript.")
+    parser.add_argument('--model', default=DEFAULT_MODEL, help=f"Trained MaskablePPO zip (default: {DEFAULT_MODEL})")
+    parser.add_argument('--format', choices=list(EXTENSIONS), default="onnx")
+    parser.add_argument('--output', help="Output file (default: the model path with .onnx / .pt)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.model):
+        parser.error(f"Trained model not found at '{args.model}'. Please run train.py first.")
+    output = args.output or os.path.splitext(args.model)[0] + EXTENSIONS[args.format]
+    difference = export(args.model, output, args.format)
+    print(f"Policy exported to '{output}' (max logit difference to the original: {difference:.2e})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,8 +3,8 @@ import sys
 import json
 import copy
 import os
-import importlib.util
-import inspect
+import queue
+import threading
 from typing import List, Dict, Tuple, Type
 from tkinter import filedialog
 import tkinter as tk
@@ -12,12 +12,20 @@ from datetime import datetime
 import time # Import the time module
 
 from definitions import GridType, Rarity, ItemClass, Element, ItemType
-from engine import Item, CalculationEngine
+from engine import Item, CalculationEngine, EvaluationResult, Layout, placement_fits
 sys.path.append(os.path.abspath(os.path.dirname(__file__)))
-from solvers.base_solver import BaseSolver
+from solvers import discover_solvers
+from solvers.base_observers import ConsoleObserver, SolverObserver
 
-root = tk.Tk()
-root.withdraw()
+# Tk 根窗口只在第一次弹出文件对话框时创建，导入 main.py 不再需要显示器
+_tk_root = None
+
+def _ensure_tk_root():
+    global _tk_root
+    if _tk_root is None:
+        _tk_root = tk.Tk()
+        _tk_root.withdraw()
+    return _tk_root
 
 SCREEN_WIDTH = 1600
 SCREEN_HEIGHT = 900
@@ -48,6 +56,7 @@ STAR_SHAPE_COLORS = { GridType.STAR_A: (255, 215, 0), GridType.STAR_B: (50, 205,
 def save_layout(placed_items: Dict):
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     default_filename = f"layout_{timestamp}.json"
+    _ensure_tk_root()
     filepath = filedialog.asksaveasfilename(initialfile=default_filename, defaultextension=".json", filetypes=[("JSON files", "*.json"), ("All files", "*.*")], title="Save Backpack Layout")
     if not filepath: return
     layout_data = []
@@ -57,9 +66,10 @@ def save_layout(placed_items: Dict):
     print(f"Layout saved to {filepath}")
 
 def load_layout(full_item_data: Dict) -> Dict:
+    _ensure_tk_root()
     filepath = filedialog.askopenfilename(filetypes=[("JSON files", "*.json"), ("All files", "*.*")], title="Load Backpack Layout")
-    if not filepath: return {}
-    new_placed_items = {}
+    if not filepath: return Layout(BACKPACK_COLS, BACKPACK_ROWS)
+    new_placed_items = Layout(BACKPACK_COLS, BACKPACK_ROWS)
     try:
         with open(filepath, 'r') as f: layout_data = json.load(f)
         for item_info in layout_data:
@@ -73,7 +83,7 @@ def load_layout(full_item_data: Dict) -> Dict:
                 new_placed_items[key] = item
     except Exception as e:
         print(f"Error loading layout: {e}")
-        return {}
+        return Layout(BACKPACK_COLS, BACKPACK_ROWS)
     print(f"Layout loaded from {filepath}")
     return new_placed_items
 
@@ -122,36 +132,40 @@ def load_items_from_file(filepath: str) -> List[Item]:
         print(f"Error loading items: {e}")
     return items
 
-def discover_solvers() -> Dict[str, Type[BaseSolver]]:
-    solvers = {}
-    solver_dir = 'solvers'
-    def format_name(name): return name.replace('V2', 'V2').replace('Solver', '')
-    for filename in os.listdir(solver_dir):
-        if filename.endswith('.py') and not filename.startswith('base'):
-            module_name = f"{solver_dir}.{filename[:-3]}"
-            spec = importlib.util.spec_from_file_location(module_name, os.path.join(solver_dir, filename))
-            if spec and spec.loader:
-                module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(module)
-                for name, obj in inspect.getmembers(module, inspect.isclass):
-                    if issubclass(obj, BaseSolver) and obj is not BaseSolver: 
-                        solvers[format_name(name)] = obj
-    return dict(sorted(solvers.items()))
-
 def is_placement_valid(item: Item, gx: int, gy: int, items_dict: Dict[Tuple[int, int], Item]) -> bool:
-    occupied_cells = set()
-    for p_item in items_dict.values():
-        px, py = p_item.gx, p_item.gy
-        for r, row in enumerate(p_item.shape_matrix):
-            for c, cell in enumerate(row):
-                if cell == GridType.OCCUPIED: occupied_cells.add((px + c, py + r))
-    for r, row in enumerate(item.shape_matrix):
-        for c, cell in enumerate(row):
-            if cell == GridType.OCCUPIED:
-                ax, ay = gx + c, gy + r
-                if not(0<=ax<BACKPACK_COLS and 0<=ay<BACKPACK_ROWS): return False
-                if(ax,ay) in occupied_cells: return False
-    return True
+    return placement_fits(item, gx, gy, items_dict, BACKPACK_COLS, BACKPACK_ROWS)
+
+def to_visual_layout(layout: Dict) -> Layout:
+    """Re-creates visual items from a solver's Placements."""
+    visual_layout = Layout(BACKPACK_COLS, BACKPACK_ROWS)
+    for key, placement in layout.items():
+        visual_layout[key] = Item.from_placement(placement, visuals=True)
+    return visual_layout
+
+class QueueObserver(SolverObserver):
+    """Forwards solver progress from the solver thread to the UI loop."""
+    def __init__(self, events: queue.Queue):
+        self.events = events
+
+    def on_generation(self, solver, progress):
+        self.events.put(("progress", progress))
+
+def run_solver_in_background(SolverClass, items: List[Item], initial_layout: Dict,
+                             events: queue.Queue, cancel_event: threading.Event):
+    """
+    Solver thread: builds and runs the solver while the UI keeps drawing. Streams
+    ("progress", SolverProgress) events, then one ("done", layout, score, seconds) or ("error", exception).
+    """
+    try:
+        solver_instance = SolverClass(items, BACKPACK_COLS, BACKPACK_ROWS, initial_layout=initial_layout)
+        solver_instance.add_observer(QueueObserver(events))
+        solver_instance.add_observer(ConsoleObserver())
+        solver_instance.cancel_event = cancel_event
+        start_time = time.time()
+        best_layout, best_score = solver_instance.solve()
+        events.put(("done", best_layout, best_score, time.time() - start_time))
+    except Exception as e:
+        events.put(("error", e))
 
 def game_loop():
     pygame.init()
@@ -163,7 +177,7 @@ def game_loop():
         full_item_definitions = json.load(f)
     items_in_shop = load_items_from_file('items.json')
 
-    placed_items = {}
+    placed_items = Layout(BACKPACK_COLS, BACKPACK_ROWS)
     selected_item = None
     engine = CalculationEngine()
     
@@ -185,6 +199,8 @@ def game_loop():
     save_load_y = dropdown_rect.bottom + 10
     save_button = pygame.Rect(BACKPACK_X, save_load_y, 175, 40)
     load_button = pygame.Rect(save_button.right + 10, save_load_y, 175, 40)
+    # 求解过程中进度条占用 Save / Load 这一行
+    progress_rect = pygame.Rect(BACKPACK_X, save_load_y, load_button.right - BACKPACK_X, 40)
 
     shop_area_rect = pygame.Rect(SHOP_X, PANEL_Y, SHOP_WIDTH, PANEL_HEIGHT)
     info_panel_rect = pygame.Rect(INFO_PANEL_X, PANEL_Y, INFO_PANEL_WIDTH, PANEL_HEIGHT)
@@ -212,14 +228,21 @@ def game_loop():
                     max_y = max(max_y, item_bottom)
         total_shop_height = max_y - (PANEL_Y + 10)
 
+    result = EvaluationResult()
     total_score = 0
     info_content_height = 0
 
+    # Background solve state (None while no solver is running)
+    solver_events, solver_cancel = None, None
+    solver_progress, solver_preview = None, None
+
     running = True
     while running:
         mouse_pos = pygame.mouse.get_pos()
         for event in pygame.event.get():
-            if event.type == pygame.QUIT: running = False
+            if event.type == pygame.QUIT:
+                running = False
+                if solver_cancel: solver_cancel.set()
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 4: # Scroll Up
                     if shop_area_rect.collidepoint(mouse_pos): shop_scroll_y = max(0, shop_scroll_y - 20)
@@ -231,7 +254,7 @@ def game_loop():
                     if info_panel_rect.collidepoint(mouse_pos):
                         info_scroll_y = min(max(0, info_content_height - info_panel_rect.height), info_scroll_y + 20)
                     if neutral_panel_rect.collidepoint(mouse_pos):
-                        neutral_h = 55 + len(engine.neutral_pool_modifiers) * 25
+                        neutral_h = 55 + len(result.neutral_pool_modifiers) * 25
                         neutral_scroll_y = min(max(0, neutral_h - neutral_panel_rect.height), neutral_scroll_y + 20)
                 elif event.button == 3 and selected_item and selected_item.dragging:
                     rx, ry = mouse_pos[0]-selected_item.rect.x, mouse_pos[1]-selected_item.rect.y
@@ -253,6 +276,11 @@ def game_loop():
                     
                     if clicked_on_dropdown_option:
                         pass
+                    elif solver_events is not None:
+                        # 求解器运行中：布局锁定，只响应 Cancel
+                        if run_solver_button.collidepoint(mouse_pos) and not solver_cancel.is_set():
+                            print("Cancelling solver...")
+                            solver_cancel.set()
                     elif dropdown_rect.collidepoint(mouse_pos):
                         dropdown_open = not dropdown_open
                     elif save_button.collidepoint(mouse_pos):
@@ -260,46 +288,19 @@ def game_loop():
                         dropdown_open = False
                     elif load_button.collidepoint(mouse_pos):
                         placed_items = load_layout(full_item_definitions)
-                        engine.run(placed_items, BACKPACK_COLS, BACKPACK_ROWS)
-                        total_score = sum(item.final_score for item in placed_items.values()) + engine.neutral_pool_total
+                        result = engine.run(placed_items, BACKPACK_COLS, BACKPACK_ROWS)
+                        total_score = result.total_score
                         dropdown_open = False
                     elif run_solver_button.collidepoint(mouse_pos) and selected_solver_name in available_solvers:
                         items_in_backpack = list(placed_items.values())
                         if not items_in_backpack:
                             print("Solver Error: No items in the backpack to solve for.")
                         else:
-                            SolverClass = available_solvers[selected_solver_name]
-                            solver_instance = SolverClass(items_in_backpack, BACKPACK_COLS, BACKPACK_ROWS, initial_layout=placed_items)
-                            
                             print(f"Running {selected_solver_name} Solver...")
-                            start_time = time.time()
-                            
-                            best_layout, best_score = solver_instance.solve()
-                            
-                            end_time = time.time()
-                            elapsed_time = end_time - start_time
-                            print(f"Solver finished in {elapsed_time:.2f} seconds.")
-                            
-                            # --- FIX: Re-create visual items from the solver's data-only results ---
-                            visual_layout = {}
-                            for key, data_item in best_layout.items():
-                                visual_item = Item(
-                                    x=0, y=0, name=data_item.name, rarity=data_item.rarity,
-                                    item_class=data_item.item_class, elements=data_item.elements,
-                                    types=data_item.types, shape_matrix=data_item.shape_matrix,
-                                    base_score=data_item.base_score, star_effects=data_item.star_effects,
-                                    has_cooldown=data_item.has_cooldown, is_start_of_battle=data_item.is_start_of_battle,
-                                    passive_effects=data_item.passive_effects, visuals=True
-                                )
-                                visual_item.gx = data_item.gx
-                                visual_item.gy = data_item.gy
-                                visual_layout[key] = visual_item
-                            
-                            placed_items = visual_layout
-                            # --- END FIX ---
-
-                            engine.run(placed_items, BACKPACK_COLS, BACKPACK_ROWS)
-                            total_score = sum(item.final_score for item in placed_items.values()) + engine.neutral_pool_total
+                            solver_events, solver_cancel = queue.Queue(), threading.Event()
+                            threading.Thread(target=run_solver_in_background, daemon=True,
+                                             args=(available_solvers[selected_solver_name], items_in_backpack,
+                                                   placed_items.copy(), solver_events, solver_cancel)).start()
                         dropdown_open = False
                     else:
                         dropdown_open = False
@@ -319,12 +320,12 @@ def game_loop():
                         else:
                             for item_t in items_in_shop:
                                 if item_t.is_mouse_over_body(mouse_pos, item_t.rect.topleft):
-                                    selected_item = Item(item_t.rect.x, item_t.rect.y, item_t.name, item_t.rarity, item_t.item_class, item_t.elements, item_t.types, copy.deepcopy(item_t.shape_matrix), item_t.base_score, item_t.star_effects, item_t.has_cooldown, item_t.is_start_of_battle, item_t.passive_effects)
+                                    selected_item = Item.from_def(item_t.item_def, item_t.rect.x, item_t.rect.y, item_t.rotation)
                                     selected_item.dragging, offset_x, offset_y = True, item_t.rect.x - mouse_pos[0], item_t.rect.y - mouse_pos[1]
                                     break
                         if calc_button.collidepoint(mouse_pos):
-                            engine.run(placed_items, BACKPACK_COLS, BACKPACK_ROWS)
-                            total_score = sum(item.final_score for item in placed_items.values()) + engine.neutral_pool_total
+                            result = engine.run(placed_items, BACKPACK_COLS, BACKPACK_ROWS)
+                            total_score = result.total_score
 
             elif event.type == pygame.MOUSEBUTTONUP:
                 if event.button == 1 and selected_item:
@@ -342,6 +343,31 @@ def game_loop():
                 if selected_item and selected_item.dragging:
                     selected_item.rect.x, selected_item.rect.y = mouse_pos[0]+offset_x, mouse_pos[1]+offset_y
 
+        while solver_events is not None:
+            try:
+                solver_event = solver_events.get_nowait()
+            except queue.Empty:
+                break
+            if solver_event[0] == "progress":
+                progress = solver_event[1]
+                if solver_progress is None or progress.best_layout is not solver_progress.best_layout:
+                    solver_preview = to_visual_layout(progress.best_layout)
+                solver_progress = progress
+                continue
+            if solver_event[0] == "done":
+                _, best_layout, best_score, elapsed_time = solver_event
+                print(f"Solver finished in {elapsed_time:.2f} seconds.")
+                if solver_cancel.is_set():
+                    print("Solver cancelled, layout unchanged.")
+                else:
+                    placed_items = to_visual_layout(best_layout)
+                    result = engine.run(placed_items, BACKPACK_COLS, BACKPACK_ROWS)
+                    total_score = result.total_score
+            else:
+                print(f"Solver Error: {solver_event[1]}")
+            solver_events, solver_cancel = None, None
+            solver_progress, solver_preview = None, None
+
         screen.fill(BG_COLOR)
         bp_rect = pygame.Rect(BACKPACK_X, BACKPACK_Y, BACKPACK_COLS*GRID_SIZE, BACKPACK_ROWS*GRID_SIZE)
         pygame.draw.rect(screen, (230,230,230), bp_rect); pygame.draw.rect(screen, (240,240,240), shop_area_rect, 2);
@@ -353,44 +379,48 @@ def game_loop():
         for y in range(bp_rect.top, bp_rect.bottom + 1, GRID_SIZE): pygame.draw.line(screen, GRID_LINE_COLOR, (bp_rect.left, y), (bp_rect.right, y))
 
         current_info_height = 55
-        for item in placed_items.values():
+        for key in placed_items:
+            occupying_stars = result.occupying_stars.get(key, [])
             current_info_height += (30 + 25 * 3)
-            if item.occupying_stars: current_info_height += 25 + len(item.occupying_stars) * 25
-            current_info_height += 25 + len(item.score_modifiers) * 25
+            if occupying_stars: current_info_height += 25 + len(occupying_stars) * 25
+            current_info_height += 25 + len(result.score_modifiers.get(key, [])) * 25
             current_info_height += 30 + 15
         info_content_height = current_info_height
 
         screen.set_clip(info_panel_rect)
         screen.blit(font_large.render("Backpack Contents", True, FONT_COLOR), (info_panel_rect.x+10, info_panel_rect.y+10-info_scroll_y))
         y_off = 55
-        for item in placed_items.values():
+        for key, item in placed_items.items():
+            activated_stars = result.activated_stars.get(key, {GridType.STAR_A: 0, GridType.STAR_B: 0, GridType.STAR_C: 0})
+            occupying_stars = result.occupying_stars.get(key, [])
             screen.blit(font_medium.render(f"- {item.name}", True, FONT_COLOR), (info_panel_rect.x+15, info_panel_rect.y+y_off-info_scroll_y)); y_off += 30
             elems = f"Elem: {', '.join(e.name for e in item.elements) or 'None'}"; types = f"Type: {', '.join(t.name for t in item.types) or 'None'}"
             screen.blit(font_small.render(elems, True, (60,60,60)), (info_panel_rect.x+25, info_panel_rect.y+y_off-info_scroll_y)); y_off += 25
             screen.blit(font_small.render(types, True, (60,60,60)), (info_panel_rect.x+25, info_panel_rect.y+y_off-info_scroll_y)); y_off += 25
-            star_txt = f"Activated: A:{item.activated_stars[GridType.STAR_A]} B:{item.activated_stars[GridType.STAR_B]} C:{item.activated_stars[GridType.STAR_C]}"
+            star_txt = f"Activated: A:{activated_stars[GridType.STAR_A]} B:{activated_stars[GridType.STAR_B]} C:{activated_stars[GridType.STAR_C]}"
             screen.blit(font_small.render(star_txt, True, (60,60,60)), (info_panel_rect.x+25, info_panel_rect.y+y_off-info_scroll_y)); y_off += 25
-            if item.occupying_stars:
+            if occupying_stars:
                 screen.blit(font_small.render("Occupying:", True, (60,60,60)), (info_panel_rect.x+25, info_panel_rect.y+y_off-info_scroll_y)); y_off += 25
-                for star_type, source_name in item.occupying_stars: screen.blit(font_small.render(f"  - {source_name}'s {star_type.name}", True, (80,80,80)), (info_panel_rect.x+25, info_panel_rect.y+y_off-info_scroll_y)); y_off += 25
+                for star_type, source_name in occupying_stars: screen.blit(font_small.render(f"  - {source_name}'s {star_type.name}", True, (80,80,80)), (info_panel_rect.x+25, info_panel_rect.y+y_off-info_scroll_y)); y_off += 25
             screen.blit(font_small.render(f"Base Score: {item.base_score}", True, (60,60,60)), (info_panel_rect.x+25, info_panel_rect.y+y_off-info_scroll_y)); y_off += 25
-            for mod in item.score_modifiers: screen.blit(font_small.render(f"  {mod}", True, (20,100,20)), (info_panel_rect.x+25, info_panel_rect.y+y_off-info_scroll_y)); y_off += 25
-            screen.blit(font_medium.render(f"Final Score: {item.final_score:.1f}", True, FONT_COLOR), (info_panel_rect.x+25, info_panel_rect.y+y_off-info_scroll_y)); y_off += 30
+            for mod in result.score_modifiers.get(key, []): screen.blit(font_small.render(f"  {mod}", True, (20,100,20)), (info_panel_rect.x+25, info_panel_rect.y+y_off-info_scroll_y)); y_off += 25
+            screen.blit(font_medium.render(f"Final Score: {result.final_scores.get(key, 0):.1f}", True, FONT_COLOR), (info_panel_rect.x+25, info_panel_rect.y+y_off-info_scroll_y)); y_off += 30
             y_off += 15
         screen.set_clip(None)
         
         screen.set_clip(neutral_panel_rect)
         screen.blit(font_large.render("Neutral Pool", True, FONT_COLOR), (neutral_panel_rect.x + 10, neutral_panel_rect.y + 10 - neutral_scroll_y))
-        screen.blit(font_medium.render(f"Total: {engine.neutral_pool_total:.1f}", True, FONT_COLOR), (neutral_panel_rect.x + 15, neutral_panel_rect.y + 55 - neutral_scroll_y))
+        screen.blit(font_medium.render(f"Total: {result.neutral_pool_total:.1f}", True, FONT_COLOR), (neutral_panel_rect.x + 15, neutral_panel_rect.y + 55 - neutral_scroll_y))
         y_off_neutral = 90
-        for mod in engine.neutral_pool_modifiers:
+        for mod in result.neutral_pool_modifiers:
             screen.blit(font_small.render(mod, True, (100, 20, 20)), (neutral_panel_rect.x + 25, neutral_panel_rect.y + y_off_neutral - neutral_scroll_y)); y_off_neutral += 25
         screen.set_clip(None)
 
         total_score_surf = font_large.render(f"Total Score: {total_score:.1f}", True, FONT_COLOR)
         screen.blit(total_score_surf, total_score_surf.get_rect(center=total_score_rect.center))
 
-        all_items = [(item, (BACKPACK_X + item.gx * GRID_SIZE, BACKPACK_Y + item.gy * GRID_SIZE)) for item in placed_items.values()]
+        shown_items = solver_preview if solver_preview is not None else placed_items
+        all_items = [(item, (BACKPACK_X + item.gx * GRID_SIZE, BACKPACK_Y + item.gy * GRID_SIZE)) for item in shown_items.values()]
         for item in items_in_shop: item.rect.y=item.base_y-shop_scroll_y; all_items.append((item, item.rect.topleft))
         
         hovered_item_to_draw_stars = None
@@ -424,17 +454,34 @@ def game_loop():
         dropdown_text = font_button.render(f"Solver: {selected_solver_name} ▼", True, FONT_COLOR)
         screen.blit(dropdown_text, dropdown_text.get_rect(center=dropdown_rect.center))
         
-        run_text = font_button.render("Run Solver", True, FONT_COLOR)
-        pygame.draw.rect(screen, (180, 180, 220), run_solver_button)
+        if solver_events is None:
+            run_text = font_button.render("Run Solver", True, FONT_COLOR)
+            pygame.draw.rect(screen, (180, 180, 220), run_solver_button)
+        else:
+            run_text = font_button.render("Cancelling..." if solver_cancel.is_set() else "Cancel", True, FONT_COLOR)
+            pygame.draw.rect(screen, (230, 170, 170), run_solver_button)
         screen.blit(run_text, run_text.get_rect(center=run_solver_button.center))
 
-        pygame.draw.rect(screen, (200, 200, 180), save_button)
-        save_text = font_button.render("Save Layout", True, FONT_COLOR)
-        screen.blit(save_text, save_text.get_rect(center=save_button.center))
+        if solver_events is None:
+            pygame.draw.rect(screen, (200, 200, 180), save_button)
+            save_text = font_button.render("Save Layout", True, FONT_COLOR)
+            screen.blit(save_text, save_text.get_rect(center=save_button.center))
 
-        pygame.draw.rect(screen, (180, 200, 200), load_button)
-        load_text = font_button.render("Load Layout", True, FONT_COLOR)
-        screen.blit(load_text, load_text.get_rect(center=load_button.center))
+            pygame.draw.rect(screen, (180, 200, 200), load_button)
+            load_text = font_button.render("Load Layout", True, FONT_COLOR)
+            screen.blit(load_text, load_text.get_rect(center=load_button.center))
+        else:
+            pygame.draw.rect(screen, (230, 230, 230), progress_rect)
+            if solver_progress and solver_progress.total:
+                done_rect = progress_rect.copy()
+                done_rect.width = int(progress_rect.width * min(1.0, solver_progress.step / solver_progress.total))
+                pygame.draw.rect(screen, (140, 200, 140), done_rect)
+                progress_txt = f"{solver_progress.step}/{solver_progress.total} - Best: {solver_progress.best_score:.1f}"
+            else:
+                progress_txt = f"Starting {selected_solver_name}..."
+            pygame.draw.rect(screen, (180, 180, 180), progress_rect, 2)
+            progress_surf = font_button.render(progress_txt, True, FONT_COLOR)
+            screen.blit(progress_surf, progress_surf.get_rect(center=progress_rect.center))
         
         debug_y_offset = BACKPACK_Y + (BACKPACK_ROWS * GRID_SIZE) + 20
         mouse_pos_text = f"Mouse Position: {mouse_pos}"
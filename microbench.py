@@ -0,0 +1,131 @@
+"""
+Micro-benchmarks of the engine hot path on representative layouts: CalculationEngine.run,
+an incremental ScoringSession move, BaseSolver._is_placement_valid, Item.clone and Item.rotate.
+
+    python microbench.py
+    python microbench.py --items-file items_old.json --sets small,large --output micro.json
+
+The layouts are the benchmark.py corpus, packed by a short seeded GeneticSolverV2
+run, so the numbers are comparable between versions. For a per-phase breakdown of a
+real solve use `solve_cli.py --profile`.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+from typing import Callable, Dict, List, Optional
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # Item 的图片需要一个（虚拟）显示
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame
+
+from benchmark import build_corpus
+from engine import CalculationEngine, Item, Layout
+from solve_cli import BACKPACK_COLS, BACKPACK_ROWS, DEFAULT_ITEMS_FILE, items_from_names, load_item_defs
+from solvers.genetic_solver_v2 import GeneticSolverV2
+
+PACKING_GENERATIONS = 20
+
+
+def pack_layout(items, seed: int = 0) -> Layout:
+    solver = GeneticSolverV2(items, BACKPACK_COLS, BACKPACK_ROWS, generations=PACKING_GENERATIONS, seed=seed)
+    best_layout, _ = solver.solve()
+    return best_layout
+
+
+def time_call(func: Callable, repeat: int, min_time: float = 0.2) -> Dict[str, float]:
+    """Best-of-`repeat` time per call in microseconds; the loop count is chosen to take about min_time."""
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time / 10 and number < 1_000_000:
+        number *= 10
+    times = [t / number * 1e6 for t in timer.repeat(repeat=repeat, number=number)]
+    return {"best_us": min(times), "median_us": sorted(times)[len(times) // 2], "loops": number}
+
+
+def layout_cases(set_name: str, layout: Layout, rng: random.Random) -> Dict[str, Callable]:
+    engine = CalculationEngine()
+    solver = GeneticSolverV2(list(layout.values()), BACKPACK_COLS, BACKPACK_ROWS)
+    keys = list(layout)
+    # 固定的一组随机探测位置（含越界与重叠），每次计时都相同
+    probes = []
+    for _ in range(64):
+        item = layout[rng.choice(keys)]
+        probes.append((item, rng.randint(-2, BACKPACK_COLS), rng.randint(-2, BACKPACK_ROWS)))
+
+    def validate():
+        for item, gx, gy in probes:
+            solver._is_placement_valid(item, gx, gy, layout)
+
+    session = engine.start_session(layout, BACKPACK_COLS, BACKPACK_ROWS, explain=False)
+    move_key = keys[-1]
+    moving = layout[move_key]
+
+    def session_move():
+        # 取出再放回同一个物品：一次 remove + 一次 add 的增量评估
+        session.remove(move_key)
+        session.add(move_key, moving)
+
+    return {
+        f"run[{set_name}]": lambda: engine.run(layout, BACKPACK_COLS, BACKPACK_ROWS, explain=False),
+        f"run_explain[{set_name}]": lambda: engine.run(layout, BACKPACK_COLS, BACKPACK_ROWS),
+        f"session_remove_add[{set_name}]": session_move,
+        f"placement_valid_x64[{set_name}]": validate,
+    }
+
+
+def item_cases(layout: Layout) -> Dict[str, Callable]:
+    placement = max(layout.values(), key=lambda item: len(item.variant.body_cells))
+    plain = Item.from_placement(placement, visuals=False)
+    drawn = Item.from_placement(placement, visuals=True)
+    return {
+        "Item.clone": lambda: plain.clone(),
+        "Item.clone_visuals": lambda: drawn.clone(),
+        "Item.rotate": plain.rotate,
+        "Item.rotate_visuals": drawn.rotate,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the scoring engine and item helpers.")
+    parser.add_argument('--items-file', default=DEFAULT_ITEMS_FILE)
+    parser.add_argument('--sets', help="Comma-separated corpus sets (default: all)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Also write the timings as JSON")
+    args = parser.parse_args(argv)
+
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    item_defs = load_item_defs(args.items_file)
+    corpus = build_corpus(item_defs)
+    set_names = args.sets.split(',') if args.sets else list(corpus)
+
+    rng = random.Random(args.seed)
+    cases: Dict[str, Callable] = {}
+    layouts = {}
+    for set_name in set_names:
+        layouts[set_name] = pack_layout(items_from_names(item_defs, corpus[set_name]), args.seed)
+        cases.update(layout_cases(set_name, layouts[set_name], rng))
+    cases.update(item_cases(layouts[set_names[-1]]))
+
+    results = {}
+    print(f"{'case':<36}{'best us':>12}{'median us':>12}")
+    for name, func in cases.items():
+        results[name] = time_call(func, args.repeat)
+        print(f"{name:<36}{results[name]['best_us']:>12.1f}{results[name]['median_us']:>12.1f}")
+
+    if args.output:
+        report = {"items_file": args.items_file, "seed": args.seed,
+                  "layout_sizes": {name: len(layout) for name, layout in layouts.items()}, "results": results}
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Results written to {args.output}")
+    pygame.quit()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
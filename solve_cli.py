@@ -0,0 +1,242 @@
+"""
+Headless solver runner: no Pygame window, no Tk root, safe on servers without a display.
+
+Single job:
+    python solve_cli.py --solver GeneticV2 --items "木剑,木盾,香蕉" --param generations=200 --output best.json
+    python solve_cli.py --solver Genetic --layout layout_2025-01-01_12-00-00.json --time-budget 60
+    python solve_cli.py --solver BeamSearch --items "木剑,木盾,香蕉" --output seed.json
+    python solve_cli.py --solver Genetic --layout seed.json   # a result file works as a start layout too
+
+Batch (a JSON list of jobs, run concurrently):
+    python solve_cli.py --batch jobs.json --jobs 4 --output results.json
+
+A batch job is an object with the same fields as the command line:
+    {"solver": "Genetic", "items": ["木剑", "木盾"] or "layout": "saved.json",
+     "params": {"generations": 50}, "seed": 1, "time_budget": 30, "output": "job1.json",
+     "progress_every": 10}
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')  # engine 导入 pygame；不要让欢迎信息混进 JSON 输出
+from definitions import GridType, Rarity, ItemClass, Element, ItemType
+from engine import ItemDef, Layout, Placement
+from solvers import discover_solvers
+from solvers.base_observers import ConsoleObserver
+
+BACKPACK_COLS, BACKPACK_ROWS = 9, 7
+DEFAULT_ITEMS_FILE = 'items.json'
+
+
+class JobError(ValueError):
+    """A job that cannot run as given: unknown solver or item, or no items to place."""
+
+
+def load_item_defs(filepath: str) -> Dict[str, ItemDef]:
+    """Reads an items file into ItemDefs, reachable by display name and by JSON key."""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    item_defs = {}
+    for key, item_data in data.items():
+        item_def = ItemDef(
+            name=item_data['name'], rarity=Rarity[item_data['rarity']],
+            item_class=ItemClass[item_data['item_class']],
+            elements=[Element[e] for e in item_data.get('elements', [])],
+            types=[ItemType[t] for t in item_data.get('types', [])],
+            shape_matrix=[[GridType(c) for c in r] for r in item_data['shape_matrix']],
+            base_score=item_data.get('base_score', 0), star_effects=item_data.get('star_effects', {}),
+            has_cooldown=item_data.get('has_cooldown', False), is_start_of_battle=item_data.get('is_start_of_battle', False),
+            passive_effects=item_data.get('passive_effects', [])
+        )
+        item_defs[item_data['name']] = item_def
+        item_defs.setdefault(key, item_def)
+    return item_defs
+
+
+def _lookup(item_defs: Dict[str, ItemDef], name: str) -> ItemDef:
+    if name not in item_defs:
+        raise JobError(f"Unknown item '{name}'")
+    return item_defs[name]
+
+
+def items_from_names(item_defs: Dict[str, ItemDef], names: List[str]) -> List[Placement]:
+    return [Placement(_lookup(item_defs, name)) for name in names]
+
+
+def layout_from_file(item_defs: Dict[str, ItemDef], filepath: str) -> Layout:
+    """
+    Loads a layout written by main.save_layout, or the layout of a result written by
+    this script (e.g. a BeamSearch result as the start layout of a genetic solver);
+    the saved shape_matrix selects the rotation.
+    """
+    with open(filepath, 'r', encoding='utf-8') as f:
+        layout_data = json.load(f)
+    if isinstance(layout_data, dict):
+        layout_data = layout_data['layout']
+    layout = Layout(BACKPACK_COLS, BACKPACK_ROWS)
+    for item_info in layout_data:
+        item_def = _lookup(item_defs, item_info['name'])
+        shape = tuple(tuple(GridType(c) for c in r) for r in item_info['shape_matrix'])
+        rotation = next((r for r in range(4) if item_def.shape(r) == shape), None)
+        if rotation is None:
+            raise JobError(f"Saved shape of '{item_def.name}' matches none of its rotations")
+        placement = Placement(item_def, rotation, item_info['gx'], item_info['gy'])
+        offset_c, offset_r = placement.get_body_offset()
+        layout[(placement.gx + offset_c, placement.gy + offset_r)] = placement
+    return layout
+
+
+def layout_to_json(layout: Dict) -> List[Dict]:
+    """Same entries as main.save_layout, plus the rotation index."""
+    return [{"name": item.name, "gx": item.gx, "gy": item.gy, "rotation": item.rotation,
+             "shape_matrix": [[c.value for c in r] for r in item.shape_matrix]}
+            for item in layout.values()]
+
+
+def run_job(job: Dict) -> Dict:
+    """Runs one solve job (see module docstring) and returns its JSON-ready result."""
+    solvers = discover_solvers()
+    solver_name = job['solver']
+    if solver_name not in solvers:
+        raise JobError(f"Unknown solver '{solver_name}' (available: {', '.join(solvers)})")
+    item_defs = load_item_defs(job.get('items_file') or DEFAULT_ITEMS_FILE)
+
+    params = dict(job.get('params') or {})
+    if job.get('layout'):
+        initial_layout = layout_from_file(item_defs, job['layout'])
+        items = list(initial_layout.values())
+        params.setdefault('initial_layout', initial_layout)
+    elif job.get('items'):
+        names = job['items'].split(',') if isinstance(job['items'], str) else job['items']
+        items = items_from_names(item_defs, [name.strip() for name in names if name.strip()])
+    else:
+        raise JobError("A job needs either 'items' or 'layout'")
+    if job.get('time_budget') is not None:
+        params['time_budget_s'] = job['time_budget']
+
+    if job.get('seed') is not None:
+        params['seed'] = job['seed']
+    solver = solvers[solver_name](items, BACKPACK_COLS, BACKPACK_ROWS, **params)
+    if job.get('progress_every'):
+        solver.add_observer(ConsoleObserver(every=job['progress_every']))
+    if job.get('profile'):
+        solver.enable_profiling()
+    start_time = time.time()
+    best_layout, best_score = solver.solve()
+    result = {"solver": solver_name, "seed": job.get('seed'), "score": best_score,
+              "elapsed_s": round(time.time() - start_time, 3), "layout": layout_to_json(best_layout)}
+    if solver.last_stats is not None:
+        result["stats"] = solver.last_stats.as_dict()
+    if solver.bound is not None:
+        result["bound"] = solver.bound
+    if solver.profiler is not None:
+        if solver.profiler.totals:  # 岛屿模型 / 进程池中的评估不计入
+            print(solver.profiler.format_report())
+        result["profile"] = solver.profiler.report()
+    if job.get('output'):
+        write_json(job['output'], result)
+    return result
+
+
+def _run_job_safe(index: int, job: Dict) -> Tuple[int, Dict]:
+    """Batch wrapper: one failing job is reported in the results instead of stopping the batch."""
+    try:
+        return index, run_job(job)
+    except Exception as e:
+        return index, {"solver": job.get('solver'), "error": f"{type(e).__name__}: {e}"}
+
+
+def run_batch(jobs: List[Dict], max_workers: Optional[int] = None) -> List[Dict]:
+    """Runs the jobs concurrently in a process pool; results keep the order of the jobs."""
+    results: List[Optional[Dict]] = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(_run_job_safe, index, job) for index, job in enumerate(jobs)]
+        for future in as_completed(futures):
+            index, result = future.result()
+            results[index] = result
+            status = result['error'] if 'error' in result else f"score {result['score']:.2f}"
+            print(f"[Job {index}] {jobs[index].get('solver')} finished - {status}")
+    return results
+
+
+def write_json(filepath: Optional[str], data):
+    if filepath is None:
+        json.dump(data, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"Results written to {filepath}")
+
+
+def _parse_param(text: str) -> Tuple[str, object]:
+    """key=value, where value is read as JSON when possible (numbers, true/false, null) and as a string otherwise."""
+    key, sep, value = text.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError(f"Expected key=value, got '{text}'")
+    try:
+        return key, json.loads(value)
+    except json.JSONDecodeError:
+        return key, value
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run backpack layout solvers without the simulator UI.")
+    parser.add_argument('--items-file', default=DEFAULT_ITEMS_FILE, help="Item database (default: items.json)")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--items', help="Comma-separated item names (or items.json keys) to place")
+    source.add_argument('--layout', help="Layout JSON written by the simulator's Save Layout; used as the start layout")
+    source.add_argument('--batch', help="JSON file with a list of jobs to run concurrently")
+    parser.add_argument('--solver', help="Solver name, see --list")
+    parser.add_argument('--param', action='append', type=_parse_param, default=[], metavar='KEY=VALUE',
+                        help="Solver constructor argument, e.g. --param generations=200 (repeatable)")
+    parser.add_argument('--seed', type=int, help="Random seed")
+    parser.add_argument('--time-budget', type=float, help="Wall-clock budget in seconds")
+    parser.add_argument('--progress-every', type=int, default=0, metavar='N',
+                        help="Print progress every N generations (default: off)")
+    parser.add_argument('--profile', action='store_true',
+                        help="Record engine phase timings and validator calls (printed, and stored under 'profile')")
+    parser.add_argument('--jobs', type=int, help="Concurrent batch jobs (default: one per core)")
+    parser.add_argument('--output', help="Output JSON file (default: stdout)")
+    parser.add_argument('--list', action='store_true', help="List the available solvers and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print('\n'.join(discover_solvers()))
+        return 0
+
+    if args.batch:
+        with open(args.batch, 'r', encoding='utf-8') as f:
+            jobs = json.load(f)
+        for job in jobs:
+            job.setdefault('items_file', args.items_file)
+            job.setdefault('progress_every', args.progress_every)
+            job.setdefault('profile', args.profile)
+        results = run_batch(jobs, args.jobs)
+        write_json(args.output, results)
+        return 1 if any('error' in result for result in results) else 0
+
+    if not args.solver or not (args.items or args.layout):
+        parser.error("--solver and one of --items / --layout (or --batch) are required")
+    job = {"solver": args.solver, "items": args.items, "layout": args.layout, "items_file": args.items_file,
+           "params": dict(args.param), "seed": args.seed, "time_budget": args.time_budget,
+           "progress_every": args.progress_every, "profile": args.profile}
+    # 结果写到 stdout 时，把求解过程中的进度输出转到 stderr，保证 stdout 是纯 JSON
+    progress = contextlib.redirect_stdout(sys.stderr) if args.output is None else contextlib.nullcontext()
+    try:
+        with progress:
+            result = run_job(job)
+    except JobError as e:
+        parser.error(str(e))
+    write_json(args.output, result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
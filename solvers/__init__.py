@@ -0,0 +1,37 @@
+import importlib.util
+import inspect
+import os
+import sys
+from typing import Dict, Type
+
+from solvers.base_solver import BaseSolver
+
+SOLVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def discover_solvers() -> Dict[str, Type[BaseSolver]]:
+    """
+    Finds every BaseSolver subclass in the solvers/ directory, keyed by display
+    name (class name without "Solver"). base_* modules hold shared infrastructure
+    and are skipped; a solver whose dependencies are missing is skipped with a warning.
+    """
+    solvers = {}
+    def format_name(name): return name.replace('V2', 'V2').replace('Solver', '')
+    for filename in sorted(os.listdir(SOLVER_DIR)):
+        if filename.endswith('.py') and not filename.startswith(('base', '_')):
+            module_name = f"solvers.{filename[:-3]}"
+            spec = importlib.util.spec_from_file_location(module_name, os.path.join(SOLVER_DIR, filename))
+            if spec and spec.loader:
+                module = importlib.util.module_from_spec(spec)
+                # 注册模块，使求解器实例可以被 pickle 到子进程（岛屿模型 / 并行评估 / 批处理）
+                sys.modules[module_name] = module
+                try:
+                    spec.loader.exec_module(module)
+                except ImportError as e:
+                    del sys.modules[module_name]
+                    print(f"Warning: skipping solver module '{filename}': {e}")
+                    continue
+                for name, obj in inspect.getmembers(module, inspect.isclass):
+                    if issubclass(obj, BaseSolver) and obj is not BaseSolver:
+                        solvers[format_name(name)] = obj
+    return dict(sorted(solvers.items()))
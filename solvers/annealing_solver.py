@@ -0,0 +1,217 @@
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+from solvers.base_solver import BaseSolver
+from engine import Item, Placement
+
+# 一次提议最多尝试的次数（与 GA 的 _mutate 相同）
+PROPOSAL_TRIES = 10
+# 自动估计初始温度时采样的随机移动次数
+TEMPERATURE_SAMPLES = 50
+
+
+class AnnealingSolver(BaseSolver):
+    """
+    Algorithm F: single-trajectory local search.
+    Applies one move at a time (the GA mutation moves: move, rotate, swap, plus
+    inserting an item that is not placed yet) and scores it incrementally with a
+    ScoringSession, so a step costs one partial re-evaluation instead of a full
+    population. Acceptance is simulated annealing with geometric cooling
+    (acceptance="sa") or late-acceptance hill climbing (acceptance="lahc").
+    """
+    def __init__(self, items: List[Item], backpack_cols: int, backpack_rows: int,
+                 iterations: int = 6000, acceptance: str = "sa", start_temperature: Optional[float] = None,
+                 end_temperature: float = 0.05, history_length: int = 50, initial_layout: Optional[Dict] = None,
+                 time_budget_s: Optional[float] = None, patience: Optional[int] = None, min_delta: float = 0.0,
+                 seed: Optional[int] = None):
+        super().__init__(items, backpack_cols, backpack_rows, time_budget_s, patience, min_delta, seed)
+        if acceptance not in ("sa", "lahc"):
+            raise ValueError(f"acceptance must be 'sa' or 'lahc', got '{acceptance}'")
+        self.iterations = iterations
+        self.acceptance = acceptance
+        self.start_temperature = start_temperature  # None: estimated from random moves
+        self.end_temperature = end_temperature
+        self.history_length = history_length
+        self.initial_layout = self._to_placements(initial_layout) if initial_layout else None
+        # 当前轨迹：key -> Placement，以及每个物品身体的位掩码
+        self._current: Dict[Any, Placement] = {}
+        self._bodies: Dict[Any, int] = {}
+        self._occupancy = 0
+        self._unplaced: List[Placement] = []
+
+    # --- 轨迹维护 ---
+    def _key(self, item: Placement) -> Tuple[int, int]:
+        offset_c, offset_r = item.get_body_offset()
+        return (item.gx + offset_c, item.gy + offset_r)
+
+    def _body(self, item: Placement) -> int:
+        return item.get_masks(self.backpack_cols, self.backpack_rows).at(item.gx, item.gy).body
+
+    def _fits(self, item: Placement, occupancy: int) -> bool:
+        masks = item.get_masks(self.backpack_cols, self.backpack_rows).at(item.gx, item.gy)
+        return masks.inside and not (masks.body & occupancy)
+
+    def _reset_trajectory(self, layout: Dict):
+        self._current = dict(layout)
+        self._bodies = {key: self._body(item) for key, item in layout.items()}
+        self._occupancy = 0
+        for body in self._bodies.values():
+            self._occupancy |= body
+        remaining = list(self.items_to_place)
+        for item in layout.values():
+            match = next((i for i, other in enumerate(remaining) if other.item_def is item.item_def), None)
+            if match is not None:
+                remaining.pop(match)
+        self._unplaced = remaining
+
+    def _commit(self, removed: List[Any], added: Dict[Any, Placement]):
+        for key in removed:
+            del self._current[key]
+            self._occupancy &= ~self._bodies.pop(key)
+        for key, item in added.items():
+            self._current[key] = item
+            self._bodies[key] = self._body(item)
+            self._occupancy |= self._bodies[key]
+
+    def _initial_layout(self) -> Dict:
+        if self.initial_layout:
+            return self.initial_layout.copy()
+        layout = self._new_layout()
+        items_to_place = list(self.items_to_place)
+        self.rng.shuffle(items_to_place)
+        for item in items_to_place:
+            for _ in range(20):
+                item = item.rotated(self.rng.randint(0, 3))
+                pos = self._get_random_valid_position(item)
+                if pos and self._is_placement_valid(item, pos[0], pos[1], layout):
+                    item = item.at(*pos)
+                    layout[self._key(item)] = item
+                    break
+        return layout
+
+    # --- 邻域 ---
+    def _propose(self) -> Optional[Tuple[List[Any], Dict[Any, Placement]]]:
+        """A random valid move as (removed keys, added items), or None if none was found."""
+        keys = list(self._current)
+        actions = ['move', 'rotate', 'swap'] if keys else []
+        if self._unplaced:
+            actions.append('insert')
+        if not actions: return None
+
+        for _ in range(PROPOSAL_TRIES):
+            action = self.rng.choice(actions)
+            if action == 'insert':
+                index = self.rng.randrange(len(self._unplaced))
+                item = self._unplaced[index].rotated(self.rng.randint(0, 3))
+                pos = self._get_random_valid_position(item)
+                if pos is None: continue
+                item = item.at(*pos)
+                if self._fits(item, self._occupancy):
+                    return [], {self._key(item): item}
+                continue
+
+            key = self.rng.choice(keys)
+            item = self._current[key]
+            others = self._occupancy & ~self._bodies[key]
+            if action == 'rotate':
+                moved = item.rotated()
+                if self._fits(moved, others):
+                    return [key], {self._key(moved): moved}
+            elif action == 'move':
+                pos = self._get_random_valid_position(item)
+                if pos is None: continue
+                moved = item.at(*pos)
+                if self._fits(moved, others):
+                    return [key], {self._key(moved): moved}
+            elif action == 'swap' and len(keys) > 1:
+                other_key = self.rng.choice(keys)
+                if other_key == key: continue
+                other = self._current[other_key]
+                swapped_item, swapped_other = item.at(other.gx, other.gy), other.at(item.gx, item.gy)
+                rest = others & ~self._bodies[other_key]
+                if self._fits(swapped_item, rest) and self._fits(swapped_other, rest | self._body(swapped_item)):
+                    return [key, other_key], {self._key(swapped_item): swapped_item,
+                                              self._key(swapped_other): swapped_other}
+        return None
+
+    def _apply_move(self, session, removed: List[Any], added: Dict[Any, Placement]) -> Tuple[float, List[Any], Dict]:
+        """Applies a move to the session and the trajectory; returns the new score and the inverse move."""
+        inverse_added = {key: self._current[key] for key in removed}
+        score = session.apply(removed, added)
+        self.evaluations += 1
+        self._commit(removed, added)
+        if not removed:  # insert：物品离开未放置列表
+            item_def = next(iter(added.values())).item_def
+            self._unplaced.remove(next(u for u in self._unplaced if u.item_def is item_def))
+        return score, list(added), inverse_added
+
+    def _undo_move(self, session, removed: List[Any], added: Dict[Any, Placement]):
+        if not added:  # 撤销 insert
+            self._unplaced.extend(Placement(self._current[key].item_def) for key in removed)
+        session.apply(removed, added)
+        self.evaluations += 1
+        self._commit(removed, added)
+
+    def _estimate_temperature(self, session, score: float) -> float:
+        """
+        Twice the largest score change of a few random moves: the score landscape is
+        rugged (one star hit can be worth most of the layout), so early on even the
+        biggest drops must be accepted often.
+        """
+        largest = 0.0
+        for _ in range(TEMPERATURE_SAMPLES):
+            move = self._propose()
+            if move is None: continue
+            new_score, removed, inverse = self._apply_move(session, *move)
+            largest = max(largest, abs(new_score - score))
+            self._undo_move(session, removed, inverse)
+        return 2.0 * largest if largest > 0 else 1.0
+
+    # --- 主循环 ---
+    def solve(self) -> Tuple[Dict, float]:
+        self._start_clock()
+        layout = self._initial_layout()
+        self._reset_trajectory(layout)
+        session = self.engine.start_session(layout, self.backpack_cols, self.backpack_rows, explain=False)
+        self.evaluations += 1
+        score = session.total_score
+        best_score, best_layout = score, self._new_layout(session.placed_items())
+        self._report_progress(0, self.iterations, best_score, best_layout)
+
+        start_temperature = self.start_temperature or self._estimate_temperature(session, score)
+        end_temperature = min(self.end_temperature, start_temperature)
+        history = [score] * max(1, self.history_length)
+        report_every = max(1, self.iterations // 100)
+        stop_reason = None
+
+        for step in range(1, self.iterations + 1):
+            move = self._propose()
+            if move is not None:
+                new_score, removed, inverse = self._apply_move(session, *move)
+                slot = step % len(history)
+                if self.acceptance == "sa":
+                    # 按迭代进度（有时间预算时按时间进度）几何降温
+                    progress = step / self.iterations
+                    time_left = self._time_left()
+                    if time_left is not None:
+                        progress = max(progress, 1.0 - time_left / self.time_budget_s)
+                    temperature = start_temperature * (end_temperature / start_temperature) ** min(1.0, progress)
+                    accept = new_score >= score or self.rng.random() < math.exp((new_score - score) / temperature)
+                else:
+                    accept = new_score >= score or new_score >= history[slot]
+                if accept:
+                    score = new_score
+                else:
+                    self._undo_move(session, removed, inverse)
+                if self.acceptance == "lahc":
+                    history[slot] = score
+                if score > best_score:
+                    best_score, best_layout = score, self._new_layout(session.placed_items())
+                    self._report_progress(step, self.iterations, best_score, best_layout)
+
+            if step % report_every == 0:
+                self._report_progress(step, self.iterations, best_score, best_layout)
+            stop_reason = self._should_stop(best_score)
+            if stop_reason: break
+
+        return self._finish(best_layout, best_score, stop_reason)
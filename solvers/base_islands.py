@@ -0,0 +1,140 @@
+import multiprocessing
+import queue
+import random
+from typing import Dict, List, Optional, Tuple
+
+# 等待邻居岛屿迁移个体的最长时间；超时则跳过本次迁移，避免某个岛屿出错时整体卡死
+MIGRATION_TIMEOUT_S = 120.0
+# 主进程等待岛屿结果时检查取消请求的间隔
+CANCEL_POLL_S = 0.2
+
+
+def _run_island(solver, index: int, seed: int, mutation_rate: float, inbox, outbox, results, report: bool):
+    """
+    Entry point of one island process: a plain GA run that exchanges its best individuals along a ring.
+    With `report`, every generation is sent to the parent as ("progress", index, generation, best score,
+    encoded best layout or None if unchanged); the run ends with ("done", index, generations run, layout, score, cache, stop reason).
+    """
+    solver.rng = random.Random(seed)
+    solver.mutation_rate = mutation_rate
+    solver.workers = 1  # 岛屿本身就是并行单位
+    interval, migrants = solver.migration_interval, solver.migrants
+    solver._start_clock()  # 每个岛屿各自计时，预算与单种群模式相同
+
+    population = solver._initial_population()
+    best_layout, best_score = {}, -1.0
+    upstream_done = False  # 上游岛屿已停止，不再等待它的迁移个体
+    stop_reason, generation = None, 0
+    for gen in range(solver.generations):
+        generation = gen + 1
+        scored_population = solver._score_population(population)
+        improved = scored_population[0][1] > best_score
+        if improved:
+            best_score = scored_population[0][1]
+            best_layout = scored_population[0][0].copy()
+        if report:
+            # 进度交给主进程的观察者，岛屿进程自己不打印
+            results.put(("progress", index, gen + 1, best_score, solver._encode_layout(best_layout) if improved else None))
+
+        stop_reason = solver._should_stop(best_score)
+        if stop_reason: break
+        population = solver._next_generation(scored_population)
+
+        if (gen + 1) % interval == 0 and gen + 1 < solver.generations:
+            outbox.put([solver._encode_layout(entry[0]) for entry in scored_population[:migrants]])
+            arrivals = []
+            if not upstream_done:
+                time_left = solver._time_left()
+                timeout = MIGRATION_TIMEOUT_S if time_left is None else max(0.0, min(MIGRATION_TIMEOUT_S, time_left))
+                try:
+                    batch = inbox.get(timeout=timeout)
+                except queue.Empty:
+                    batch = []
+                if batch is None:
+                    upstream_done = True
+                else:
+                    arrivals = [solver._decode_layout(encoded) for encoded in batch]
+            # 迁入个体替换队尾的非精英子代
+            if arrivals:
+                population[-len(arrivals):] = arrivals
+
+    outbox.put(None)  # 通知下游岛屿：不会再有迁移个体
+    results.put(("done", index, generation, solver._encode_layout(best_layout), best_score, solver.cache_info(),
+                 stop_reason))
+
+
+class IslandModelMixin:
+    """
+    Island-model mode for population-based solvers (GeneticSolver, GeneticSolverV2).
+    N populations evolve in separate processes with their own seeds and mutation
+    rates; every `migration_interval` generations each island sends its top
+    `migrants` individuals to the next island in a ring.
+
+    The solver provides _initial_population(), _score_population(population)
+    (sorted best first, entries start with (layout, score)) and
+    _next_generation(scored_population), plus the BaseSolver encode / decode helpers.
+    time_budget_s and patience apply to every island separately. Islands send
+    their progress to this process, where it reaches the observers: one step per
+    island generation, out of generations × islands. Cancelling terminates the
+    island processes.
+    """
+    islands: int = 1
+    migration_interval: int = 10
+    migrants: int = 2
+
+    def _island_mutation_rates(self) -> List[float]:
+        """Spreads the mutation rate from 0.5x to 1.5x of the configured rate across the islands."""
+        if self.islands == 1:
+            return [self.mutation_rate]
+        return [min(1.0, self.mutation_rate * (0.5 + i / (self.islands - 1))) for i in range(self.islands)]
+
+    def _solve_islands(self) -> Tuple[Dict, float]:
+        self._start_clock()
+        context = multiprocessing.get_context()
+        inboxes = [context.Queue() for _ in range(self.islands)]
+        results = context.Queue()
+        seeds = [self.rng.randrange(2 ** 31) for _ in range(self.islands)]
+        processes = []
+        for index, mutation_rate in enumerate(self._island_mutation_rates()):
+            process = context.Process(target=_run_island, daemon=True,
+                                      args=(self, index, seeds[index], mutation_rate, inboxes[index],
+                                            inboxes[(index + 1) % self.islands], results, bool(self.observers)))
+            process.start()
+            processes.append(process)
+
+        best_layout: Optional[Dict] = None
+        best_score = -1.0
+        finished = 0
+        generations = [0] * len(processes)
+        total = self.generations * len(processes)
+        stop_reason = None
+        while finished < len(processes):
+            try:
+                message = results.get(timeout=CANCEL_POLL_S)
+            except queue.Empty:
+                if self._cancelled():
+                    # 岛屿进程无法接收线程事件：直接终止，返回已完成岛屿中的最优解
+                    stop_reason = f"cancelled with {finished}/{len(processes)} islands finished"
+                    for process in processes:
+                        process.terminate()
+                    break
+                continue
+            if message[0] == "progress":
+                _, index, generations[index], score, encoded = message
+            else:
+                _, index, generations[index], encoded, score, cache_info, island_stop = message
+                finished += 1
+                # 汇总各岛屿的缓存统计，使 on_finish 的评估次数覆盖所有岛屿
+                self.cache_hits += cache_info['hits']
+                self.cache_misses += cache_info['misses']
+                self.evaluations += cache_info['misses']
+                stop_reason = stop_reason or island_stop
+            if encoded is not None and score > best_score:
+                best_score, best_layout = score, self._decode_layout(encoded)
+            if message[0] == "progress":
+                self._report_progress(sum(generations), total, best_score, best_layout)
+            else:
+                self._steps = sum(generations)  # 最后一代已经作为进度报告过
+        for process in processes:
+            process.join()
+        return self._finish(best_layout if best_layout is not None else {}, best_score, stop_reason)
@@ -0,0 +1,66 @@
+import sys
+from typing import Dict, NamedTuple, Optional
+
+
+class SolverProgress(NamedTuple):
+    """One progress event: iteration `step` of `total`, with the best layout found so far (never mutated later)."""
+    step: int
+    total: int
+    best_score: float
+    best_layout: Dict
+    elapsed_s: float
+    evaluations: int  # engine evaluations since solve() started (cache hits excluded)
+    cache_hits: int
+
+
+class SolverStats(NamedTuple):
+    """Summary passed to on_finish."""
+    best_score: float
+    steps: int
+    elapsed_s: float
+    evaluations: int
+    evaluations_per_s: float
+    cache: Dict[str, int]
+    stop_reason: Optional[str]  # None when the solver ran to completion
+
+    def as_dict(self) -> Dict:
+        return self._asdict()
+
+
+class SolverObserver:
+    """
+    Receives structured progress from BaseSolver. Subclass and override what you
+    need; every method runs in the thread that called solve().
+    """
+    def on_generation(self, solver, progress: SolverProgress):
+        """Called once per iteration (GA generation, placed RL item, finished island)."""
+        pass
+
+    def on_improvement(self, solver, progress: SolverProgress):
+        """Called before on_generation whenever the best score went up."""
+        pass
+
+    def on_finish(self, solver, stats: SolverStats):
+        pass
+
+
+class ConsoleObserver(SolverObserver):
+    """The old per-generation printout, now opt-in. `every` prints only every n-th iteration."""
+    def __init__(self, every: int = 1, stream=None):
+        self.every = max(1, every)
+        self.stream = stream
+
+    def _print(self, text: str):
+        print(text, file=self.stream or sys.stdout)
+
+    def on_generation(self, solver, progress: SolverProgress):
+        if progress.step % self.every and progress.step != progress.total: return
+        requests = progress.cache_hits + progress.evaluations
+        self._print(f"Generation {progress.step}/{progress.total} - Best Score: {progress.best_score:.2f}"
+                    f" (fitness cache hits: {progress.cache_hits}/{requests})")
+
+    def on_finish(self, solver, stats: SolverStats):
+        if stats.stop_reason:
+            self._print(f"Stopping after step {stats.steps}: {stats.stop_reason}")
+        self._print(f"{type(solver).__name__} finished - Best Score: {stats.best_score:.2f} in {stats.elapsed_s:.2f}s"
+                    f" ({stats.evaluations} evaluations, {stats.evaluations_per_s:.0f}/s, fitness cache: {stats.cache})")
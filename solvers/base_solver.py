@@ -1,20 +1,115 @@
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from typing import List, Dict, Tuple, Optional
-import copy
+import math
+import os
 import random
+import time
+
+from engine import Item, ItemDef, CalculationEngine, EngineProfiler, EvaluationResult, Layout, Placement, as_placement, placement_fits
+from solvers.base_observers import SolverObserver, SolverProgress, SolverStats
+
+# 编码后的布局：((key, def_index, rotation, gx, gy), ...)，可廉价地在进程间传递
+EncodedLayout = Tuple[Tuple[object, int, int, int, int], ...]
+
+# --- 工作进程状态：由 _init_worker 在每个进程启动时设置一次 ---
+_worker_defs: Tuple[ItemDef, ...] = ()
+_worker_engine: Optional[CalculationEngine] = None
+_worker_size: Tuple[int, int] = (0, 0)
+
+
+def _init_worker(item_defs: Tuple[ItemDef, ...], backpack_cols: int, backpack_rows: int):
+    global _worker_defs, _worker_engine, _worker_size
+    _worker_defs = item_defs
+    _worker_engine = CalculationEngine()
+    _worker_size = (backpack_cols, backpack_rows)
+
+
+def _evaluate_encoded(encoded: EncodedLayout) -> EvaluationResult:
+    """Worker-side fitness evaluation of one encoded layout."""
+    layout = {key: Placement(_worker_defs[def_index], rotation, gx, gy)
+              for key, def_index, rotation, gx, gy in encoded}
+    return _worker_engine.run(layout, *_worker_size, explain=False)
 
-from engine import Item, CalculationEngine, GridType
 
 class BaseSolver(ABC):
     """
     Abstract base class for all backpack layout solvers.
     """
-    def __init__(self, items: List[Item], backpack_cols: int, backpack_rows: int):
-        # --- OPTIMIZATION: Create data-only clones for the solver to use ---
-        self.items_to_place = [item.clone(visuals=False) for item in items]
+    def __init__(self, items: List[Item], backpack_cols: int, backpack_rows: int,
+                 time_budget_s: Optional[float] = None, patience: Optional[int] = None, min_delta: float = 0.0,
+                 seed: Optional[int] = None):
+        # --- OPTIMIZATION: Solvers work on immutable Placements, never on sprites ---
+        self.items_to_place: List[Placement] = [as_placement(item) for item in items]
         self.backpack_cols = backpack_cols
         self.backpack_rows = backpack_rows
         self.engine = CalculationEngine()
+        # 每个求解器使用自己的随机数生成器：相同的 seed 得到相同的结果，不受全局 random 的影响
+        self.seed = seed
+        self.rng = random.Random(seed)
+        # Worker processes used by _evaluate_population (1 = evaluate in this process)
+        self.workers = 1
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_workers = 0
+        self.item_defs: List[ItemDef] = list(dict.fromkeys(item.item_def for item in self.items_to_place))
+        self._def_index = {item_def: index for index, item_def in enumerate(self.item_defs)}
+        # Bounded LRU fitness cache keyed by _layout_signature (0 disables it)
+        self.fitness_cache_size = 4096
+        self._fitness_cache: "OrderedDict[frozenset, EvaluationResult]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Engine evaluations: full runs plus incremental ScoringSession updates
+        self.evaluations = 0
+        # Stopping rules: wall-clock budget per solve, and convergence (no gain above
+        # min_delta for `patience` iterations). solve() returns the best found so far.
+        self.time_budget_s = time_budget_s
+        self.patience = patience
+        self.min_delta = min_delta
+        self._deadline: Optional[float] = None
+        self._best_seen: Optional[float] = None
+        self._stale_steps = 0
+        # Progress reporting (see add_observer) and cancellation: cancel_event (a
+        # threading.Event) stops the solve at the next iteration with the best result so far.
+        self.observers: List[SolverObserver] = []
+        self.cancel_event = None
+        self.last_stats: Optional[SolverStats] = None
+        # 精确求解器证明的分数上界（启发式求解器为 None）
+        self.bound: Optional[float] = None
+        self.profiler: Optional[EngineProfiler] = None  # see enable_profiling
+        self._solve_start = 0.0
+        self._steps = 0
+        self._reported_best: Optional[float] = None
+        self._hits_at_start = 0
+        self._evaluations_at_start = 0
+
+    def __getstate__(self):
+        # 观察者、线程事件和剖析器不能（也不需要）跟着求解器进入子进程
+        state = self.__dict__.copy()
+        state['observers'] = []
+        state['cancel_event'] = None
+        state['profiler'] = None
+        state['engine'] = CalculationEngine()
+        state.pop('_is_placement_valid', None)
+        return state
+
+    def add_observer(self, observer: SolverObserver) -> SolverObserver:
+        self.observers.append(observer)
+        return observer
+
+    def enable_profiling(self, profiler: Optional[EngineProfiler] = None) -> EngineProfiler:
+        """
+        Records engine phase timings and placement-validator calls of the following
+        solves in self.profiler (read profiler.report() afterwards). Evaluations that
+        run in a worker pool or island process are not included.
+        """
+        self.profiler = profiler or EngineProfiler()
+        self.engine.profiler = self.profiler
+        # 实例属性覆盖方法：未开启剖析时没有额外开销
+        self.__dict__.pop('_is_placement_valid', None)
+        self._is_placement_valid = self.profiler.wrap("placement_valid", self._is_placement_valid)
+        return self.profiler
 
     @abstractmethod
     def solve(self) -> Tuple[Dict, float]:
@@ -23,12 +118,73 @@ class BaseSolver(ABC):
         This must be implemented by all child classes.
         Returns:
             A tuple containing:
-            - The best layout found (a dictionary of placed items).
+            - The best layout found (a dictionary of Placements).
             - The best score achieved.
         """
         pass
 
-    def _get_random_valid_position(self, item: Item) -> Optional[Tuple[int, int]]:
+    def _start_clock(self):
+        """Starts the time budget and resets convergence tracking; call at the start of solve()."""
+        self._solve_start = time.monotonic()
+        self._deadline = self._solve_start + self.time_budget_s if self.time_budget_s is not None else None
+        self._best_seen = None
+        self._stale_steps = 0
+        self._steps = 0
+        self._reported_best = None
+        self._hits_at_start, self._evaluations_at_start = self.cache_hits, self.evaluations
+
+    def _time_left(self) -> Optional[float]:
+        """Seconds left of the time budget, or None without a budget."""
+        return None if self._deadline is None else self._deadline - time.monotonic()
+
+    def _out_of_time(self) -> bool:
+        return self._deadline is not None and time.monotonic() >= self._deadline
+
+    def _cancelled(self) -> bool:
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def _report_progress(self, step: int, total: int, best_score: float, best_layout: Dict):
+        """Call once per iteration; best_layout must not be mutated afterwards (observers may keep it)."""
+        self._steps = step
+        if not self.observers: return
+        progress = SolverProgress(step, total, best_score, best_layout, time.monotonic() - self._solve_start,
+                                  self.evaluations - self._evaluations_at_start, self.cache_hits - self._hits_at_start)
+        improved = self._reported_best is None or best_score > self._reported_best
+        self._reported_best = best_score if improved else self._reported_best
+        for observer in self.observers:
+            if improved:
+                observer.on_improvement(self, progress)
+            observer.on_generation(self, progress)
+
+    def _finish(self, best_layout: Dict, best_score: float, stop_reason: Optional[str] = None) -> Tuple[Dict, float]:
+        """Records last_stats, notifies the observers and returns solve()'s result unchanged."""
+        elapsed = time.monotonic() - self._solve_start
+        evaluations = self.evaluations - self._evaluations_at_start
+        self.last_stats = SolverStats(best_score, self._steps, elapsed, evaluations,
+                                      evaluations / elapsed if elapsed > 0 else 0.0, self.cache_info(), stop_reason)
+        for observer in self.observers:
+            observer.on_finish(self, self.last_stats)
+        return best_layout, best_score
+
+    def _should_stop(self, best_score: float) -> Optional[str]:
+        """
+        Call once per iteration (generation) with the best score so far.
+        Returns the reason to stop, or None to keep going.
+        """
+        if self._best_seen is None or best_score > self._best_seen + self.min_delta:
+            self._best_seen = best_score
+            self._stale_steps = 0
+        else:
+            self._stale_steps += 1
+        if self._cancelled():
+            return "cancelled"
+        if self._out_of_time():
+            return f"time budget of {self.time_budget_s:.1f}s used"
+        if self.patience is not None and self._stale_steps >= self.patience:
+            return f"no improvement above {self.min_delta} in {self.patience} iterations"
+        return None
+
+    def _get_random_valid_position(self, item: Placement) -> Optional[Tuple[int, int]]:
         """
         Calculates a random (gx, gy) where the item's body fits in the backpack.
         Returns None if the item's body is too large to ever fit.
@@ -52,37 +208,151 @@ class BaseSolver(ABC):
         if gx_min > gx_max or gy_min > gy_max:
              return None
 
-        gx = random.randint(gx_min, gx_max)
-        gy = random.randint(gy_min, gy_max)
+        gx = self.rng.randint(gx_min, gx_max)
+        gy = self.rng.randint(gy_min, gy_max)
 
         return (gx, gy)
 
-    def _is_placement_valid(self, item_to_place: Item, gx: int, gy: int, placed_items: Dict) -> bool:
-        """A helper utility to check for overlaps and boundaries."""
-        occupied_cells = set()
-        for p_item in placed_items.values():
-            px, py = p_item.gx, p_item.gy
-            for r, row in enumerate(p_item.shape_matrix):
-                for c, cell in enumerate(row):
-                    if cell == GridType.OCCUPIED:
-                        occupied_cells.add((px + c, py + r))
+    def _get_center_out_path(self) -> List[Tuple[int, int]]:
+        """Creates a list of all grid coordinates, sorted by distance from the center."""
+        center_x = (self.backpack_cols - 1) / 2.0
+        center_y = (self.backpack_rows - 1) / 2.0
+        
+        all_coords = [(x, y) for x in range(self.backpack_cols) for y in range(self.backpack_rows)]
         
-        for r, row in enumerate(item_to_place.shape_matrix):
-            for c, cell in enumerate(row):
-                if cell == GridType.OCCUPIED:
-                    ax, ay = gx + c, gy + r
-                    if not(0 <= ax < self.backpack_cols and 0 <= ay < self.backpack_rows):
-                        return False
-                    if (ax, ay) in occupied_cells:
-                        return False
-        return True
+        # Sort coordinates by their Euclidean distance to the center
+        all_coords.sort(key=lambda coord: math.dist((coord[0], coord[1]), (center_x, center_y)))
+        
+        return all_coords
+
+    def _candidate_placements(self, item: Placement) -> List[Placement]:
+        """Every (distinct rotation, gx, gy) of an item whose body lies inside the backpack."""
+        candidates = []
+        for rotation in item.item_def.distinct_rotations:
+            variant = item._replace(rotation=rotation)
+            bounds = variant.get_body_bounds()
+            if not bounds: continue
+            min_r, min_c, max_r, max_c = bounds
+            for gy in range(-min_r, self.backpack_rows - max_r):
+                for gx in range(-min_c, self.backpack_cols - max_c):
+                    candidates.append(variant.at(gx, gy))
+        return candidates
+
+    def _is_placement_valid(self, item_to_place: Placement, gx: int, gy: int, placed_items: Dict) -> bool:
+        """A helper utility to check for overlaps and boundaries."""
+        return placement_fits(item_to_place, gx, gy, placed_items, self.backpack_cols, self.backpack_rows)
+
+    def _new_layout(self, items: Optional[Dict] = None) -> Layout:
+        """Creates an empty (or pre-filled) layout that tracks its occupancy bitboard."""
+        return Layout(self.backpack_cols, self.backpack_rows, items)
+
+    def _to_placements(self, layout: Dict) -> Layout:
+        """Converts a layout of Item sprites (e.g. the initial layout from the UI) into Placements."""
+        return self._new_layout({key: as_placement(item) for key, item in layout.items()})
+
+    def _layout_signature(self, layout: Dict) -> frozenset:
+        """
+        Canonical identity of a layout, independent of dict order: one
+        (key, item definition, shape rotation, gx, gy) entry per item. Rotations
+        that give the same shape (symmetric items) share a signature.
+        """
+        return frozenset((key, item.item_def, item.item_def.rotations[item.rotation].rotation, item.gx, item.gy)
+                         for key, item in layout.items())
+
+    def _cache_get(self, signature: frozenset) -> Optional[EvaluationResult]:
+        result = self._fitness_cache.get(signature)
+        if result is not None:
+            self._fitness_cache.move_to_end(signature)
+        return result
+
+    def _cache_put(self, signature: frozenset, result: EvaluationResult):
+        if self.fitness_cache_size <= 0: return
+        self._fitness_cache[signature] = result
+        if len(self._fitness_cache) > self.fitness_cache_size:
+            self._fitness_cache.popitem(last=False)
+
+    def cache_info(self) -> Dict[str, int]:
+        """Fitness cache statistics: hits, misses and current / maximum size."""
+        return {"hits": self.cache_hits, "misses": self.cache_misses,
+                "size": len(self._fitness_cache), "max_size": self.fitness_cache_size}
+
+    def _evaluate(self, layout: Dict) -> EvaluationResult:
+        """Scores a layout without copying it; per-item results are keyed like the layout."""
+        signature = self._layout_signature(layout)
+        result = self._cache_get(signature)
+        if result is not None:
+            self.cache_hits += 1
+            return result
+        self.cache_misses += 1
+        self.evaluations += 1
+        result = self.engine.run(layout, self.backpack_cols, self.backpack_rows, explain=False)
+        self._cache_put(signature, result)
+        return result
 
     def _calculate_score(self, layout: Dict) -> Tuple[float, List]:
         """A helper utility to calculate the score of a given layout."""
         if not layout:
             return 0.0, []
-        calc_layout = {key: item.clone() for key, item in layout.items()}
-        self.engine.run(calc_layout, self.backpack_cols, self.backpack_rows)
-        item_scores = sum(item.final_score for item in calc_layout.values())
-        total_score = item_scores + self.engine.neutral_pool_total
-        return total_score, self.engine.interaction_map
\ No newline at end of file
+        result = self._evaluate(layout)
+        return result.total_score, result.interaction_map
+
+    def _encode_layout(self, layout: Dict) -> EncodedLayout:
+        """Compact, picklable form of a layout; definitions are sent once per worker, not per layout."""
+        return tuple((key, self._def_index[item.item_def], item.rotation, item.gx, item.gy)
+                     for key, item in layout.items())
+
+    def _decode_layout(self, encoded: EncodedLayout) -> Layout:
+        """Inverse of _encode_layout (for solvers that share the same item_defs order)."""
+        return self._new_layout({key: Placement(self.item_defs[def_index], rotation, gx, gy)
+                                 for key, def_index, rotation, gx, gy in encoded})
+
+    @contextmanager
+    def _worker_pool(self):
+        """
+        Keeps a process pool alive for the duration of a solve when self.workers > 1
+        (workers = 0 or None uses every core). Without a pool this is a no-op.
+        """
+        workers = self.workers or os.cpu_count() or 1
+        if workers <= 1:
+            yield
+            return
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(tuple(self.item_defs), self.backpack_cols, self.backpack_rows)) as pool:
+            self._pool, self._pool_workers = pool, workers
+            try:
+                yield
+            finally:
+                self._pool, self._pool_workers = None, 0
+
+    def _evaluate_population(self, population: List[Dict]) -> List[EvaluationResult]:
+        """
+        Scores every layout of a population. Cached layouts (e.g. carried-over
+        elites) and duplicates within the population are evaluated once; the
+        rest run in the worker pool if one is running.
+        """
+        signatures = [self._layout_signature(layout) for layout in population]
+        known: Dict[frozenset, EvaluationResult] = {}
+        pending: Dict[frozenset, Dict] = {}
+        for signature, layout in zip(signatures, population):
+            if signature in known or signature in pending: continue
+            result = self._cache_get(signature)
+            if result is None:
+                pending[signature] = layout
+            else:
+                known[signature] = result
+        self.cache_misses += len(pending)
+        self.evaluations += len(pending)
+        self.cache_hits += len(population) - len(pending)
+
+        if pending:
+            if self._pool is None:
+                fresh = [self.engine.run(layout, self.backpack_cols, self.backpack_rows, explain=False)
+                         for layout in pending.values()]
+            else:
+                encoded = [self._encode_layout(layout) for layout in pending.values()]
+                chunksize = max(1, len(encoded) // (self._pool_workers * 4))
+                fresh = self._pool.map(_evaluate_encoded, encoded, chunksize=chunksize)
+            for signature, result in zip(pending, fresh):
+                known[signature] = result
+                self._cache_put(signature, result)
+        return [known[signature] for signature in signatures]
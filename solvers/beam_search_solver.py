@@ -0,0 +1,116 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from solvers.base_solver import BaseSolver
+from engine import Item, Placement
+from bitboard import popcount
+
+
+class _Partial(NamedTuple):
+    """One partial layout of the beam: placed items in insertion order, plus its bitboards."""
+    items: Tuple[Tuple[Tuple[int, int], Placement], ...]
+    occupancy: int
+    hotspots: int  # 已放物品的星星覆盖、但还空着的格子
+    score: float
+    rank: float   # score + 剩余潜力的估计
+
+
+class BeamSearchSolver(BaseSolver):
+    """
+    Algorithm I: deterministic constructive beam search.
+    Places the items one at a time (star sources and large items first) and keeps
+    the `beam_width` best partial layouts, ranked by their engine score plus
+    `hotspot_weight` per open star cell that the remaining items could still fill.
+    An item's candidate positions are ranked like GeneticSolver's crossover ranks
+    them (stars landing on placed items, body on synergy hotspots) and then by the
+    center-out path of GeneticSolverV2; only the best `candidates` of them are
+    scored per partial layout, so a solve costs about
+    beam_width × items × candidates engine evaluations.
+    The result is a good initial_layout for the genetic solvers.
+    """
+    def __init__(self, items: List[Item], backpack_cols: int, backpack_rows: int,
+                 beam_width: int = 8, candidates: int = 16, hotspot_weight: float = 1.0,
+                 initial_layout: Optional[Dict] = None, time_budget_s: Optional[float] = None,
+                 seed: Optional[int] = None):
+        super().__init__(items, backpack_cols, backpack_rows, time_budget_s, None, 0.0, seed)
+        self.beam_width = max(1, beam_width)
+        self.candidates = max(1, candidates)
+        self.hotspot_weight = hotspot_weight
+        self.initial_layout = self._to_placements(initial_layout) if initial_layout else None
+        # 每个格子在中心向外路径上的序号
+        self.center_rank = [0] * (backpack_cols * backpack_rows)
+        for rank, (x, y) in enumerate(self._get_center_out_path()):
+            self.center_rank[y * backpack_cols + x] = rank
+
+    def _order(self) -> List[Placement]:
+        """Star sources first (they create the hotspots), then larger bodies (harder to fit later)."""
+        def key(item: Placement):
+            variant = item.item_def.rotations[0]
+            return (-len(variant.star_cells), -len(variant.body_cells), item.name)
+        return sorted(self.items_to_place, key=key)
+
+    def _positions(self, item: Placement) -> List[Tuple[Placement, object, float]]:
+        """Every in-bounds placement with its anchored masks and its center-out rank."""
+        positions = []
+        for candidate in self._candidate_placements(item):
+            masks = candidate.get_masks(self.backpack_cols, self.backpack_rows).at(candidate.gx, candidate.gy)
+            center = sum(self.center_rank[index] for index in masks.body_indices) / len(masks.body_indices)
+            positions.append((candidate, masks, center))
+        return positions
+
+    def _expand(self, partial: _Partial, positions, remaining_cells: int) -> List[_Partial]:
+        """Scores the most promising placements of the next item on top of one partial layout."""
+        ranked = []
+        for candidate, masks, center in positions:
+            if masks.body & partial.occupancy: continue
+            synergy = popcount(masks.star_union & partial.occupancy) + popcount(masks.body & partial.hotspots)
+            ranked.append((-synergy, center, len(ranked), candidate, masks))
+        ranked.sort(key=lambda entry: entry[:3])
+
+        children = []
+        session = self.engine.start_session(dict(partial.items), self.backpack_cols, self.backpack_rows, explain=False)
+        self.evaluations += 1
+        for _, _, _, candidate, masks in ranked[:self.candidates]:
+            offset_c, offset_r = candidate.get_body_offset()
+            key = (candidate.gx + offset_c, candidate.gy + offset_r)
+            score = session.add(key, candidate)
+            session.remove(key)
+            self.evaluations += 2
+            occupancy = partial.occupancy | masks.body
+            hotspots = (partial.hotspots | masks.star_union) & ~occupancy
+            rank = score + self.hotspot_weight * min(popcount(hotspots), remaining_cells)
+            children.append(_Partial(partial.items + ((key, candidate),), occupancy, hotspots, score, rank))
+        return children
+
+    def solve(self) -> Tuple[Dict, float]:
+        self._start_clock()
+        order = self._order()
+        total = len(order)
+        best_layout, best_score = self._new_layout(), 0.0
+        if self.initial_layout:
+            best_score, _ = self._calculate_score(self.initial_layout)
+            best_layout = self.initial_layout.copy()
+        self._report_progress(0, total, best_score, best_layout)
+
+        beam = [_Partial((), 0, 0, 0.0, 0.0)]
+        remaining_cells = sum(len(item.variant.body_cells) for item in order)
+        stop_reason = None
+        for step, item in enumerate(order, 1):
+            remaining_cells -= len(item.variant.body_cells)
+            positions = self._positions(item)
+            # 放不下这个物品的部分布局原样保留（跳过该物品）
+            children: Dict[frozenset, _Partial] = {}
+            for partial in beam:
+                expanded = self._expand(partial, positions, remaining_cells) or [partial]
+                for child in expanded:
+                    # 同一布局只保留一次（键与 _layout_signature 相同）
+                    children.setdefault(self._layout_signature(dict(child.items)), child)
+            beam = sorted(children.values(), key=lambda partial: -partial.rank)[:self.beam_width]
+
+            leader = max(beam, key=lambda partial: partial.score)
+            if leader.score > best_score:
+                best_score, best_layout = leader.score, self._new_layout(dict(leader.items))
+            self._report_progress(step, total, best_score, best_layout)
+            stop_reason = self._should_stop(best_score)
+            if stop_reason: break
+
+        return self._finish(best_layout, best_score, stop_reason)
@@ -0,0 +1,499 @@
+import itertools
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from solvers.base_solver import BaseSolver
+from engine import Item
+from bitboard import STAR_TYPES, iter_bits, popcount
+
+# 剪枝时的浮点容差
+EPSILON = 1e-6
+# 每搜索这么多个节点检查一次停止条件（时间预算 / 取消 / patience）
+CHECK_EVERY = 256
+REPORT_EVERY = 4096
+
+
+class _Potential(NamedTuple):
+    """Best case of one possible interaction: adds to the source, the target and the neutral pool, and multiplier ranges."""
+    add_source: float
+    add_target: float
+    pool: float
+    source_factor: Tuple[float, float]  # (最小, 最大)
+    target_factor: Tuple[float, float]
+
+    def optimistic(self) -> "_Potential":
+        """The interaction may still not happen: nothing is worse than no effect."""
+        return _Potential(max(0.0, self.add_source), max(0.0, self.add_target), max(0.0, self.pool),
+                          (min(1.0, self.source_factor[0]), max(1.0, self.source_factor[1])),
+                          (min(1.0, self.target_factor[0]), max(1.0, self.target_factor[1])))
+
+
+NO_EFFECT = _Potential(0.0, 0.0, 0.0, (1.0, 1.0), (1.0, 1.0))
+
+
+def _value_range(effect, max_activated: Dict) -> Optional[Tuple[float, float]]:
+    """Smallest and largest value an effect can take (dynamic values over 0..max activated stars)."""
+    if effect.per_star is None:
+        return None if effect.number is None else (effect.number, effect.number)
+    if not isinstance(effect.base, (int, float)): return None
+    ends = (effect.base, effect.base + effect.per_star_add * max_activated.get(effect.per_star, 0))
+    return min(ends), max(ends)
+
+
+def _potential(effects, max_activated: Dict, has_target: bool = True) -> _Potential:
+    """Combines the effect that fires in each possible target state (None: no effect) into one best case."""
+    add_source, add_target, pool = [], [], []
+    source_factors, target_factors = [(1.0, 1.0)], [(1.0, 1.0)]
+    for effect in effects:
+        value = _value_range(effect, max_activated) if effect is not None and effect.scoring else None
+        kind = effect.effect if value is not None else None
+        add_source.append(value[1] if kind == "ADD_SCORE_TO_SELF" else 0.0)
+        add_target.append(value[1] if kind == "ADD_SCORE_TO_TARGET" and has_target else 0.0)
+        pool.append(value[1] if kind == "ADD_TO_NEUTRAL_POOL" else 0.0)
+        if kind == "MULTIPLY_SCORE_OF_SELF":
+            source_factors.append(value)
+        elif kind == "MULTIPLY_SCORE_OF_TARGET" and has_target:
+            target_factors.append(value)
+    # 没有效果的状态相当于乘以 1：只有所有状态都带乘法时才去掉 (1, 1)
+    if len(source_factors) > len(effects): source_factors.pop(0)
+    if len(target_factors) > len(effects): target_factors.pop(0)
+    return _Potential(max(add_source, default=0.0), max(add_target, default=0.0), max(pool, default=0.0),
+                      (min(f[0] for f in source_factors), max(f[1] for f in source_factors)),
+                      (min(f[0] for f in target_factors), max(f[1] for f in target_factors)))
+
+
+class BranchAndBoundSolver(BaseSolver):
+    """
+    Algorithm H: exhaustive depth-first branch and bound, no extra dependencies.
+    Items are decided one at a time, the ones that take part in interactions first,
+    then the most constrained (fewest free positions); each is placed at one of its
+    positions or left out. A branch is pruned when an optimistic bound (base scores
+    plus the best bonuses every interaction that can still happen could give,
+    precomputed from star_effects and passive_effects) cannot beat the best layout
+    found, which starts from a greedy layout (warm_start). Copies of one
+    item take positions in a fixed order and the 180° turn of the backpack is
+    skipped. When the search finishes the layout is optimal; when it stops early
+    `bound` is the best score any layout could reach.
+
+    Size limit: sets with few synergies are proven at about 10 items (the medium
+    benchmark set in under a minute), but the bound is loose when many multipliers
+    overlap, so synergy-dense sets stop being provable around 7-8 items; ExactSolver
+    handles those.
+    """
+    def __init__(self, items: List[Item], backpack_cols: int, backpack_rows: int,
+                 initial_layout: Optional[Dict] = None, warm_start: bool = True, time_budget_s: Optional[float] = None,
+                 patience: Optional[int] = None, min_delta: float = 0.0, seed: Optional[int] = None):
+        super().__init__(items, backpack_cols, backpack_rows, time_budget_s, patience, min_delta, seed)
+        self.initial_layout = self._to_placements(initial_layout) if initial_layout else None
+        self.warm_start = warm_start
+        self.nodes = 0
+        self._precompute()
+
+    # --- 预处理 ---
+    def _precompute(self):
+        items, cols, rows = self.items_to_place, self.backpack_cols, self.backpack_rows
+        n = len(items)
+        self._candidates = []
+        for item in items:
+            placements = self._candidate_placements(item)
+            self._candidates.append([(p, p.get_masks(cols, rows).at(p.gx, p.gy)) for p in placements])
+        self._base = [float(item.base_score) for item in items]
+        # 同一物品的多个副本：按编号依次决定，位置编号递增
+        self._previous_copy: List[Optional[int]] = [None] * n
+        last: Dict[object, int] = {}
+        for i, item in enumerate(items):
+            self._previous_copy[i] = last.get(item.item_def)
+            last[item.item_def] = i
+        # 位置集合用整数位掩码表示（第 p 位 = 第 p 个位置）：covering[i][cell] 是身体覆盖 cell 的位置，
+        # star_cover[i][star_type][cell] 是该类型星星落在 cell 上的位置
+        cells = cols * rows
+        self._all, self._canonical, self._covering, self._star_cover = [], [], [], []
+        for candidates in self._candidates:
+            covering = [0] * cells
+            star_cover = {star_type: [0] * cells for star_type in STAR_TYPES}
+            for p, (_, masks) in enumerate(candidates):
+                for cell in masks.body_indices:
+                    covering[cell] |= 1 << p
+                for star_type in STAR_TYPES:
+                    for cell in iter_bits(masks.stars[star_type]):
+                        star_cover[star_type][cell] |= 1 << p
+            twins = self._turned_twins(candidates)
+            self._all.append((1 << len(candidates)) - 1)
+            self._canonical.append(sum(1 << p for p, twin in enumerate(twins) if twin is None or twin >= p))
+            self._covering.append(covering)
+            self._star_cover.append(star_cover)
+        # 每个位置身体周围的一圈格子（rims）以及贴着背包边缘的格子数（walls），用于紧凑排列
+        self._rims, self._walls = [], []
+        for candidates in self._candidates:
+            rims, walls = [], []
+            for _, masks in candidates:
+                rim, wall = 0, 0
+                for index in masks.body_indices:
+                    x, y = index % cols, index // cols
+                    for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+                        if 0 <= nx < cols and 0 <= ny < rows:
+                            rim |= 1 << (ny * cols + nx)
+                        else:
+                            wall += 1
+                rims.append(rim & ~masks.body)
+                walls.append(wall)
+            self._rims.append(rims)
+            self._walls.append(walls)
+
+        # 每个目标可能获得的临时元素，及其所有组合（目标状态）
+        addable = [set() for _ in items]
+        for i, item in enumerate(items):
+            for groups in item.get_plan().element_groups.values():
+                for j, target in enumerate(items):
+                    if j == i: continue
+                    for group in groups:
+                        effect = next((e for e in group if e.matches(target.item_def, [])), None)
+                        if effect is not None and effect.element is not None and effect.element not in target.elements:
+                            addable[j].add(effect.element)
+        states = [[list(subset) for size in range(len(elements) + 1)
+                   for subset in itertools.combinations(sorted(elements, key=lambda e: e.name), size)]
+                  for elements in addable]
+
+        max_stars = [{star_type: max((popcount(masks.stars[star_type]) for _, masks in candidates), default=0)
+                      for star_type in STAR_TYPES} for candidates in self._candidates]
+        self._max_stars = max_stars
+        max_activated = []
+        for i, item in enumerate(items):
+            plan = item.get_plan()
+            activated = {}
+            for star_type, groups in plan.star_groups.items():
+                empty_groups = sum(1 for group in groups if any(e.when_empty for e in group))
+                activated[star_type] = min(n - 1, max_stars[i][star_type]) + empty_groups * max_stars[i][star_type]
+            max_activated.append(activated)
+
+        # (源, 星星类型, 目标, 确定发生时的最好情况, 可能发生时的最好情况)
+        self._pairs = []
+        self._empties = []
+        self._passives = []
+        self._safe = True
+        for i, item in enumerate(items):
+            plan = item.get_plan()
+            for star_type, effects in plan.star_effects.items():
+                for j, target in enumerate(items):
+                    if j == i: continue
+                    fired = [next((e for e in effects if e.matches(target.item_def, state)), None)
+                             for state in states[j]]
+                    self._add_pair(self._pairs, (i, star_type, j), _potential(fired, max_activated[i]))
+                if star_type in plan.empty_types:
+                    effect = next(e for e in effects if e.when_empty)
+                    potential = _potential([effect], max_activated[i], has_target=False)
+                    if potential != NO_EFFECT:
+                        self._check_factors(potential)
+                        self._empties.append((i, star_type, potential, max_stars[i][star_type]))
+            for effect in plan.passives:
+                if not effect.scoring: continue
+                for j, target in enumerate(items):
+                    fired = [effect if effect.matches(target.item_def, state) else None for state in states[j]]
+                    self._add_pair(self._passives, (i, j), _potential(fired, max_activated[i]))
+
+        # 参与交互的物品先决定：其余物品只需放得下，不改变上界
+        # 没有这种星星的源、以及只会乘一个永远 0 分的物品的交互，都不可能加分
+        self._pairs = [entry for entry in self._pairs if max_stars[entry[0]][entry[1]]]
+        scoring = [base > 0 for base in self._base]
+        for i, _, j, _, potential in self._pairs:
+            scoring[i] = scoring[i] or potential.add_source > 0
+            scoring[j] = scoring[j] or potential.add_target > 0
+        for i, j, _, potential in self._passives:
+            scoring[i] = scoring[i] or potential.add_source > 0
+            scoring[j] = scoring[j] or potential.add_target > 0
+        for i, _, potential, _ in self._empties:
+            scoring[i] = scoring[i] or potential.add_source > 0
+        self._pairs = [(i, star_type, j, decided, best) for i, star_type, j, decided, best in self._pairs
+                       if best.pool > 0 or best.add_source > 0 or best.add_target > 0 or
+                       (scoring[i] and best.source_factor != (1.0, 1.0)) or
+                       (scoring[j] and best.target_factor != (1.0, 1.0))]
+        self._linked = [False] * n
+        for entry in self._pairs + self._passives:
+            self._linked[entry[0]] = self._linked[entry[-3]] = True
+        for entry in self._empties:
+            self._linked[entry[0]] = True
+
+    def _add_pair(self, pairs: list, key: tuple, potential: _Potential):
+        if potential == NO_EFFECT: return
+        self._check_factors(potential)
+        pairs.append(key + (potential, potential.optimistic()))
+
+    def _check_factors(self, potential: _Potential):
+        # 负的乘数会让上界失效：此时不剪枝（仍然是穷举）
+        if potential.source_factor[0] < 0 or potential.target_factor[0] < 0:
+            self._safe = False
+
+    def _turned_twins(self, candidates) -> List[Optional[int]]:
+        """For each position, the index of the same item turned 180° with the whole backpack."""
+        cells = self.backpack_cols * self.backpack_rows
+
+        def turned(mask: int) -> int:
+            return int(format(mask, f"0{cells}b")[::-1], 2)
+
+        index = {(masks.body,) + tuple(masks.stars[t] for t in STAR_TYPES): p for p, (_, masks) in enumerate(candidates)}
+        return [index.get((turned(masks.body),) + tuple(turned(masks.stars[t]) for t in STAR_TYPES))
+                for _, masks in candidates]
+
+    # --- 上界 ---
+    def _bound(self) -> float:
+        """
+        Upper bound on the score of every layout that completes the current decisions.
+        Interactions that are decided (both items placed) count as they are; undecided
+        ones count at their best. A star type of one item can reach at most as many
+        targets as it has free star cells, so beyond that the smallest gains are taken off
+        again: with non-negative scores the total is supermodular in the interactions,
+        so a gain measured without the other undecided interactions is never too large.
+        """
+        if not self._safe:
+            return float('inf')
+        masks, occupancy = self._masks, self._occupancy
+        n = len(masks)
+        # 未决定的物品若已没有空位，就和不放一样（dead）
+        free = [0 if masks[i] is not None or self._skipped[i] else self._all[i] & ~self._blocked[i] for i in range(n)]
+        dead = [masks[i] is None and not free[i] for i in range(n)]
+        add = [0.0 if dead[i] else self._base[i] for i in range(n)]
+        high, low = [1.0] * n, [1.0] * n
+        pool = 0.0
+        undecided: Dict[tuple, list] = {}  # (源, 星星类型) -> [(目标, 最好情况)]
+        for i, star_type, j, decided, optimistic in self._pairs:
+            if dead[i] or dead[j]: continue
+            source, target = masks[i], masks[j]
+            if source is not None and target is not None:
+                if source.stars[star_type] & target.body:
+                    pool += self._apply(add, high, low, i, j, decided)
+                continue
+            # 源物品的星星还能落到目标物品的身体上吗（两者都按剩余的空位置算）
+            if not self._reachable(i, star_type, j, free): continue
+            undecided.setdefault((i, star_type), []).append((j, optimistic))
+        for i, j, decided, optimistic in self._passives:
+            if dead[i] or dead[j]: continue
+            both_placed = masks[i] is not None and masks[j] is not None
+            pool += self._apply(add, high, low, i, j, decided if both_placed else optimistic)
+        for i, star_type, per_cell, most in self._empties:
+            if dead[i]: continue
+            count = popcount(masks[i].stars[star_type] & ~occupancy) if masks[i] is not None else most
+            add[i] += max(0.0, count * per_cell.add_source)
+            pool += max(0.0, count * per_cell.pool)
+            low[i] *= min(1.0, per_cell.source_factor[0]) ** count
+            high[i] *= max(1.0, per_cell.source_factor[1]) ** count
+
+        # 超出星星格数量的未决定交互：去掉增益最小的那些
+        excess = 0.0
+        for (i, star_type), events in undecided.items():
+            capacity = (popcount(masks[i].stars[star_type] & ~occupancy) if masks[i] is not None
+                        else self._max_stars[i][star_type])
+            if len(events) <= capacity: continue
+            gains = sorted(self._gain(add, high, i, j, potential) for j, potential in events)
+            excess += sum(gains[:len(events) - capacity])
+        for (i, _), events in undecided.items():
+            for j, potential in events:
+                pool += self._apply(add, high, low, i, j, potential)
+
+        total = pool - excess
+        for i in range(n):
+            if dead[i]: continue
+            best = add[i] * high[i] if add[i] >= 0 else add[i] * low[i]
+            total += best if masks[i] is not None else max(0.0, best)  # 未决定的物品也可以不放
+        return total
+
+    def _reachable(self, i: int, star_type, j: int, free: List[int]) -> bool:
+        """Can a star of `star_type` of item i still land on item j's body (each on one of its remaining positions)?"""
+        source, target = self._masks[i], self._masks[j]
+        star_cover, covering = self._star_cover[i][star_type], self._covering[j]
+        if source is not None:
+            return any(covering[cell] & free[j] for cell in iter_bits(source.stars[star_type]))
+        if target is not None:
+            return any(star_cover[cell] & free[i] for cell in target.body_indices)
+        return any(star_cover[cell] & free[i] and covering[cell] & free[j] for cell in range(len(covering)))
+
+    @staticmethod
+    def _apply(add: List[float], high: List[float], low: List[float], i: int, j: int, potential: _Potential) -> float:
+        """Adds one interaction of source i on target j; returns its neutral pool share."""
+        add[i] += potential.add_source
+        add[j] += potential.add_target
+        low[i] *= potential.source_factor[0]
+        high[i] *= potential.source_factor[1]
+        low[j] *= potential.target_factor[0]
+        high[j] *= potential.target_factor[1]
+        return potential.pool
+
+    @staticmethod
+    def _gain(add: List[float], high: List[float], i: int, j: int, potential: _Potential) -> float:
+        """What one undecided interaction adds on top of the decided ones (0 when that is not a safe bound)."""
+        if add[i] < 0 or add[j] < 0 or high[i] <= 0 or high[j] <= 0:
+            return 0.0
+        gain = potential.pool
+        gain += (add[i] + potential.add_source) * high[i] * potential.source_factor[1] - add[i] * high[i]
+        gain += (add[j] + potential.add_target) * high[j] * potential.target_factor[1] - add[j] * high[j]
+        return gain
+
+    # --- 搜索 ---
+    def _choose(self) -> Optional[Tuple[int, List[int]]]:
+        """The undecided item with the fewest free positions (interacting items first), and those positions."""
+        best, best_count = None, None
+        for i in range(len(self._candidates)):
+            if self._masks[i] is not None or self._skipped[i]: continue
+            previous = self._previous_copy[i]
+            if previous is not None and self._masks[previous] is None and not self._skipped[previous]: continue
+            if previous is not None and self._skipped[previous]:
+                return i, []  # 前一个副本没放，这个也不放
+            if not self._linked[i] and self._base[i] <= 0:
+                return i, []  # 放了也不加分
+            free = self._all[i] & ~self._blocked[i]
+            if previous is not None:
+                free &= ~((1 << (self._chosen[previous] + 1)) - 1)
+            if not self._placed:  # 第一个放入的物品：180° 对称的两个位置只试一个
+                free &= self._canonical[i]
+            count = (not self._linked[i], popcount(free))
+            if best is None or count < best_count:
+                best, best_count = (i, free), count
+        return None if best is None else (best[0], list(iter_bits(best[1])))
+
+    def _block(self, body_indices) -> List[int]:
+        """Marks the positions of undecided items that overlap new body cells; returns the previous masks."""
+        saved = self._blocked[:]
+        for k, covering in enumerate(self._covering):
+            if self._masks[k] is not None or self._skipped[k]: continue
+            blocked = self._blocked[k]
+            for cell in body_indices:
+                blocked |= covering[cell]
+            self._blocked[k] = blocked
+        return saved
+
+    def _place(self, i: int, p: int) -> float:
+        placement, masks = self._candidates[i][p]
+        self._masks[i], self._chosen[i] = masks, p
+        self._occupancy |= masks.body
+        self._saved.append(self._block(masks.body_indices))
+        self._placed += 1
+        self.evaluations += 1
+        return self._session.add(i, placement)
+
+    def _unplace(self, i: int):
+        self._occupancy &= ~self._masks[i].body
+        self._masks[i], self._chosen[i] = None, None
+        self._blocked = self._saved.pop()
+        self._placed -= 1
+        self.evaluations += 1
+        self._session.remove(i)
+
+    def _offer(self, score: float):
+        """Every partial layout is a valid layout (the undecided items left out)."""
+        if score > self._best_score + EPSILON:
+            self._best_score = score
+            self._best_layout = self._layout_from_session(self._session)
+            self._report_progress(self.nodes, self.nodes, self._best_score, self._best_layout)
+
+    def _layout_from_session(self, session) -> Dict:
+        layout = self._new_layout()
+        for placement in session.placed_items().values():
+            offset_c, offset_r = placement.get_body_offset()
+            layout[(placement.gx + offset_c, placement.gy + offset_r)] = placement
+        return layout
+
+    def _children(self, i: int, free: List[int]) -> List[Tuple[float, Optional[int]]]:
+        """
+        (bound, position) of every child, best bound first; position None leaves the item
+        out. Ties go to positions that touch more walls and placed items (tighter packing).
+        """
+        children = []
+        occupancy = self._occupancy
+        for p in free:
+            masks = self._candidates[i][p][1]
+            self._masks[i] = masks
+            self._occupancy = occupancy | masks.body
+            saved = self._block(masks.body_indices)
+            contact = self._walls[i][p] + popcount(self._rims[i][p] & occupancy)
+            children.append((self._bound(), contact, p))
+            self._blocked = saved
+        self._masks[i], self._occupancy = None, occupancy
+        self._skipped[i] = True
+        children.append((self._bound(), -1, None))
+        self._skipped[i] = False
+        children.sort(key=lambda child: (-child[0], -child[1]))
+        return [(bound, p) for bound, _, p in children]
+
+    def _seed_incumbent(self):
+        """
+        Greedy start so that pruning bites from the first node on: items by base score,
+        each at the free position that raises the score most (tightest packing on ties).
+        """
+        session = self.engine.start_session({}, self.backpack_cols, self.backpack_rows, explain=False)
+        occupancy, score = 0, 0.0
+        for i in sorted(range(len(self._candidates)), key=lambda i: -self._base[i]):
+            best = None
+            for p, (placement, masks) in enumerate(self._candidates[i]):
+                if masks.body & occupancy: continue
+                candidate = (session.add(i, placement), self._walls[i][p] + popcount(self._rims[i][p] & occupancy), p)
+                session.remove(i)
+                self.evaluations += 2
+                if candidate[0] > score + EPSILON and (best is None or candidate[:2] > best[:2]):
+                    best = candidate
+            if best is None: continue
+            placement, masks = self._candidates[i][best[2]]
+            score = session.add(i, placement)
+            self.evaluations += 1
+            occupancy |= masks.body
+        if score > self._best_score + EPSILON:
+            self._best_score, self._best_layout = score, self._layout_from_session(session)
+            self._report_progress(0, 0, self._best_score, self._best_layout)
+
+    def _search(self) -> bool:
+        """Explores the subtree of the current decisions; False if the search was stopped inside it."""
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY == 0:
+            self._stop_reason = self._should_stop(self._best_score)
+            if self.nodes % REPORT_EVERY == 0:
+                self._report_progress(self.nodes, self.nodes, self._best_score, self._best_layout)
+        if self._stop_reason:
+            self._open_bound = max(self._open_bound, self._bound())
+            return False
+        choice = self._choose()
+        if choice is None:
+            return True
+        i, free = choice
+        children = self._children(i, free)
+        for index, (bound, p) in enumerate(children):
+            if bound <= self._best_score + EPSILON:
+                break  # 按上界排序：后面的都剪掉
+            if p is None:
+                self._skipped[i] = True
+            else:
+                self._offer(self._place(i, p))
+            complete = self._search()
+            if p is None:
+                self._skipped[i] = False
+            else:
+                self._unplace(i)
+            if not complete:
+                for bound, _ in children[index + 1:]:
+                    self._open_bound = max(self._open_bound, bound)
+                return False
+        return True
+
+    def solve(self) -> Tuple[Dict, float]:
+        self._start_clock()
+        n = len(self.items_to_place)
+        self.nodes = 0
+        self._masks: List = [None] * n
+        self._chosen: List[Optional[int]] = [None] * n
+        self._skipped = [False] * n
+        self._occupancy = 0
+        self._blocked = [0] * n
+        self._saved: List[List[int]] = []
+        self._placed = 0
+        self._session = self.engine.start_session({}, self.backpack_cols, self.backpack_rows, explain=False)
+        self._best_layout, self._best_score = self._new_layout(), 0.0
+        if self.initial_layout:
+            self._best_score, _ = self._calculate_score(self.initial_layout)
+            self._best_layout = self.initial_layout.copy()
+        if self.warm_start:
+            self._seed_incumbent()
+        self._stop_reason: Optional[str] = None
+        self._open_bound = float('-inf')
+
+        root_bound = self._bound()
+        complete = self._search()
+        # 搜索完成：最好的布局就是最优解；提前停止：未搜索分支的上界
+        self.bound = self._best_score if complete else max(self._best_score, min(root_bound, self._open_bound))
+        self._report_progress(self.nodes, self.nodes, self._best_score, self._best_layout)
+        return self._finish(self._best_layout, self._best_score, self._stop_reason)
@@ -0,0 +1,522 @@
+import itertools
+import math
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from ortools.sat.python import cp_model
+
+from solvers.base_solver import BaseSolver
+from engine import Item, Placement
+from bitboard import STAR_TYPES, iter_bits, popcount
+
+# 分数以 1/SCORE_SCALE 为单位、乘法系数以 1/FACTOR_SCALE 为单位取整建模
+SCORE_SCALE = 100
+FACTOR_SCALE = 1000
+# 模型中间量的绝对值上限（CP-SAT 使用 int64）
+MAX_MAGNITUDE = 2 ** 60
+CANCEL_POLL_S = 0.2
+
+
+class _Bounded(NamedTuple):
+    """
+    A linear expression (or a plain int) with known lower and upper bounds, and the
+    worst-case error of its value against the unrounded score (in the same units).
+    """
+    expr: object
+    lo: int
+    hi: int
+    err: float = 0.0
+
+
+def _first_match(effects, target: Placement, elements: Tuple) -> Optional[int]:
+    return next((k for k, effect in enumerate(effects) if effect.matches(target.item_def, list(elements))), None)
+
+
+class _LayoutModel:
+    """
+    CP-SAT model of one item set. x[i][p] selects candidate p of item i; every
+    score is an integer in 1/SCORE_SCALE units, so the objective matches the
+    engine up to that rounding. `exact` is False when the item set uses a rule the
+    model only approximates (an element condition that depends on another item's
+    temporary elements, which the engine resolves in insertion order).
+    """
+    def __init__(self, items: List[Placement], candidates: List[List[Placement]], cols: int, rows: int):
+        self.items, self.cols, self.rows = items, cols, rows
+        self.model = cp_model.CpModel()
+        self.exact = True
+        # candidates[i]: (placement, anchored masks) of every in-bounds position of item i
+        self.candidates = [[(placement, placement.get_masks(cols, rows).at(placement.gx, placement.gy))
+                            for placement in placements] for placements in candidates]
+        self.x = [[self.model.new_bool_var(f"x{i}_{p}") for p in range(len(cands))]
+                  for i, cands in enumerate(self.candidates)]
+        self.placed = []
+        for i, xs in enumerate(self.x):
+            placed = self.model.new_bool_var(f"placed{i}")
+            self.model.add(sum(xs) == placed)
+            self.placed.append(placed)
+        # body_index[i][cell]: 身体覆盖该格子的候选位置
+        self.body_index = [[[] for _ in range(cols * rows)] for _ in items]
+        for i, cands in enumerate(self.candidates):
+            for p, (_, masks) in enumerate(cands):
+                for cell in masks.body_indices:
+                    self.body_index[i][cell].append(p)
+
+        self._covers: Dict[tuple, object] = {}
+        self._empty: Dict[tuple, _Bounded] = {}
+        self._events: Dict[tuple, list] = {}
+        self._activations: Dict[tuple, _Bounded] = {}
+        self.adds: List[List[_Bounded]] = [[] for _ in items]
+        self.factors: List[List[_Bounded]] = [[] for _ in items]
+        self.pool: List[_Bounded] = []
+        self.rounding_error = 0.0  # 目标值相对真实分数的最大误差，见 _add_objective
+        self._add_packing()
+        self._add_symmetry_breaking()
+        self._add_elements()
+        self._add_effects()
+        self._add_objective()
+
+    # --- 候选位置与装箱约束 ---
+    def _add_packing(self):
+        for cell in range(self.cols * self.rows):
+            covering = [self.x[i][p] for i in range(len(self.items)) for p in self.body_index[i][cell]]
+            if len(covering) > 1:
+                self.model.add_at_most_one(covering)
+
+    def _add_symmetry_breaking(self):
+        """Copies of one item take candidates in increasing order; the 180° turn of the whole backpack is fixed."""
+        copies: Dict[object, List[int]] = {}
+        for i, item in enumerate(self.items):
+            copies.setdefault(item.item_def, []).append(i)
+        for indices in copies.values():
+            for a, b in zip(indices, indices[1:]):
+                self.model.add(self.placed[a] >= self.placed[b])
+                index_a = sum(p * x for p, x in enumerate(self.x[a]))
+                index_b = sum(p * x for p, x in enumerate(self.x[b]))
+                self.model.add(index_a < index_b).only_enforce_if(self.placed[b])
+
+        # 整个背包转 180° 不改变分数：只保留第一个物品的两个对称位置中编号较小的一个
+        if not self.items: return
+        cells = self.cols * self.rows
+
+        def turned(mask: int) -> int:
+            return int(format(mask, f"0{cells}b")[::-1], 2)
+
+        def signature(body: int, stars) -> tuple:
+            return (body,) + tuple(stars[star_type] for star_type in STAR_TYPES)
+
+        candidates = self.candidates[0]
+        index = {signature(masks.body, masks.stars): p for p, (_, masks) in enumerate(candidates)}
+        for p, (_, masks) in enumerate(candidates):
+            twin = index.get(signature(turned(masks.body), {t: turned(masks.stars[t]) for t in STAR_TYPES}))
+            if twin is not None and twin < p:
+                self.model.add(self.x[0][p] == 0)
+
+    # --- 布尔辅助 ---
+    def _and(self, *literals):
+        """Literal of the conjunction; True stands for a constant true literal."""
+        literals = [literal for literal in literals if literal is not True]
+        if not literals:
+            return True
+        if len(literals) == 1:
+            return literals[0]
+        conjunction = self.model.new_bool_var("")
+        self.model.add_bool_and(literals).only_enforce_if(conjunction)
+        self.model.add_bool_or([~literal for literal in literals]).only_enforce_if(~conjunction)
+        return conjunction
+
+    def _outcomes(self, j: int, outcome: Callable[[Tuple], object]) -> Dict[object, object]:
+        """Groups the temporary-element states of item j by outcome(elements) -> literal of that group."""
+        groups: Dict[object, list] = {}
+        for elements, literal in self.states[j]:
+            groups.setdefault(outcome(elements), []).append(literal)
+        result = {}
+        for value, literals in groups.items():
+            if len(literals) == len(self.states[j]):
+                result[value] = True
+            elif len(literals) == 1:
+                result[value] = literals[0]
+            else:
+                result[value] = self.model.new_bool_var("")
+                self.model.add(result[value] == sum(literals))
+        return result
+
+    def cover(self, i: int, star_type, j: int):
+        """Literal "a star_type star of item i lies on item j's body", or None if that can never happen."""
+        key = (i, star_type, j)
+        if key not in self._covers:
+            self._covers[key] = self._build_cover(i, star_type, j)
+        return self._covers[key]
+
+    def _build_cover(self, i: int, star_type, j: int):
+        body_index, xi, xj = self.body_index[j], self.x[i], self.x[j]
+        touching: Dict[int, set] = {}
+        for p, (_, masks) in enumerate(self.candidates[i]):
+            reached = set()
+            for cell in iter_bits(masks.stars[star_type]):
+                reached.update(body_index[cell])
+            if reached:
+                touching[p] = reached
+        if not touching: return None
+
+        cover = self.model.new_bool_var(f"cover{i}_{star_type.name}_{j}")
+        touched_by: Dict[int, List[int]] = {}
+        for p, reached in touching.items():
+            self.model.add(cover >= xi[p] + sum(xj[q] for q in reached) - 1)
+            for q in reached:
+                touched_by.setdefault(q, []).append(p)
+        self.model.add(cover <= self.placed[j])
+        for q, x_q in enumerate(xj):
+            self.model.add(cover + x_q - sum(xi[p] for p in touched_by.get(q, ())) <= 1)
+        return cover
+
+    # --- 临时元素 ---
+    def _add_elements(self):
+        """
+        Temporary elements: temp[j][e] is true when an ADD_ELEMENT_TO_TARGET star of another
+        item lies on j. states[j] lists (elements, literal) for every subset of the elements
+        j can receive; exactly one is true.
+        """
+        items = self.items
+        addable: List[Dict[object, list]] = [{} for _ in items]
+        groups_on: List[list] = [[] for _ in items]
+        for i, item in enumerate(items):
+            for star_type, groups in item.get_plan().element_groups.items():
+                for j, target in enumerate(items):
+                    if j == i: continue
+                    cover = self.cover(i, star_type, j)
+                    if cover is None: continue
+                    for group in groups:
+                        groups_on[j].append(group)
+                        k = _first_match(group, target, ())
+                        element = group[k].element if k is not None else None
+                        if element is not None and element not in target.elements:
+                            addable[j].setdefault(element, []).append(cover)
+
+        self.states = []
+        for j, target in enumerate(items):
+            elements = sorted(addable[j], key=lambda element: element.name)
+            subsets = [tuple(e for e, bit in zip(elements, bits) if bit)
+                       for bits in itertools.product((0, 1), repeat=len(elements))]
+            # 元素效果的条件依赖别的临时元素时，引擎的结果取决于插入顺序，模型只按原生元素判断
+            for group in groups_on[j]:
+                if len({_first_match(group, target, subset) for subset in subsets}) > 1:
+                    self.exact = False
+            if not elements:
+                self.states.append([((), True)])
+                continue
+            temporary = {}
+            for element in elements:
+                temporary[element] = self.model.new_bool_var(f"temp{j}_{element.name}")
+                self.model.add_max_equality(temporary[element], addable[j][element])
+            literals = [self.model.new_bool_var("") for _ in subsets]
+            self.model.add_exactly_one(literals)
+            for element in elements:
+                self.model.add(temporary[element] == sum(literal for subset, literal in zip(subsets, literals)
+                                                         if element in subset))
+            self.states.append(list(zip(subsets, literals)))
+
+    # --- 星星激活 ---
+    def empty_stars(self, i: int, star_type) -> _Bounded:
+        """Number of star_type stars of item i on empty cells."""
+        key = (i, star_type)
+        if key in self._empty:
+            return self._empty[key]
+        on_cell = [[] for _ in range(self.cols * self.rows)]
+        total, most = [], 0
+        for p, (_, masks) in enumerate(self.candidates[i]):
+            stars = masks.stars[star_type]
+            most = max(most, popcount(stars))
+            if stars:
+                total.append(popcount(stars) * self.x[i][p])
+            for cell in iter_bits(stars):
+                on_cell[cell].append(self.x[i][p])
+        occupied = []
+        for cell, star_literals in enumerate(on_cell):
+            others = [self.x[j][q] for j in range(len(self.items)) if j != i for q in self.body_index[j][cell]]
+            if not star_literals or not others: continue
+            star, other = sum(star_literals), sum(others)
+            both = self.model.new_bool_var("")
+            self.model.add(both <= star)
+            self.model.add(both <= other)
+            self.model.add(both >= star + other - 1)
+            occupied.append(both)
+        self._empty[key] = _Bounded(sum(total) - sum(occupied), 0, most)
+        return self._empty[key]
+
+    def star_events(self, i: int, star_type) -> List[Tuple[int, int, object]]:
+        """(target j, index of the first matching effect in star_effects, literal) per target a star can hit."""
+        key = (i, star_type)
+        if key in self._events:
+            return self._events[key]
+        effects = self.items[i].get_plan().star_effects[star_type]
+        events = []
+        for j, target in enumerate(self.items):
+            if j == i: continue
+            cover = self.cover(i, star_type, j)
+            if cover is None: continue
+            outcomes = self._outcomes(j, lambda elements: _first_match(effects, target, elements))
+            for first, literal in outcomes.items():
+                if first is None: continue
+                events.append((j, first, self._and(cover, literal)))
+        self._events[key] = events
+        return events
+
+    def activation(self, i: int, star_type) -> _Bounded:
+        """activated_stars[star_type] of item i: one per distinct target hit, plus one per empty-cell group match."""
+        key = (i, star_type)
+        if key in self._activations:
+            return self._activations[key]
+        plan = self.items[i].get_plan()
+        expr, hi = 0, 0
+        if star_type in plan.star_groups:
+            events = self.star_events(i, star_type)
+            expr, hi = sum(literal for _, _, literal in events), len({j for j, _, _ in events})
+            if star_type in plan.empty_types:
+                groups = sum(1 for group in plan.star_groups[star_type] if any(e.when_empty for e in group))
+                empty = self.empty_stars(i, star_type)
+                expr, hi = expr + groups * empty.expr, hi + groups * empty.hi
+        self._activations[key] = _Bounded(expr, 0, hi)
+        return self._activations[key]
+
+    # --- 效果 ---
+    def _value(self, i: int, effect, scale: int) -> Optional[_Bounded]:
+        """The effect value in 1/scale units (dynamic values follow item i's activated stars); None if not a number."""
+        if effect.per_star is None:
+            if effect.number is None: return None
+            value = round(effect.number * scale)
+            return _Bounded(value, value, value, abs(value - effect.number * scale))
+        if not isinstance(effect.base, (int, float)): return None
+        activated = self.activation(i, effect.per_star)
+        const, coef = round(effect.base * scale), round(effect.per_star_add * scale)
+        ends = (const + coef * activated.lo, const + coef * activated.hi)
+        err = abs(const - effect.base * scale) + abs(coef - effect.per_star_add * scale) * activated.hi
+        return _Bounded(const + coef * activated.expr, min(ends), max(ends), err)
+
+    def _amount(self, literal, value: _Bounded) -> _Bounded:
+        """value if literal else 0."""
+        if isinstance(value.expr, int):
+            return _Bounded(value.expr * literal, min(0, value.lo), max(0, value.hi), value.err)
+        amount = self.model.new_int_var(min(0, value.lo), max(0, value.hi), "")
+        self.model.add(amount == value.expr).only_enforce_if(literal)
+        self.model.add(amount == 0).only_enforce_if(~literal)
+        return _Bounded(amount, min(0, value.lo), max(0, value.hi), value.err)
+
+    def _counted(self, count: _Bounded, value: _Bounded) -> _Bounded:
+        """value * count (one emission per empty star cell)."""
+        ends = [value.lo * count.hi, value.hi * count.hi, 0]
+        if isinstance(value.expr, int):
+            return _Bounded(value.expr * count.expr, min(ends), max(ends), value.err * count.hi)
+        cells = self.model.new_int_var(0, count.hi, "")
+        self.model.add(cells == count.expr)
+        per_cell = self.model.new_int_var(value.lo, value.hi, "")
+        self.model.add(per_cell == value.expr)
+        amount = self.model.new_int_var(min(ends), max(ends), "")
+        self.model.add_multiplication_equality(amount, [cells, per_cell])
+        return _Bounded(amount, min(ends), max(ends), value.err * count.hi)
+
+    def _factor(self, literal, value: _Bounded) -> _Bounded:
+        """value if literal else 1, in 1/FACTOR_SCALE units."""
+        lo, hi = min(FACTOR_SCALE, value.lo), max(FACTOR_SCALE, value.hi)
+        if isinstance(value.expr, int):
+            return _Bounded(FACTOR_SCALE + (value.expr - FACTOR_SCALE) * literal, lo, hi, value.err)
+        factor = self.model.new_int_var(lo, hi, "")
+        self.model.add(factor == value.expr).only_enforce_if(literal)
+        self.model.add(factor == FACTOR_SCALE).only_enforce_if(~literal)
+        return _Bounded(factor, lo, hi, value.err)
+
+    def _emit(self, i: int, j: Optional[int], effect, literal=None, count: Optional[_Bounded] = None):
+        """Records one scoring effect of source i on target j (None: an empty cell), per literal or per empty cell."""
+        if effect.effect in ("ADD_SCORE_TO_TARGET", "MULTIPLY_SCORE_OF_TARGET"):
+            if j is None: return
+            receiver = j
+        else:
+            receiver = i
+        if effect.effect.startswith("MULTIPLY"):
+            value = self._value(i, effect, FACTOR_SCALE)
+            if value is None: return
+            if count is None:
+                self.factors[receiver].append(self._factor(literal, value))
+                return
+            for k in range(1, count.hi + 1):  # 第 k 个空星星格：count >= k 时生效
+                reached = self.model.new_bool_var("")
+                self.model.add(count.expr >= k).only_enforce_if(reached)
+                self.model.add(count.expr < k).only_enforce_if(~reached)
+                self.factors[receiver].append(self._factor(reached, value))
+            return
+        value = self._value(i, effect, SCORE_SCALE)
+        if value is None: return
+        term = self._amount(literal, value) if count is None else self._counted(count, value)
+        if effect.effect == "ADD_TO_NEUTRAL_POOL":
+            self.pool.append(term)
+        else:
+            self.adds[receiver].append(term)
+
+    def _add_effects(self):
+        items = self.items
+        for i, item in enumerate(items):
+            plan = item.get_plan()
+            for effect in plan.passives:
+                if not effect.scoring: continue
+                for j, target in enumerate(items):
+                    outcomes = self._outcomes(j, lambda elements: effect.matches(target.item_def, list(elements)))
+                    if True not in outcomes: continue
+                    placed = (self.placed[i],) if j == i else (self.placed[i], self.placed[j])
+                    self._emit(i, j, effect, self._and(*placed, outcomes[True]))
+            for star_type, effects in plan.star_effects.items():
+                for j, first, literal in self.star_events(i, star_type):
+                    if effects[first].scoring:
+                        self._emit(i, j, effects[first], literal)
+                if star_type in plan.empty_types:
+                    effect = next(e for e in effects if e.when_empty)
+                    if effect.scoring:
+                        self._emit(i, None, effect, count=self.empty_stars(i, star_type))
+
+    # --- 目标 ---
+    def _sum(self, terms: List[_Bounded]) -> _Bounded:
+        lo, hi = sum(term.lo for term in terms), sum(term.hi for term in terms)
+        total = self.model.new_int_var(lo, hi, "")
+        self.model.add(total == sum(term.expr for term in terms))
+        return _Bounded(total, lo, hi, sum(term.err for term in terms))
+
+    def _multiply(self, score: _Bounded, factor: _Bounded) -> _Bounded:
+        corners = [a * b for a in (score.lo, score.hi) for b in (factor.lo, factor.hi)]
+        lo, hi = min(corners), max(corners)
+        if max(-lo, hi) > MAX_MAGNITUDE:
+            raise ValueError("Item set too large for the exact model (score range overflows)")
+        product = self.model.new_int_var(lo, hi, "")
+        self.model.add_multiplication_equality(product, [score.expr, factor.expr])
+        lo, hi = lo // FACTOR_SCALE, -(-hi // FACTOR_SCALE)
+        scaled = self.model.new_int_var(lo, hi, "")
+        self.model.add_division_equality(scaled, product, FACTOR_SCALE)
+        # 两个取整后的因子相乘的误差，加上整除截断的 1 个单位
+        score_size, factor_size = max(-score.lo, score.hi), max(-factor.lo, factor.hi) + factor.err
+        err = (score_size * factor.err + factor_size * score.err) / FACTOR_SCALE + 1
+        return _Bounded(scaled, lo, hi, err)
+
+    def _add_objective(self):
+        """Final score of each item: (base + adds) times its multipliers, plus the neutral pool."""
+        scores = []
+        for j, item in enumerate(self.items):
+            base = round(item.base_score * SCORE_SCALE)
+            base_term = _Bounded(base * self.placed[j], min(0, base), max(0, base), abs(base - item.base_score * SCORE_SCALE))
+            score = self._sum([base_term] + self.adds[j])
+            for factor in self.factors[j]:
+                score = self._multiply(score, factor)
+            scores.append(score)
+        self.model.maximize(sum(score.expr for score in scores) + sum(term.expr for term in self.pool))
+        # 目标值与真实分数（乘以 SCORE_SCALE）最多相差这么多
+        self.rounding_error = sum(score.err for score in scores) + sum(term.err for term in self.pool)
+
+    # --- 解 ---
+    def solution(self, value: Callable) -> List[Placement]:
+        return [cands[p][0] for xs, cands in zip(self.x, self.candidates) for p, x in enumerate(xs) if value(x)]
+
+    def add_hint(self, layout: Dict):
+        """Uses a known layout as the starting solution."""
+        chosen: Dict[int, int] = {}
+        for placement in layout.values():
+            masks = placement.get_masks(self.cols, self.rows).at(placement.gx, placement.gy)
+            for i, item in enumerate(self.items):
+                if i in chosen or item.item_def is not placement.item_def: continue
+                p = next((p for p, (_, other) in enumerate(self.candidates[i])
+                          if other.body == masks.body and other.stars == masks.stars), None)
+                if p is not None:
+                    chosen[i] = p
+                    break
+        for i, xs in enumerate(self.x):
+            for p, x in enumerate(xs):
+                self.model.add_hint(x, chosen.get(i) == p)
+
+
+class _SolutionCallback(cp_model.CpSolverSolutionCallback):
+    """Scores every solution CP-SAT reports with the engine and keeps the best one."""
+    def __init__(self, solver: "ExactSolver", model: _LayoutModel):
+        super().__init__()
+        self.solver, self.model = solver, model
+        self.best_layout = solver._new_layout()
+        self.best_score = 0.0
+        self.solutions = 0
+
+    def on_solution_callback(self):
+        solver = self.solver
+        self.solutions += 1
+        layout = solver._new_layout()
+        for placement in self.model.solution(self.value):
+            offset_c, offset_r = placement.get_body_offset()
+            layout[(placement.gx + offset_c, placement.gy + offset_r)] = placement
+        score, _ = solver._calculate_score(layout)
+        if self.solutions == 1 or score > self.best_score:
+            self.best_layout, self.best_score = layout, score
+        solver._report_progress(self.solutions, self.solutions, self.best_score, self.best_layout)
+
+
+class ExactSolver(BaseSolver):
+    """
+    Algorithm G: exact optimization with the OR-Tools CP-SAT solver, for small item sets.
+    Every in-bounds (rotation, gx, gy) of an item is a boolean candidate and bodies may
+    not share a cell; star activations, temporary elements, adds and multipliers are
+    expressed over "a star of item i lies on item j" the way the engine applies them.
+    After solve(), `status` is "OPTIMAL" when the layout is proven optimal; when the time
+    budget runs out it is "FEASIBLE" and `bound` is the proven upper bound on the score.
+    Scores and factors are rounded to integers in the model, so an optimum is only proven
+    up to `tolerance` (bound minus the best score); status then reads "OPTIMAL within ±x".
+    Observers are called from CP-SAT's search thread, once per solution found.
+    """
+    def __init__(self, items: List[Item], backpack_cols: int, backpack_rows: int,
+                 initial_layout: Optional[Dict] = None, search_workers: int = 0,
+                 time_budget_s: Optional[float] = None, seed: Optional[int] = None):
+        super().__init__(items, backpack_cols, backpack_rows, time_budget_s=time_budget_s, seed=seed)
+        self.initial_layout = self._to_placements(initial_layout) if initial_layout else None
+        self.search_workers = search_workers  # CP-SAT search workers (0: one per core)
+        self.status: Optional[str] = None
+        self.tolerance: Optional[float] = None  # 取整误差：最优解只在这个范围内得到证明
+        self.exact: Optional[bool] = None  # False: the model approximates a rule of this item set
+
+    def _watch_cancel(self, solver: cp_model.CpSolver, done: threading.Event):
+        while not done.wait(CANCEL_POLL_S):
+            if self._cancelled():
+                solver.stop_search()
+                return
+
+    def solve(self) -> Tuple[Dict, float]:
+        self._start_clock()
+        candidates = [self._candidate_placements(item) for item in self.items_to_place]
+        model = _LayoutModel(self.items_to_place, candidates, self.backpack_cols, self.backpack_rows)
+        self.exact = model.exact
+        if not model.exact:
+            print("Warning: element conditions depend on other temporary elements; the exact model approximates them")
+        if self.initial_layout:
+            model.add_hint(self.initial_layout)
+
+        solver = cp_model.CpSolver()
+        solver.parameters.num_workers = self.search_workers
+        if self.seed is not None:
+            solver.parameters.random_seed = self.seed % 2 ** 31
+        if self.time_budget_s is not None:
+            solver.parameters.max_time_in_seconds = max(0.0, self._time_left())
+        callback = _SolutionCallback(self, model)
+        done = threading.Event()
+        watcher = threading.Thread(target=self._watch_cancel, args=(solver, done), daemon=True)
+        watcher.start()
+        try:
+            status = solver.solve(model.model, callback)
+        finally:
+            done.set()
+            watcher.join()
+
+        self.status = solver.status_name(status)
+        stop_reason = None
+        if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            # 取整误差只会让模型的上界偏低：向上取整并加上误差上限，且不低于实际达到的分数
+            bound = (math.ceil(solver.best_objective_bound - 1e-9) + model.rounding_error) / SCORE_SCALE
+            self.bound = max(bound, callback.best_score)
+            self.tolerance = self.bound - callback.best_score
+        if status == cp_model.OPTIMAL and self.tolerance > 1e-9:
+            self.status = f"OPTIMAL within ±{self.tolerance:.2f}"
+        if self._cancelled():
+            stop_reason = "cancelled"
+        elif status == cp_model.FEASIBLE:
+            stop_reason = f"time budget of {self.time_budget_s:.1f}s used (proven bound {self.bound:.2f})"
+        elif status != cp_model.OPTIMAL:
+            stop_reason = f"CP-SAT stopped with status {self.status}"
+        return self._finish(callback.best_layout, callback.best_score, stop_reason)
@@ -1,11 +1,12 @@
-import random
 from typing import Tuple, Dict, List, Optional
 from collections import Counter
 
 from solvers.base_solver import BaseSolver
-from engine import Item, GridType
+from solvers.base_islands import IslandModelMixin
+from engine import Item, GridType, EvaluationResult
+from bitboard import iter_bits, popcount
 
-class GeneticSolver(BaseSolver):
+class GeneticSolver(IslandModelMixin, BaseSolver):
     """
     Algorithm D: A Genetic Algorithm to find an optimal backpack layout.
     Features an advanced "Anchor and Optimize" crossover strategy with
@@ -13,50 +14,59 @@ class GeneticSolver(BaseSolver):
     """
     def __init__(self, items: List[Item], backpack_cols: int, backpack_rows: int,
                  population_size: int = 50, generations: int = 100, mutation_rate: float = 0.18,
-                 tournament_size: int = 7, elitism_count: int = 5, initial_layout: Optional[Dict] = None):
-        super().__init__(items, backpack_cols, backpack_rows)
+                 tournament_size: int = 7, elitism_count: int = 5, initial_layout: Optional[Dict] = None,
+                 workers: Optional[int] = 1, islands: int = 1, migration_interval: int = 10, migrants: int = 2,
+                 time_budget_s: Optional[float] = None, patience: Optional[int] = None, min_delta: float = 0.0,
+                 seed: Optional[int] = None):
+        super().__init__(items, backpack_cols, backpack_rows, time_budget_s, patience, min_delta, seed)
         self.population_size = population_size
         self.generations = generations
         self.mutation_rate = mutation_rate
         self.tournament_size = tournament_size
         self.elitism_count = elitism_count
         self.item_manifest = Counter(item.name for item in self.items_to_place)
-        self.initial_layout = initial_layout
+        self.initial_layout = self._to_placements(initial_layout) if initial_layout else None
+        self.workers = workers  # >1 (or 0 / None for every core) evaluates fitness in parallel
+        # Island model: >1 runs that many populations in separate processes with ring migration
+        self.islands = islands
+        self.migration_interval = migration_interval
+        self.migrants = migrants
 
     def _create_random_individual(self) -> Dict:
-        layout = {}
-        items_to_place = [item.clone() for item in self.items_to_place]
-        random.shuffle(items_to_place)
+        layout = self._new_layout()
+        items_to_place = list(self.items_to_place)
+        self.rng.shuffle(items_to_place)
         for item in items_to_place:
             for _ in range(20):
-                for _ in range(random.randint(0, 3)): item.rotate()
+                item = item.rotated(self.rng.randint(0, 3))
                 pos = self._get_random_valid_position(item)
                 if pos and self._is_placement_valid(item, pos[0], pos[1], layout):
-                    item.gx, item.gy = pos
+                    item = item.at(*pos)
                     offset_c, offset_r = item.get_body_offset()
                     key = (item.gx + offset_c, item.gy + offset_r)
                     layout[key] = item
                     break
         return layout
 
-    def _tournament_selection(self, population: List[Tuple[Dict, float, List]]) -> Tuple[Dict, List]:
-        tournament = random.sample(population, self.tournament_size)
+    def _tournament_selection(self, population: List[Tuple[Dict, float, EvaluationResult]]) -> Tuple[Dict, EvaluationResult]:
+        tournament = self.rng.sample(population, self.tournament_size)
         best = max(tournament, key=lambda ind: ind[1])
         return best[0], best[2]
 
-    def _crossover(self, parent1: Dict, parent2: Dict, parent1_interaction_map: List[Tuple[str, str]]) -> Dict:
-        if not parent1 or not parent1.values(): return {k: v.clone() for k, v in parent2.items()}
+    def _crossover(self, parent1: Dict, parent2: Dict, parent1_result: EvaluationResult) -> Dict:
+        if not parent1 or not parent1.values(): return parent2.copy()
         
-        child_layout = {}
+        child_layout = self._new_layout()
         
         # --- Phase 1: Anchor the Synergy Core ---
-        mvp_item = max(parent1.values(), key=lambda item: item.final_score)
+        mvp_key = max(parent1, key=lambda key: parent1_result.final_scores.get(key, 0.0))
+        mvp_item = parent1[mvp_key]
         synergy_cluster_names = {mvp_item.name}
-        for source, target in parent1_interaction_map:
+        for source, target in parent1_result.interaction_map:
             if source == mvp_item.name: synergy_cluster_names.add(target)
             if target == mvp_item.name: synergy_cluster_names.add(source)
 
-        core_items = [item.clone() for item in parent1.values() if item.name in synergy_cluster_names]
+        core_items = [item for item in parent1.values() if item.name in synergy_cluster_names]
 
         if core_items:
             min_gx = min(it.gx for it in core_items)
@@ -73,19 +83,18 @@ class GeneticSolver(BaseSolver):
             dy = round(backpack_center_gy - core_center_gy)
             
             is_shift_valid = True
-            temp_shifted_core_layout = {}
+            temp_shifted_core_layout = self._new_layout()
             for item in core_items:
                 shifted_gx, shifted_gy = item.gx + dx, item.gy + dy
                 if not self._is_placement_valid(item, shifted_gx, shifted_gy, temp_shifted_core_layout):
                     is_shift_valid = False
                     break
-                item_copy = item.clone()
-                item_copy.gx, item_copy.gy = shifted_gx, shifted_gy
+                item_copy = item.at(shifted_gx, shifted_gy)
                 offset_c, offset_r = item_copy.get_body_offset()
                 key = (item_copy.gx + offset_c, item_copy.gy + offset_r)
                 temp_shifted_core_layout[key] = item_copy
             
-            child_layout = temp_shifted_core_layout if is_shift_valid else { (it.gx + it.get_body_offset()[0], it.gy + it.get_body_offset()[1]): it for it in core_items }
+            child_layout = temp_shifted_core_layout if is_shift_valid else self._new_layout({ (it.gx + it.get_body_offset()[0], it.gy + it.get_body_offset()[1]): it for it in core_items })
 
         # --- Phase 2: "Star-Seeker" Placement for Remaining Items ---
         child_manifest = Counter(item.name for item in child_layout.values())
@@ -95,72 +104,56 @@ class GeneticSolver(BaseSolver):
         for name, count in missing_manifest.items():
             if name in parent2_items_by_name:
                 for _ in range(count):
-                    items_to_add.append(parent2_items_by_name[name].clone())
-        random.shuffle(items_to_add)
+                    items_to_add.append(parent2_items_by_name[name])
+        self.rng.shuffle(items_to_add)
 
         for item in items_to_add:
             best_placement = None
             best_score = -1
 
-            # 1. Identify "Synergy Hotspots"
-            hotspots = set()
-            core_occupancy = set()
+            # 1. Identify "Synergy Hotspots": free cells covered by a star of a placed item
+            cols, rows = self.backpack_cols, self.backpack_rows
+            core_occupancy = child_layout.occupancy
+            hotspots = 0
             for core_item in child_layout.values():
-                for r, row in enumerate(core_item.shape_matrix):
-                    for c, cell in enumerate(row):
-                        ax, ay = core_item.gx + c, core_item.gy + r
-                        if cell == GridType.OCCUPIED:
-                            core_occupancy.add((ax, ay))
-                        elif cell.name.startswith("STAR"):
-                            hotspots.add((ax, ay))
-            
-            # Remove hotspots that are already occupied
-            hotspots -= core_occupancy
+                hotspots |= core_item.get_masks(cols, rows).at(core_item.gx, core_item.gy).star_union
+            hotspots &= ~core_occupancy
 
-            # 2. Attempt "Best-Fit" on Hotspots
-            item_copy = item.clone()
-            for _ in range(4):
-                item_copy.rotate()
-                occupied_cells = [(c, r) for r, row in enumerate(item_copy.shape_matrix) for c, cell in enumerate(row) if cell == GridType.OCCUPIED]
-                if not occupied_cells: continue
+            # 2. Attempt "Best-Fit" on Hotspots (each distinct rotation once)
+            for item_copy in item.variants():
+                shape_masks = item_copy.get_masks(cols, rows)
+                if not shape_masks.body_cells: continue
                 
-                for handle_c, handle_r in occupied_cells:
-                    for spot_x, spot_y in hotspots:
-                        gx, gy = spot_x - handle_c, spot_y - handle_r
+                for handle_c, handle_r in shape_masks.body_cells:
+                    for spot in iter_bits(hotspots):
+                        gx, gy = spot % cols - handle_c, spot // cols - handle_r
                         
                         if self._is_placement_valid(item_copy, gx, gy, child_layout):
-                            score = 0
-                            # Calculate synergy score for this placement
-                            for r_new, row_new in enumerate(item_copy.shape_matrix):
-                                for c_new, cell_new in enumerate(row_new):
-                                    if cell_new.name.startswith("STAR"):
-                                        if (gx + c_new, gy + r_new) in core_occupancy:
-                                            score += 1
+                            # Synergy score: how many of this item's stars land on placed items
+                            score = popcount(shape_masks.at(gx, gy).star_union & core_occupancy)
                             
                             if score > best_score:
                                 best_score = score
-                                best_item_state = item_copy.clone()
-                                best_placement = (gx, gy, best_item_state)
+                                best_placement = (gx, gy, item_copy)
             
             # 3. Place Item
             if best_placement:
                 gx, gy, best_item = best_placement
-                best_item.gx, best_item.gy = gx, gy
+                best_item = best_item.at(gx, gy)
                 offset_c, offset_r = best_item.get_body_offset()
                 key = (gx + offset_c, gy + offset_r)
                 child_layout[key] = best_item
             else:
                 # 4. Fallback: Greedy scan if no hotspot placement worked
                 placed = False
-                for _ in range(4):
-                    item.rotate()
-                    for gy_fall in range(-item.grid_height, self.backpack_rows):
-                        for gx_fall in range(-item.grid_width, self.backpack_cols):
-                            if self._is_placement_valid(item, gx_fall, gy_fall, child_layout):
-                                item.gx, item.gy = gx_fall, gy_fall
-                                offset_c, offset_r = item.get_body_offset()
+                for rotated_item in item.variants():
+                    for gy_fall in range(-rotated_item.grid_height, self.backpack_rows):
+                        for gx_fall in range(-rotated_item.grid_width, self.backpack_cols):
+                            if self._is_placement_valid(rotated_item, gx_fall, gy_fall, child_layout):
+                                placed_item = rotated_item.at(gx_fall, gy_fall)
+                                offset_c, offset_r = placed_item.get_body_offset()
                                 key = (gx_fall + offset_c, gy_fall + offset_r)
-                                child_layout[key] = item
+                                child_layout[key] = placed_item
                                 placed = True
                                 break
                         if placed: break
@@ -169,18 +162,19 @@ class GeneticSolver(BaseSolver):
         return child_layout
 
     def _mutate(self, layout: Dict) -> Dict:
-        if not layout or random.random() > self.mutation_rate: return layout
-        mutated_layout = {key: item.clone() for key, item in layout.items()}
+        if not layout or self.rng.random() > self.mutation_rate: return layout
+        mutated_layout = layout.copy()
         item_keys = list(mutated_layout.keys())
         if not item_keys: return layout
-        item_to_mutate_key = random.choice(item_keys)
-        item_to_mutate = mutated_layout.pop(item_to_mutate_key)
+        item_to_mutate_key = self.rng.choice(item_keys)
+        original_item = mutated_layout.pop(item_to_mutate_key)
+        item_to_mutate = original_item
         
         for _ in range(10):
-            action = random.choice(['move', 'rotate', 'swap'])
+            action = self.rng.choice(['move', 'rotate', 'swap'])
             
             if action == 'rotate':
-                item_to_mutate.rotate()
+                item_to_mutate = item_to_mutate.rotated()
                 if self._is_placement_valid(item_to_mutate, item_to_mutate.gx, item_to_mutate.gy, mutated_layout):
                     offset_c, offset_r = item_to_mutate.get_body_offset()
                     key = (item_to_mutate.gx + offset_c, item_to_mutate.gy + offset_r)
@@ -190,82 +184,94 @@ class GeneticSolver(BaseSolver):
             elif action == 'move':
                 pos = self._get_random_valid_position(item_to_mutate)
                 if pos and self._is_placement_valid(item_to_mutate, pos[0], pos[1], mutated_layout):
-                    item_to_mutate.gx, item_to_mutate.gy = pos
+                    item_to_mutate = item_to_mutate.at(*pos)
                     offset_c, offset_r = item_to_mutate.get_body_offset()
                     key = (item_to_mutate.gx + offset_c, item_to_mutate.gy + offset_r)
                     mutated_layout[key] = item_to_mutate
                     return mutated_layout
 
             elif action == 'swap' and len(mutated_layout) > 0:
-                other_item_key = random.choice(list(mutated_layout.keys()))
+                other_item_key = self.rng.choice(list(mutated_layout.keys()))
                 other_item = mutated_layout[other_item_key]
-                
-                original_pos_mut = (item_to_mutate.gx, item_to_mutate.gy)
-                original_pos_other = (other_item.gx, other_item.gy)
 
-                item_to_mutate.gx, item_to_mutate.gy = original_pos_other
-                other_item.gx, other_item.gy = original_pos_mut
+                swapped_mut = item_to_mutate.at(other_item.gx, other_item.gy)
+                swapped_other = other_item.at(item_to_mutate.gx, item_to_mutate.gy)
                 
-                rest_of_layout = {k: v for k, v in mutated_layout.items() if k != other_item_key}
+                rest_of_layout = self._new_layout({k: v for k, v in mutated_layout.items() if k != other_item_key})
 
-                if self._is_placement_valid(item_to_mutate, item_to_mutate.gx, item_to_mutate.gy, rest_of_layout) and \
-                   self._is_placement_valid(other_item, other_item.gx, other_item.gy, rest_of_layout):
+                if self._is_placement_valid(swapped_mut, swapped_mut.gx, swapped_mut.gy, rest_of_layout) and \
+                   self._is_placement_valid(swapped_other, swapped_other.gx, swapped_other.gy, rest_of_layout):
                     
-                    rest_of_layout['temp_key_for_mutated'] = item_to_mutate
-                    if self._is_placement_valid(other_item, other_item.gx, other_item.gy, rest_of_layout):
+                    rest_of_layout['temp_key_for_mutated'] = swapped_mut
+                    if self._is_placement_valid(swapped_other, swapped_other.gx, swapped_other.gy, rest_of_layout):
                         mutated_layout.pop(other_item_key)
-                        offset_c1, offset_r1 = item_to_mutate.get_body_offset()
-                        offset_c2, offset_r2 = other_item.get_body_offset()
-                        key1 = (item_to_mutate.gx + offset_c1, item_to_mutate.gy + offset_r1)
-                        key2 = (other_item.gx + offset_c2, other_item.gy + offset_r2)
-                        mutated_layout[key1] = item_to_mutate
-                        mutated_layout[key2] = other_item
+                        offset_c1, offset_r1 = swapped_mut.get_body_offset()
+                        offset_c2, offset_r2 = swapped_other.get_body_offset()
+                        key1 = (swapped_mut.gx + offset_c1, swapped_mut.gy + offset_r1)
+                        key2 = (swapped_other.gx + offset_c2, swapped_other.gy + offset_r2)
+                        mutated_layout[key1] = swapped_mut
+                        mutated_layout[key2] = swapped_other
                         return mutated_layout
 
-                item_to_mutate.gx, item_to_mutate.gy = original_pos_mut
-                other_item.gx, other_item.gy = original_pos_other
-
-        mutated_layout[item_to_mutate_key] = item_to_mutate
+        # No valid mutation found: keep the item where (and how) it was
+        mutated_layout[item_to_mutate_key] = original_item
         return mutated_layout
 
-    def solve(self) -> Tuple[Dict, float]:
+    def _initial_population(self) -> List[Dict]:
         population = [self._create_random_individual() for _ in range(self.population_size - 1)]
         if self.initial_layout:
-            cloned_initial = {key: item.clone() for key, item in self.initial_layout.items()}
-            population.append(cloned_initial)
+            population.append(self.initial_layout.copy())
         else:
             population.append(self._create_random_individual())
+        return population
+
+    def _score_population(self, population: List[Dict]) -> List[Tuple[Dict, float, EvaluationResult]]:
+        """Evaluates a population and returns (layout, score, result) entries, best first."""
+        results = self._evaluate_population(population)
+        scored_population = [(ind, result.total_score, result) for ind, result in zip(population, results)]
+        scored_population.sort(key=lambda x: x[1], reverse=True)
+        return scored_population
+
+    def _next_generation(self, scored_population: List[Tuple[Dict, float, EvaluationResult]]) -> List[Dict]:
+        next_population = []
+        for i in range(self.elitism_count):
+            next_population.append(scored_population[i][0])
+        
+        while len(next_population) < self.population_size:
+            parent1_layout, p1_result = self._tournament_selection(scored_population)
+            parent2_layout, _ = self._tournament_selection(scored_population)
+            
+            child = self._crossover(parent1_layout, parent2_layout, p1_result)
+            # 变异作用在交叉刚生成、还没评估过的子代上，没有可增量更新的 ScoringSession：
+            # 子代在 _evaluate_population 中整体评估（去重、缓存、可用进程池）
+            child = self._mutate(child)
+            next_population.append(child)
+        return next_population
 
+    def solve(self) -> Tuple[Dict, float]:
+        if self.islands > 1:
+            return self._solve_islands()
+
+        self._start_clock()
+        population = self._initial_population()
         best_layout_overall = {}
         best_score_overall = -1.0
+        stop_reason = None
 
-        for gen in range(self.generations):
-            scored_population = []
-            for ind in population:
-                score, i_map = self._calculate_score(ind)
-                scored_population.append((ind, score, i_map))
-
-            scored_population.sort(key=lambda x: x[1], reverse=True)
+        with self._worker_pool():
+            for gen in range(self.generations):
+                scored_population = self._score_population(population)
             
-            current_best_layout, current_best_score, _ = scored_population[0]
-            if current_best_score > best_score_overall:
-                best_score_overall = current_best_score
-                best_layout_overall = {key: item.clone() for key, item in current_best_layout.items()}
+                current_best_layout, current_best_score, _ = scored_population[0]
+                if current_best_score > best_score_overall:
+                    best_score_overall = current_best_score
+                    best_layout_overall = current_best_layout.copy()
             
-            print(f"Generation {gen+1}/{self.generations} - Best Score: {best_score_overall:.2f}")
+                self._report_progress(gen + 1, self.generations, best_score_overall, best_layout_overall)
 
-            next_population = []
-            for i in range(self.elitism_count):
-                next_population.append(scored_population[i][0])
-            
-            while len(next_population) < self.population_size:
-                parent1_layout, p1_map = self._tournament_selection(scored_population)
-                parent2_layout, _ = self._tournament_selection(scored_population)
-                
-                child = self._crossover(parent1_layout, parent2_layout, p1_map)
-                child = self._mutate(child)
-                next_population.append(child)
-            
-            population = next_population
+                stop_reason = self._should_stop(best_score_overall)
+                if stop_reason: break
+
+                population = self._next_generation(scored_population)
 
-        return best_layout_overall, best_score_overall
\ No newline at end of file
+        return self._finish(best_layout_overall, best_score_overall, stop_reason)
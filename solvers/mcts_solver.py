@@ -0,0 +1,249 @@
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from solvers.base_solver import BaseSolver
+from engine import Item, Layout, Placement
+from bitboard import popcount
+from BackpackEnv import BackpackEnv
+
+MODEL_PATH = "ppo_maskable_backpack_solver.zip"
+# 跳过当前物品的动作：总是合法，先验是最不看好的放置的 SKIP_PRIOR 倍
+SKIP = -1
+SKIP_PRIOR = 0.5
+
+
+class _Node:
+    """Statistics of one search state: legal actions with their priors, visit counts and value sums."""
+    __slots__ = ("actions", "priors", "visits", "values", "total")
+
+    def __init__(self, actions: List[int], priors: List[float]):
+        self.actions = actions
+        self.priors = priors
+        self.visits = [0] * len(actions)
+        self.values = [0.0] * len(actions)
+        self.total = 0
+
+
+class MCTSSolver(BaseSolver):
+    """
+    Algorithm J: Monte Carlo Tree Search over BackpackEnv's action space.
+    Items come in the environment's order and an action is BackpackEnv's
+    (x, y, rotation) index, restricted to placements that fit, or SKIP, which
+    leaves the item out (a layout can score more without it, e.g. when it would
+    take the cell another item's star needs). SKIP's prior is SKIP_PRIOR times
+    that of the least promising placement, so it is explored last. Each item gets
+    `simulations` PUCT simulations; a new state is valued with a rollout that
+    places the remaining items randomly (rollout="random") or with the best of
+    `greedy_samples` random fits per item (rollout="greedy"), scored by the
+    engine. Then the most visited action is committed. States are shared in a
+    transposition table keyed on the item index and the placed items (whose
+    occupancy bitboard is part of the key), so the symmetric rotations of an
+    item and the subtree of the committed action are reused.
+
+    prior="policy" uses the trained MaskablePPO policy's action probabilities as
+    priors (AlphaZero-style), prior="heuristic" prefers placements whose stars or
+    body meet placed items, and prior="auto" takes the policy when MODEL_PATH exists.
+    """
+    def __init__(self, items: List[Item], backpack_cols: int, backpack_rows: int,
+                 simulations: int = 200, exploration: float = 1.5, rollout: str = "greedy", greedy_samples: int = 8,
+                 prior: str = "auto", model_path: str = MODEL_PATH, initial_layout: Optional[Dict] = None,
+                 time_budget_s: Optional[float] = None, seed: Optional[int] = None):
+        super().__init__(items, backpack_cols, backpack_rows, time_budget_s, None, 0.0, seed)
+        if rollout not in ("random", "greedy"):
+            raise ValueError(f"rollout must be 'random' or 'greedy', got '{rollout}'")
+        if prior not in ("auto", "policy", "heuristic", "uniform"):
+            raise ValueError(f"prior must be 'auto', 'policy', 'heuristic' or 'uniform', got '{prior}'")
+        self.simulations = max(1, simulations)
+        self.exploration = exploration
+        self.rollout = rollout
+        self.greedy_samples = max(1, greedy_samples)
+        self.model = None
+        if prior == "policy" or (prior == "auto" and os.path.exists(model_path)):
+            from sb3_contrib import MaskablePPO  # 只有用策略做先验时才需要
+            if not os.path.exists(model_path):
+                raise FileNotFoundError(f"Trained model not found at '{model_path}'. Please run train.py first.")
+            self.model = MaskablePPO.load(model_path)
+            prior = "policy"
+        self.prior = "heuristic" if prior == "auto" else prior
+        self.initial_layout = self._to_placements(initial_layout) if initial_layout else None
+        self.env = BackpackEnv(self.items_to_place, backpack_cols, backpack_rows)
+        self._table: Dict[Tuple, _Node] = {}
+        self._order: List[Placement] = []
+        self._positions: List[Dict[int, Tuple[Placement, object]]] = []
+        self._value_range = [math.inf, -math.inf]
+        self._best: Tuple[float, Optional[Layout]] = (-math.inf, None)
+
+    # --- 动作空间 ---
+    def _precompute(self):
+        """Every action of every item that stays inside the backpack, with its anchored masks."""
+        cells = self.backpack_cols * self.backpack_rows
+        self._positions = []
+        for item in self._order:
+            positions = {}
+            for candidate in self._candidate_placements(item):
+                # 环境的动作只能表示 0 <= x < cols, 0 <= y < rows
+                if not (0 <= candidate.gx < self.backpack_cols and 0 <= candidate.gy < self.backpack_rows): continue
+                turns = (candidate.rotation - item.rotation) % 4
+                action = turns * cells + candidate.gy * self.backpack_cols + candidate.gx
+                positions[action] = (candidate, candidate.get_masks(self.backpack_cols, self.backpack_rows)
+                                     .at(candidate.gx, candidate.gy))
+            self._positions.append(positions)
+
+    def _legal(self, index: int, occupancy: int) -> List[int]:
+        """BackpackEnv's action mask for item `index`, one rotation per distinct shape."""
+        return [action for action, (_, masks) in self._positions[index].items() if not masks.body & occupancy]
+
+    def _child(self, state: Tuple[int, Layout], action: int) -> Tuple[int, Layout]:
+        index, layout = state
+        if action == SKIP:
+            return index + 1, layout
+        item = self._positions[index][action][0]
+        offset_c, offset_r = item.get_body_offset()
+        child = layout.copy()
+        child[(item.gx + offset_c, item.gy + offset_r)] = item
+        return index + 1, child
+
+    def _key(self, state: Tuple[int, Layout]) -> Tuple:
+        index, layout = state
+        return index, layout.occupancy, self._layout_signature(layout)
+
+    # --- 先验 ---
+    def _priors(self, state: Tuple[int, Layout], actions: List[int]) -> List[float]:
+        """Priors of the placements, then of SKIP (always the last action)."""
+        placements = actions[:-1]
+        if not placements:
+            return [1.0]
+        priors = self._placement_priors(state, placements)
+        priors.append(SKIP_PRIOR * min((p for p in priors if p > 0), default=1.0))
+        total = sum(priors)
+        return [p / total for p in priors]
+
+    def _placement_priors(self, state: Tuple[int, Layout], actions: List[int]) -> List[float]:
+        if self.prior == "uniform":
+            return [1.0 / len(actions)] * len(actions)
+        index, layout = state
+        if self.prior == "policy":
+            weights = self._policy_priors(index, layout, actions)
+        else:
+            occupancy = layout.occupancy
+            hotspots = 0
+            for placed in layout.values():
+                hotspots |= placed.get_masks(self.backpack_cols, self.backpack_rows).at(placed.gx, placed.gy).star_union
+            hotspots &= ~occupancy
+            weights = []
+            for action in actions:
+                masks = self._positions[index][action][1]
+                weights.append(1.0 + popcount(masks.star_union & occupancy) + popcount(masks.body & hotspots))
+        total = sum(weights)
+        return [w / total for w in weights] if total > 0 else [1.0 / len(actions)] * len(actions)
+
+    def _policy_priors(self, index: int, layout: Layout, actions: List[int]) -> List[float]:
+        """The MaskablePPO policy's probabilities of `actions`, on the observation BackpackEnv would give."""
+        import torch
+        env = self.env
+        env.items_to_place, env.current_item_index, env.placed_items = self._order, index, layout
+        action_masks = np.zeros(env.num_actions, dtype=bool)
+        action_masks[actions] = True
+        obs_tensor, _ = self.model.policy.obs_to_tensor(env._get_obs())
+        with torch.no_grad():
+            distribution = self.model.policy.get_distribution(obs_tensor, action_masks=action_masks)
+        probs = distribution.distribution.probs[0].cpu().numpy()
+        return [float(probs[action]) for action in actions]
+
+    # --- 模拟 ---
+    def _rollout(self, state: Tuple[int, Layout]) -> float:
+        """Completes the layout with the rollout policy; returns its score (and remembers the best layout)."""
+        index, layout = state
+        session = self.engine.start_session(layout, self.backpack_cols, self.backpack_rows, explain=False)
+        self.evaluations += 1
+        occupancy = layout.occupancy
+        score = session.total_score
+        for i in range(index, len(self._order)):
+            legal = self._legal(i, occupancy)
+            if not legal: continue
+            samples = 1 if self.rollout == "random" else self.greedy_samples
+            best = None
+            for action in self.rng.sample(legal, min(samples, len(legal))):
+                item, masks = self._positions[i][action]
+                offset_c, offset_r = item.get_body_offset()
+                key = (item.gx + offset_c, item.gy + offset_r)
+                candidate_score = session.add(key, item)
+                self.evaluations += 1
+                if best is None or candidate_score > best[0]:
+                    best = (candidate_score, key, item, masks)
+                session.remove(key)
+                self.evaluations += 1
+            score, key, item, masks = best
+            session.add(key, item)
+            self.evaluations += 1
+            occupancy |= masks.body
+        if score > self._best[0]:
+            self._best = (score, self._new_layout(session.placed_items()))
+        return score
+
+    def _select(self, node: _Node) -> int:
+        low, high = self._value_range
+        spread = high - low if high > low else 1.0
+        scale = self.exploration * math.sqrt(node.total + 1)
+        best_edge, best_value = 0, -math.inf
+        for edge, prior in enumerate(node.priors):
+            visits = node.visits[edge]
+            q = (node.values[edge] / visits - low) / spread if visits else 0.0
+            value = q + scale * prior / (1 + visits)
+            if value > best_value:
+                best_edge, best_value = edge, value
+        return best_edge
+
+    def _simulate(self, root: Tuple[int, Layout]):
+        state, path = root, []
+        while True:
+            key = self._key(state)
+            node = self._table.get(key)
+            if node is None:
+                actions = self._legal(state[0], state[1].occupancy) + [SKIP] if state[0] < len(self._order) else []
+                if actions:
+                    self._table[key] = _Node(actions, self._priors(state, actions))
+                value = self._rollout(state)
+                break
+            edge = self._select(node)
+            path.append((node, edge))
+            state = self._child(state, node.actions[edge])
+        self._value_range[0] = min(self._value_range[0], value)
+        self._value_range[1] = max(self._value_range[1], value)
+        for node, edge in path:
+            node.visits[edge] += 1
+            node.values[edge] += value
+            node.total += 1
+
+    def solve(self) -> Tuple[Dict, float]:
+        self._start_clock()
+        self.env.reset(seed=self.seed)
+        self._order = list(self.env.items_to_place)
+        self._precompute()
+        self._table.clear()
+        self._value_range = [math.inf, -math.inf]
+        self._best = (-math.inf, None)
+        if self.initial_layout:
+            score, _ = self._calculate_score(self.initial_layout)
+            self._best = (score, self.initial_layout.copy())
+
+        total = len(self._order)
+        state = (0, self._new_layout())
+        stop_reason = None
+        while state[0] < total and not stop_reason:
+            for _ in range(self.simulations):
+                self._simulate(state)
+                if self._cancelled() or self._out_of_time(): break
+            node = self._table[self._key(state)]
+            edge = max(range(len(node.actions)), key=lambda e: (node.visits[e], node.priors[e]))
+            state = self._child(state, node.actions[edge])
+            self._report_progress(state[0], total, *self._best)
+            stop_reason = self._should_stop(self._best[0])
+
+        if state[0] == total:
+            self._rollout(state)  # 提交的路径本身也是一个完整布局
+        best_score, best_layout = self._best
+        return self._finish(best_layout, best_score, stop_reason)
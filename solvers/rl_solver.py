@@ -1,58 +1,149 @@
+import importlib.util
 import os
-from sb3_contrib import MaskablePPO
-from sb3_contrib.common.wrappers import ActionMasker
+from typing import Optional
+
+import numpy as np
 
 from solvers.base_solver import BaseSolver
 from BackpackEnv import BackpackEnv 
 
+# 推理后端只在加载模型时导入：导出的策略只需要 onnxruntime 或 torch，完整的 MaskablePPO 需要 sb3-contrib
+BACKENDS = {".onnx": "onnxruntime", ".pt": "torch", ".zip": "sb3_contrib"}
+
+
+def _installed(module: str) -> bool:
+    """Whether `module` can be imported, without importing it."""
+    try:
+        return importlib.util.find_spec(module) is not None
+    except ValueError:  # 已导入但没有 __spec__ 的模块
+        return True
+
+
+if not any(_installed(module) for module in BACKENDS.values()):
+    raise ImportError("RLSolver needs onnxruntime, torch or sb3_contrib")
+
+MODEL_BASE_PATH = "ppo_maskable_backpack_solver"
+
 class RLSolver(BaseSolver):
     """
     A solver that uses a pre-trained, action-masked Reinforcement Learning 
     model to guarantee a valid and complete item placement.
+    With episodes > 1 it runs that many episodes side by side (each with its own
+    item order, sampling actions stochastically by default), steps all their
+    observations through the policy as one batch and keeps the best layout.
+
+    The policy is read from `policy_path`, or else from the first of
+    ppo_maskable_backpack_solver.onnx / .pt / .zip that exists and whose backend
+    is installed. The .onnx and .pt files are written by export_policy.py and only
+    need onnxruntime or torch; the action mask is then applied here.
     """
-    def __init__(self, items, backpack_cols, backpack_rows, initial_layout=None):
-        super().__init__(items, backpack_cols, backpack_rows)
+    def __init__(self, items, backpack_cols, backpack_rows, initial_layout=None, episodes: int = 1,
+                 deterministic: Optional[bool] = None, policy_path: Optional[str] = None,
+                 time_budget_s=None, seed=None):
+        super().__init__(items, backpack_cols, backpack_rows, time_budget_s=time_budget_s, seed=seed)
+        self.episodes = max(1, episodes)
+        # 默认：单个回合用确定性策略（原来的行为），多个回合按策略分布采样
+        self.deterministic = self.episodes == 1 if deterministic is None else deterministic
         
-        self.model_path = "ppo_maskable_backpack_solver.zip"
+        self._np_rng = np.random.default_rng(seed)
+        self.model = None   # 完整的 MaskablePPO（.zip）
+        self.policy = None  # 导出的策略：观测批次 -> 动作 logits
+        
+        self.model_path = policy_path or self._find_model()
         if not os.path.exists(self.model_path):
             raise FileNotFoundError(
                 f"Trained model not found at '{self.model_path}'. "
                 "Please run train.py with the action masking environment."
             )
-        
-        self.model = MaskablePPO.load(self.model_path)
-        print("Maskable RL model loaded successfully.")
+        self._load(self.model_path)
+        print(f"Maskable RL model loaded successfully from '{self.model_path}'.")
+
+    def _find_model(self) -> str:
+        for extension, module in BACKENDS.items():
+            if _installed(module) and os.path.exists(MODEL_BASE_PATH + extension):
+                return MODEL_BASE_PATH + extension
+        return MODEL_BASE_PATH + ".zip"
+
+    def _load(self, path: str):
+        extension = os.path.splitext(path)[1]
+        module = BACKENDS.get(extension, "sb3_contrib")
+        if not _installed(module):
+            raise ImportError(f"Loading '{path}' needs {module}")
+        if extension == ".onnx":
+            import onnxruntime
+            session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+            input_name = session.get_inputs()[0].name
+            self.policy = lambda obs: session.run(None, {input_name: obs})[0]
+        elif extension == ".pt":
+            import torch
+            scripted = torch.jit.load(path, map_location="cpu").eval()
+            def policy(obs):
+                with torch.no_grad():
+                    return scripted(torch.as_tensor(obs)).numpy()
+            self.policy = policy
+        else:
+            from sb3_contrib import MaskablePPO
+            self.model = MaskablePPO.load(path)
+
+    def _predict(self, observations: np.ndarray, action_masks: np.ndarray) -> np.ndarray:
+        """One action per row: argmax or a sample of the masked policy distribution."""
+        if self.model is not None:
+            actions, _states = self.model.predict(observations, action_masks=action_masks,
+                                                  deterministic=self.deterministic)
+            return actions
+        logits = np.where(action_masks, self.policy(observations.astype(np.float32)), -np.inf)
+        if self.deterministic:
+            return logits.argmax(axis=1)
+        probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+        probs /= probs.sum(axis=1, keepdims=True)
+        return np.array([self._np_rng.choice(len(row), p=row) for row in probs])
 
     def solve(self):
-        print("Running Maskable RL Solver...")
-        
-        # 1. Create and wrap the environment
-        env = BackpackEnv(
-            items=self.items_to_place, 
-            backpack_cols=self.backpack_cols, 
-            backpack_rows=self.backpack_rows
-        )
-        env = ActionMasker(env, lambda env: env.action_masks())
+        print(f"Running Maskable RL Solver ({self.episodes} episode(s))...")
+        self._start_clock()
+        if self.seed is not None and self.model is not None:
+            self.model.set_random_seed(self.seed)
         
-        obs, info = env.reset()
-        terminated = False
+        # 1. One environment per episode; a different reset seed gives each its own item order
+        envs = [BackpackEnv(items=self.items_to_place, backpack_cols=self.backpack_cols,
+                            backpack_rows=self.backpack_rows) for _ in range(self.episodes)]
+        observations = [env.reset(seed=None if self.seed is None else self.seed + i)[0]
+                        for i, env in enumerate(envs)]
+        active = list(range(self.episodes))
+        stop_reason = None
+        step = 0
+        best_score, best_layout = float('-inf'), {}
         
-        # 2. Loop until all items are placed
-        while not terminated:
-            action_masks = env.action_masks()
-            action, _states = self.model.predict(obs, action_masks=action_masks, deterministic=True)
-            obs, reward, terminated, truncated, info = env.step(action)
-            
-        # --- FIX: Access the 'placed_items' from the unwrapped environment ---
-        unwrapped_env = env.unwrapped
-        # --- END FIX ---
-
-        # 3. Extract and visualize the final layout
-        final_layout = {}
-        for key, data_item in unwrapped_env.placed_items.items():
-            visual_item = data_item.clone(visuals=True)
-            final_layout[key] = visual_item
+        # 2. Step every unfinished episode with one batched forward pass per step
+        while active:
+            if self._cancelled():
+                stop_reason = "cancelled"
+                break
+            if self._out_of_time():
+                # Budget spent: return the best (partial) layout placed so far
+                stop_reason = f"time budget of {self.time_budget_s:.1f}s used"
+                break
+            masks = [envs[i].action_masks() for i in active]
+            # 当前物品已放不下的回合到此结束（保留已放好的部分布局）
+            active = [i for i, mask in zip(active, masks) if mask.any()]
+            masks = [mask for mask in masks if mask.any()]
+            if not active: break
+            actions = self._predict(np.stack([observations[i] for i in active]), np.stack(masks))
+            still_active = []
+            for i, action in zip(active, actions):
+                observations[i], reward, terminated, truncated, info = envs[i].step(int(action))
+                if not terminated:
+                    still_active.append(i)
+            active = still_active
+            step += 1
+            leader = max(envs, key=lambda env: env.scoring.total_score)
+            if leader.scoring.total_score > best_score:
+                best_score, best_layout = leader.scoring.total_score, leader.placed_items.copy()
+            self._report_progress(step, len(self.items_to_place), best_score, best_layout)
+
+        # 3. Extract the best layout (Placements; the UI builds the sprites)
+        final_layout = max(envs, key=lambda env: env.scoring.total_score).placed_items.copy()
         
         final_score, _ = self._calculate_score(final_layout)
         
-        return final_layout, final_score
\ No newline at end of file
+        return self._finish(final_layout, final_score, stop_reason)
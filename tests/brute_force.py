@@ -0,0 +1,60 @@
+"""Brute-force optimum of tiny instances, the oracle the exact solvers are tested against."""
+import random
+from typing import Dict, List
+
+from engine import CalculationEngine, Layout, Placement, placement_fits
+
+
+def positions(item: Placement, cols: int, rows: int) -> List[Placement]:
+    """Every rotation and in-bounds position of item."""
+    found = []
+    for variant in item.variants():
+        for gx in range(-variant.grid_width, cols + 1):
+            for gy in range(-variant.grid_height, rows + 1):
+                if placement_fits(variant, gx, gy, {}, cols, rows):
+                    found.append(variant.at(gx, gy))
+    return found
+
+
+_BEST_CACHE: Dict[tuple, float] = {}
+
+
+def brute_force_best(items: List[Placement], cols: int, rows: int) -> float:
+    """Scores every assignment (each item placed somewhere or left out) and returns the best total."""
+    cache_key = (tuple(item.item_def.name for item in items), cols, rows)
+    if cache_key in _BEST_CACHE:
+        return _BEST_CACHE[cache_key]
+    engine = CalculationEngine()
+    candidates = [positions(item, cols, rows) for item in items]
+    best = 0.0
+
+    def search(i: int, layout: Layout):
+        nonlocal best
+        if i == len(items):
+            best = max(best, engine.run(layout, cols, rows, explain=False).total_score)
+            return
+        search(i + 1, layout)
+        for placement in candidates[i]:
+            if not placement_fits(placement, placement.gx, placement.gy, layout, cols, rows): continue
+            offset_c, offset_r = placement.get_body_offset()
+            key = (placement.gx + offset_c, placement.gy + offset_r)
+            layout[key] = placement
+            search(i + 1, layout)
+            del layout[key]
+
+    search(0, Layout(cols, rows))
+    _BEST_CACHE[cache_key] = best
+    return best
+
+
+def small_instance(item_defs, names: List[str], seed: int, size: int = 3) -> List[Placement]:
+    """`size` random items; about one instance in four repeats an item."""
+    rng = random.Random(seed)
+    chosen = rng.sample(names, size)
+    if rng.random() < 0.25:
+        chosen[-1] = chosen[0]
+    return [Placement(item_defs[name]) for name in chosen]
+
+
+def layout_score(layout, cols: int, rows: int) -> float:
+    return CalculationEngine().run(layout, cols, rows, explain=False).total_score
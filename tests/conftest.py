@@ -0,0 +1,25 @@
+import os
+import sys
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pytest
+
+from solve_cli import load_item_defs
+
+# items.json 的物品没有分数和效果；测试用带星星和被动效果的 items_old.json
+ITEMS_FILE = os.path.join(ROOT, 'items_old.json')
+
+
+@pytest.fixture(scope='session')
+def item_defs():
+    return load_item_defs(ITEMS_FILE)
+
+
+@pytest.fixture(scope='session')
+def item_names(item_defs):
+    return sorted({item_def.name for item_def in item_defs.values()})
@@ -0,0 +1,108 @@
+"""
+Regenerates tests/data/engine_baseline.json: random layouts of items_old.json scored
+by the original CalculationEngine (engine.py at the baseline commit, read from git),
+the reference that test_engine_baseline.py holds the compiled engine to.
+
+    python tests/make_engine_baseline.py [--rev ce619f9] [--layouts 400]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import types
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from definitions import GridType, Rarity, ItemClass, Element, ItemType
+
+BACKPACK_COLS, BACKPACK_ROWS = 9, 7
+OUTPUT = os.path.join(ROOT, 'tests', 'data', 'engine_baseline.json')
+
+
+def load_baseline_engine(rev: str) -> types.ModuleType:
+    source = subprocess.run(['git', 'show', f'{rev}:engine.py'], cwd=ROOT, check=True,
+                            capture_output=True, text=True, encoding='utf-8').stdout
+    module = types.ModuleType('baseline_engine')
+    exec(compile(source, f'{rev}:engine.py', 'exec'), module.__dict__)
+    return module
+
+
+def load_items(engine, filepath: str):
+    with open(filepath, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {d['name']: engine.Item(0, 0, d['name'], Rarity[d['rarity']], ItemClass[d['item_class']],
+                                   [Element[e] for e in d.get('elements', [])], [ItemType[t] for t in d.get('types', [])],
+                                   [[GridType(c) for c in r] for r in d['shape_matrix']], d.get('base_score', 0),
+                                   d.get('star_effects', {}), d.get('has_cooldown', False),
+                                   d.get('is_start_of_battle', False), d.get('passive_effects', []), visuals=False)
+            for d in data.values()}
+
+
+def random_layout(items, names, rng: random.Random):
+    """(name, rotation, gx, gy) entries of 2-12 items whose bodies fit without overlapping."""
+    occupied, entries = set(), []
+    for _ in range(rng.randint(2, 12)):
+        name, rotation = rng.choice(names), rng.randrange(4)
+        item = items[name].clone(visuals=False)
+        for _ in range(rotation):
+            item.rotate()
+        body = [(c, r) for r, row in enumerate(item.shape_matrix) for c, cell in enumerate(row) if cell == GridType.OCCUPIED]
+        for _ in range(30):
+            gx, gy = rng.randint(-3, BACKPACK_COLS), rng.randint(-3, BACKPACK_ROWS)
+            cells = [(gx + c, gy + r) for c, r in body]
+            if all(0 <= x < BACKPACK_COLS and 0 <= y < BACKPACK_ROWS and (x, y) not in occupied for x, y in cells):
+                occupied.update(cells)
+                entries.append((name, rotation, gx, gy))
+                break
+    return entries
+
+
+def score(engine, items, entries):
+    layout = {}
+    for name, rotation, gx, gy in entries:
+        item = items[name].clone(visuals=False)
+        for _ in range(rotation):
+            item.rotate()
+        item.gx, item.gy = gx, gy
+        offset_c, offset_r = item.get_body_offset()
+        layout[(gx + offset_c, gy + offset_r)] = item
+    calculator = engine.CalculationEngine()
+    calculator.run(layout, BACKPACK_COLS, BACKPACK_ROWS)
+    return {
+        "items": [list(entry) for entry in entries],
+        "total_score": sum(item.final_score for item in layout.values()) + calculator.neutral_pool_total,
+        "neutral_pool_total": calculator.neutral_pool_total,
+        "neutral_pool_modifiers": list(calculator.neutral_pool_modifiers),
+        "interaction_map": [list(pair) for pair in calculator.interaction_map],
+        "per_item": [{"final_score": item.final_score, "score_modifiers": list(item.score_modifiers),
+                      "activated_stars": {t.name: n for t, n in item.activated_stars.items()},
+                      "occupying_stars": [[t.name, source] for t, source in item.occupying_stars],
+                      "temporary_elements": [e.name for e in item.temporary_elements]}
+                     for item in layout.values()],
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Regenerate the baseline engine fixture.")
+    parser.add_argument('--rev', default='ce619f9', help="Commit whose engine.py is the reference")
+    parser.add_argument('--layouts', type=int, default=400)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    engine = load_baseline_engine(args.rev)
+    items = load_items(engine, os.path.join(ROOT, 'items_old.json'))
+    names = sorted(items)
+    rng = random.Random(args.seed)
+    cases = [score(engine, items, random_layout(items, names, rng)) for _ in range(args.layouts)]
+    with open(OUTPUT, 'w', encoding='utf-8') as f:
+        json.dump({"rev": args.rev, "backpack": [BACKPACK_COLS, BACKPACK_ROWS], "cases": cases}, f, ensure_ascii=False)
+    print(f"{len(cases)} layouts written to {OUTPUT}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
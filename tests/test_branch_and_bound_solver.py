@@ -0,0 +1,19 @@
+import pytest
+
+from brute_force import brute_force_best, layout_score, small_instance
+from solvers.branch_and_bound_solver import BranchAndBoundSolver
+
+# (物品数, 背包列, 背包行, 种子)：3 个物品放 4x3、4 个物品放 3x3，穷举都在一秒内
+INSTANCES = [(3, 4, 3, seed) for seed in range(24)] + [(4, 3, 3, seed) for seed in range(16)]
+
+
+@pytest.mark.parametrize('warm_start', [True, False])
+@pytest.mark.parametrize('size, cols, rows, seed', INSTANCES)
+def test_matches_brute_force(item_defs, item_names, size, cols, rows, seed, warm_start):
+    items = small_instance(item_defs, item_names, seed, size)
+    best = brute_force_best(items, cols, rows)
+    solver = BranchAndBoundSolver(items, cols, rows, warm_start=warm_start, seed=0)
+    layout, score = solver.solve()
+    assert score == pytest.approx(best, abs=1e-6)
+    assert layout_score(layout, cols, rows) == pytest.approx(score, abs=1e-6)
+    assert solver.bound >= best - 1e-6
@@ -0,0 +1,69 @@
+"""The compiled engine against the original CalculationEngine (see make_engine_baseline.py)."""
+import json
+import os
+
+import pytest
+
+from engine import CalculationEngine, Item, Placement
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'data', 'engine_baseline.json')
+
+with open(FIXTURE, 'r', encoding='utf-8') as f:
+    BASELINE = json.load(f)
+COLS, ROWS = BASELINE['backpack']
+
+
+def build_layout(item_defs, entries):
+    layout = {}
+    for name, rotation, gx, gy in entries:
+        placement = Placement(item_defs[name], rotation, gx, gy)
+        offset_c, offset_r = placement.get_body_offset()
+        layout[(gx + offset_c, gy + offset_r)] = placement
+    return layout
+
+
+@pytest.mark.parametrize('case', BASELINE['cases'], ids=lambda case: f"{len(case['items'])}-items")
+def test_matches_baseline_engine(item_defs, case):
+    layout = build_layout(item_defs, case['items'])
+    result = CalculationEngine().run(layout, COLS, ROWS)
+
+    assert result.total_score == pytest.approx(case['total_score'], abs=1e-9)
+    assert result.neutral_pool_total == pytest.approx(case['neutral_pool_total'], abs=1e-9)
+    assert result.neutral_pool_modifiers == case['neutral_pool_modifiers']
+    assert [list(pair) for pair in result.interaction_map] == case['interaction_map']
+    for key, expected in zip(layout, case['per_item']):
+        assert result.final_scores[key] == pytest.approx(expected['final_score'], abs=1e-9)
+        assert result.score_modifiers[key] == expected['score_modifiers']
+        assert {t.name: n for t, n in result.activated_stars[key].items()} == expected['activated_stars']
+        assert [[t.name, source] for t, source in result.occupying_stars[key]] == expected['occupying_stars']
+        assert [e.name for e in result.temporary_elements[key]] == expected['temporary_elements']
+
+
+def test_fast_path_totals(item_defs):
+    """explain=False skips the texts but must not change any score."""
+    engine = CalculationEngine()
+    for case in BASELINE['cases']:
+        result = engine.run(build_layout(item_defs, case['items']), COLS, ROWS, explain=False)
+        assert result.total_score == pytest.approx(case['total_score'], abs=1e-9)
+
+
+def test_fixture_exercises_effects():
+    """The comparison is only meaningful if the layouts hit stars, elements and the neutral pool."""
+    cases = BASELINE['cases']
+    assert sum(1 for case in cases if case['total_score']) > len(cases) // 2
+    assert any(case['neutral_pool_modifiers'] for case in cases)
+    assert any(item['temporary_elements'] for case in cases for item in case['per_item'])
+    assert any(item['occupying_stars'] for case in cases for item in case['per_item'])
+
+
+def test_sprites_score_like_placements_and_stay_untouched(item_defs):
+    """Item sprites give the same EvaluationResult as Placements; run() writes nothing onto them."""
+    engine = CalculationEngine()
+    for case in BASELINE['cases'][:100]:
+        placements = build_layout(item_defs, case['items'])
+        sprites = {key: Item.from_placement(placement, visuals=False) for key, placement in placements.items()}
+        before = {key: dict(vars(sprite)) for key, sprite in sprites.items()}
+        result = engine.run(sprites, COLS, ROWS)
+        assert result.total_score == pytest.approx(case['total_score'], abs=1e-9)
+        assert result.final_scores == engine.run(placements, COLS, ROWS).final_scores
+        assert {key: vars(sprite) for key, sprite in sprites.items()} == before
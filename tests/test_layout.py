@@ -0,0 +1,95 @@
+import random
+
+from definitions import GridType
+from engine import Layout, Placement, layout_occupancy, placement_fits
+
+COLS, ROWS = 9, 7
+
+
+def occupancy_from_cells(placed_items) -> int:
+    """Occupancy rebuilt straight from the shape matrices, independent of the bitboard tables."""
+    occupancy = 0
+    for item in placed_items.values():
+        for r, row in enumerate(item.shape_matrix):
+            for c, cell in enumerate(row):
+                if cell == GridType.OCCUPIED:
+                    occupancy |= 1 << ((item.gy + r) * COLS + item.gx + c)
+    return occupancy
+
+
+def random_placement(item_defs, names, layout, rng: random.Random):
+    """A random fitting placement of a random item, or None after a few misses."""
+    for _ in range(30):
+        placement = Placement(item_defs[rng.choice(names)], rng.randrange(4))
+        gx, gy = rng.randint(-3, COLS), rng.randint(-3, ROWS)
+        if placement_fits(placement, gx, gy, layout, COLS, ROWS):
+            placement = placement.at(gx, gy)
+            offset_c, offset_r = placement.get_body_offset()
+            return (gx + offset_c, gy + offset_r), placement
+    return None
+
+
+def test_occupancy_follows_every_mutation(item_defs, item_names):
+    rng = random.Random(0)
+    for _ in range(50):
+        layout = Layout(COLS, ROWS)
+        for _ in range(40):
+            op = rng.choice(('set', 'set', 'update', 'setdefault', 'replace', 'del', 'pop', 'popitem', 'copy', 'clear'))
+            if op in ('set', 'update', 'setdefault'):
+                picked = random_placement(item_defs, item_names, layout, rng)
+                if picked is None: continue
+                key, placement = picked
+                if op == 'set':
+                    layout[key] = placement
+                elif op == 'update':
+                    layout.update({key: placement})
+                else:
+                    assert layout.setdefault(key, placement) is placement
+            elif not layout:
+                continue
+            elif op == 'replace':
+                # 同一个键换成另一个摆放：旧物品的格子必须被清掉
+                key = rng.choice(list(layout))
+                rest = {k: v for k, v in layout.items() if k != key}
+                picked = random_placement(item_defs, item_names, rest, rng)
+                if picked is None: continue
+                layout[key] = picked[1]
+            elif op == 'del':
+                del layout[rng.choice(list(layout))]
+            elif op == 'pop':
+                layout.pop(rng.choice(list(layout)))
+            elif op == 'popitem':
+                layout.popitem()
+            elif op == 'copy':
+                copied = layout.copy()
+                assert isinstance(copied, Layout) and copied.occupancy == layout.occupancy
+                layout = copied
+            else:
+                layout.clear()
+            assert layout.occupancy == occupancy_from_cells(layout)
+            assert layout_occupancy(dict(layout), COLS, ROWS) == layout.occupancy
+
+
+def test_constructor_and_missing_pop(item_defs, item_names):
+    rng = random.Random(1)
+    placed = {}
+    for _ in range(8):
+        picked = random_placement(item_defs, item_names, placed, rng)
+        if picked: placed[picked[0]] = picked[1]
+    layout = Layout(COLS, ROWS, placed)
+    assert layout == placed
+    assert layout.occupancy == occupancy_from_cells(placed)
+    assert layout.pop((-99, -99), None) is None
+    assert layout.occupancy == occupancy_from_cells(placed)
+
+
+def test_placement_fits_uses_layout_occupancy(item_defs, item_names):
+    rng = random.Random(2)
+    layout = Layout(COLS, ROWS)
+    for _ in range(10):
+        picked = random_placement(item_defs, item_names, layout, rng)
+        if picked: layout[picked[0]] = picked[1]
+    for _ in range(200):
+        placement = Placement(item_defs[rng.choice(item_names)], rng.randrange(4))
+        gx, gy = rng.randint(-3, COLS), rng.randint(-3, ROWS)
+        assert placement_fits(placement, gx, gy, layout, COLS, ROWS) == placement_fits(placement, gx, gy, dict(layout), COLS, ROWS)
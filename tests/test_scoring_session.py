@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from engine import CalculationEngine, Placement, placement_fits
+
+COLS, ROWS = 9, 7
+
+
+def assert_same_result(session_result, full_result):
+    assert session_result.total_score == pytest.approx(full_result.total_score, abs=1e-9)
+    assert session_result.neutral_pool_total == pytest.approx(full_result.neutral_pool_total, abs=1e-9)
+    assert session_result.neutral_pool_modifiers == full_result.neutral_pool_modifiers
+    assert session_result.interaction_map == full_result.interaction_map
+    assert session_result.final_scores.keys() == full_result.final_scores.keys()
+    for key, score in full_result.final_scores.items():
+        assert session_result.final_scores[key] == pytest.approx(score, abs=1e-9)
+        assert session_result.score_modifiers[key] == full_result.score_modifiers[key]
+        assert session_result.activated_stars[key] == full_result.activated_stars[key]
+        assert session_result.occupying_stars[key] == full_result.occupying_stars[key]
+        assert session_result.temporary_elements[key] == full_result.temporary_elements[key]
+
+
+def random_fit(item_def, placed, rng: random.Random):
+    """A random rotation and position of item_def that fits next to placed, keyed by body anchor."""
+    for _ in range(40):
+        placement = Placement(item_def, rng.randrange(4))
+        gx, gy = rng.randint(-3, COLS), rng.randint(-3, ROWS)
+        if placement_fits(placement, gx, gy, placed, COLS, ROWS):
+            placement = placement.at(gx, gy)
+            offset_c, offset_r = placement.get_body_offset()
+            return (gx + offset_c, gy + offset_r), placement
+    return None
+
+
+@pytest.mark.parametrize('explain', [True, False])
+@pytest.mark.parametrize('seed', range(20))
+def test_session_matches_full_run(item_defs, item_names, seed, explain):
+    rng = random.Random(seed)
+    engine = CalculationEngine()
+    session = engine.start_session({}, COLS, ROWS, explain=explain)
+    for _ in range(60):
+        placed = session.placed_items()
+        op = rng.choice(('add', 'add', 'remove', 'move', 'swap')) if placed else 'add'
+        if op == 'add':
+            picked = random_fit(item_defs[rng.choice(item_names)], placed, rng)
+            if picked is None: continue
+            session.add(*picked)
+        elif op == 'remove':
+            session.remove(rng.choice(list(placed)))
+        elif op == 'move':
+            key = rng.choice(list(placed))
+            rest = {k: v for k, v in placed.items() if k != key}
+            picked = random_fit(placed[key].item_def, rest, rng)
+            if picked is None: continue
+            session.move(key, *picked)
+        else:
+            # 两个物品互换位置：一次 apply 完成
+            if len(placed) < 2: continue
+            key_a, key_b = rng.sample(list(placed), 2)
+            rest = {k: v for k, v in placed.items() if k not in (key_a, key_b)}
+            a, b = placed[key_a].at(placed[key_b].gx, placed[key_b].gy), placed[key_b].at(placed[key_a].gx, placed[key_a].gy)
+            if not (placement_fits(a, a.gx, a.gy, rest, COLS, ROWS) and placement_fits(b, b.gx, b.gy, rest, COLS, ROWS)): continue
+            if a.get_masks(COLS, ROWS).at(a.gx, a.gy).body & b.get_masks(COLS, ROWS).at(b.gx, b.gy).body: continue
+            offset_a, offset_b = a.get_body_offset(), b.get_body_offset()
+            session.apply((key_a, key_b), {(a.gx + offset_a[0], a.gy + offset_a[1]): a,
+                                           (b.gx + offset_b[0], b.gy + offset_b[1]): b})
+        full = engine.run(session.placed_items(), COLS, ROWS, explain=explain)
+        assert_same_result(session.result, full)
+
+
+def test_session_starts_from_layout(item_defs, item_names):
+    rng = random.Random(99)
+    placed = {}
+    for name in rng.sample(item_names, 10):
+        picked = random_fit(item_defs[name], placed, rng)
+        if picked: placed[picked[0]] = picked[1]
+    engine = CalculationEngine()
+    session = engine.start_session(placed, COLS, ROWS)
+    assert_same_result(session.result, engine.run(placed, COLS, ROWS))
+    assert session.placed_items() == placed
@@ -1,15 +1,22 @@
+import argparse
 import json
+import os
+from functools import partial
+from typing import List, Optional
+
 import torch
 import torch.nn as nn
 from gymnasium import spaces
 from stable_baselines3.common.torch_layers import BaseFeaturesExtractor
 from sb3_contrib import MaskablePPO
 from sb3_contrib.common.wrappers import ActionMasker
+from stable_baselines3.common.env_util import make_vec_env
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
 # --- FIX: Import the correct, maskable CnnPolicy ---
 from sb3_contrib.ppo_mask.policies import CnnPolicy
 
 from BackpackEnv import BackpackEnv
-from engine import Item
+from engine import ItemDef, Placement
 from definitions import Rarity, ItemClass, Element, ItemType, GridType
 
 class CustomCNN(BaseFeaturesExtractor):
@@ -37,29 +44,49 @@ BACKPACK_ROWS = 7
 TRAINING_TIMESTEPS = 1_000_000
 MODEL_SAVE_PATH = "ppo_maskable_backpack_solver"
 
-def load_all_items_from_json(filepath: str) -> list[Item]:
+def load_all_items_from_json(filepath: str) -> list[Placement]:
     items = []
     with open(filepath, 'r') as f:
         data = json.load(f)
     for item_data in data.values():
-        item = Item(
-            x=0, y=0, name=item_data['name'], rarity=Rarity[item_data['rarity']],
+        item_def = ItemDef(
+            name=item_data['name'], rarity=Rarity[item_data['rarity']],
             item_class=ItemClass[item_data['item_class']],
             elements=[Element[e] for e in item_data.get('elements', [])],
             types=[ItemType[t] for t in item_data.get('types', [])],
             shape_matrix=[[GridType(c) for c in r] for r in item_data['shape_matrix']],
             base_score=item_data.get('base_score', 0), star_effects=item_data.get('star_effects', {}),
             has_cooldown=item_data.get('has_cooldown', False), is_start_of_battle=item_data.get('is_start_of_battle', False),
-            passive_effects=item_data.get('passive_effects', []), visuals=False
+            passive_effects=item_data.get('passive_effects', [])
         )
-        items.append(item)
+        items.append(Placement(item_def))
     return items
 
-if __name__ == '__main__':
-    items_to_learn_with = load_all_items_from_json('items.json')
-    env = BackpackEnv(items=items_to_learn_with, backpack_cols=BACKPACK_COLS, backpack_rows=BACKPACK_ROWS)
-    env = ActionMasker(env, lambda env: env.action_masks())
-    print("Maskable environment created successfully.")
+def mask_fn(env: BackpackEnv):
+    return env.action_masks()
+
+
+def make_env(items: List[Placement]) -> BackpackEnv:
+    return BackpackEnv(items=items, backpack_cols=BACKPACK_COLS, backpack_rows=BACKPACK_ROWS)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Train the MaskablePPO backpack policy.")
+    parser.add_argument('--items-file', default='items.json')
+    parser.add_argument('--envs', type=int, default=os.cpu_count() or 1,
+                        help="Parallel environments; more than 1 steps them in subprocesses (default: one per core)")
+    parser.add_argument('--timesteps', type=int, default=TRAINING_TIMESTEPS)
+    parser.add_argument('--save-path', default=MODEL_SAVE_PATH, help="Model path without the .zip extension")
+    parser.add_argument('--device', default='auto', help="cpu, cuda or auto (GPU when available)")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    items_to_learn_with = load_all_items_from_json(args.items_file)
+    # 每个子进程一个带动作掩码的环境；MaskablePPO 通过 env_method("action_masks") 取掩码
+    env = make_vec_env(partial(make_env, items_to_learn_with), n_envs=args.envs, seed=args.seed,
+                       wrapper_class=ActionMasker, wrapper_kwargs=dict(action_mask_fn=mask_fn),
+                       vec_env_cls=SubprocVecEnv if args.envs > 1 else DummyVecEnv)
+    print(f"{args.envs} maskable environment(s) created successfully.")
 
     policy_kwargs = dict(
         features_extractor_class=CustomCNN,
@@ -72,13 +99,20 @@ if __name__ == '__main__':
         env,
         policy_kwargs=policy_kwargs,
         verbose=1,
-        device="cuda",
+        device=args.device,
+        seed=args.seed,
         tensorboard_log="./ppo_maskable_backpack_tensorboard/"
     )
 
-    print(f"Starting training on {torch.cuda.get_device_name(0)} with MaskablePPO policy...")
+    device_name = torch.cuda.get_device_name(model.device) if model.device.type == "cuda" else "CPU"
+    print(f"Starting training on {device_name} with MaskablePPO policy...")
     
-    model.learn(total_timesteps=TRAINING_TIMESTEPS, progress_bar=True)
+    model.learn(total_timesteps=args.timesteps, progress_bar=True)
+
+    model.save(args.save_path)
+    env.close()
+    print(f"Training complete! Model saved to '{args.save_path}.zip'")
 
-    model.save(MODEL_SAVE_PATH)
-    print(f"Training complete! Model saved to '{MODEL_SAVE_PATH}.zip'")
\ No newline at end of file
+
+if __name__ == '__main__':
+    main()